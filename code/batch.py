@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+import time
+from normalizer import normalize_text, combine_contents
+from hashing import get_hash_cache
+from liwc import tokenize
+from metrics import get_run_metrics
+from timestamps import get_ts_formatter
+from userids import map_user_ids
+
+
+
+# Number of messages processed at a time when messages are streamed
+BATCH_SIZE = 1000
+# Markers of tokens that are kept as they are instead of being hashed
+HASH_MARKERS = ('LINK', 'EMOJI', 'NUM', 'SENT_END', 'USERID')
+# Block types whose elements are text elements
+SECTION_TYPES = frozenset(['rich_text_section', 'rich_text_preformatted', 'rich_text', 'rich_text_quote'])
+
+
+
+def remove_keys_batch(msgs, list_rem_gen, list_rem_thread, channel_name = None, print_cond = False, user_ids = None):
+  """
+  remove_keys_batch adds the channel name to every message JSON of a batch and removes unnecessary keys (without the time stamp
+  conversion, see convert_ts_msgs), replacing user IDs with hashed IDs if a mapping is given
+
+  :param msgs: list of message JSONs
+  :param list_rem_gen: list of general keys to be removed
+  :param list_rem_thread: list of keys to be removed that relate to threading or responses
+  :param channel_name: name of the Slack channel the messages belong to (None to leave messages without it)
+  :param print_cond: True or False to select whether missing keys should be printed
+  :param user_ids: dictionary of user ID -> hashed ID (None keeps user IDs)
+  :return: list of new message JSONs
+  """
+
+  rem_gen = frozenset(list_rem_gen)
+  rem_all = rem_gen | frozenset(list_rem_thread)
+  out = []
+  for msg_json in msgs:
+    rem = rem_all if 'reply_count' in msg_json else rem_gen
+    if print_cond:
+      msg_id = str(msg_json.get('client_msg_id', 'NO CLIENT MESSAGE ID AVAILABLE'))
+      for key in list_rem_gen:
+        if key not in msg_json:
+          print(str(key) + ' is not present in ' + msg_id + ' message')
+      if rem is rem_all:
+        print(msg_id + ' message contains responses (thread)')
+        for key in list_rem_thread:
+          # Keys that are in both lists are already gone when thread keys are removed
+          if key not in msg_json or key in rem_gen:
+            print(str(key) + ' is not present in ' + msg_id + ' message')
+    new_json = {key: val for key, val in msg_json.items() if key not in rem}
+    # The channel is added before keys are removed, so it stays in place if the message has the key and goes last otherwise
+    if channel_name is not None and 'channel' not in rem:
+      new_json['channel'] = channel_name
+    if user_ids is not None:
+      map_user_ids(new_json, user_ids)
+    out.append(new_json)
+  return out
+
+
+
+def convert_ts_msgs(msgs, keep_epoch = False):
+  """
+  convert_ts_msgs converts the time stamps of every message and reply of a batch from unix to date-time
+
+  :param msgs: list of message JSONs (modified in place)
+  :param keep_epoch: also keep the unix time stamps as numbers ("ts_epoch")
+  """
+
+  fmt = get_ts_formatter().format
+  for msg_json in msgs:
+    if keep_epoch:
+      msg_json['ts_epoch'] = float(msg_json['ts'])
+    msg_json['ts'] = fmt(msg_json['ts'])
+    for resp in msg_json.get('replies', ()):
+      if keep_epoch:
+        resp['ts_epoch'] = float(resp['ts'])
+      resp['ts'] = fmt(resp['ts'])
+
+
+
+def flatten_blocks(msg_json):
+  """
+  flatten_blocks returns all nested elements under the "blocks" key of the message JSON
+
+  :param msg_json: JSON contents of the message
+  :return: list of elements
+  """
+
+  elements_list = []
+  for blk in msg_json['blocks'][0]['elements']:
+    if blk['type'] in SECTION_TYPES:
+      elements_list.extend(blk['elements'])
+    elif blk['type'] == 'rich_text_list':
+      for sub_blk in blk['elements']:
+        elements_list.extend(sub_blk['elements'])
+    else:
+      print(blk['type'] + ' is not recognized and elements cannot be extracted')
+  return elements_list
+
+
+
+def element_content(elm, clean, user_ids = None):
+  """
+  element_content returns the content of a block element: cleaned text, links, emojis, user mentions and broadcasts
+
+  :param elm: element of the flattened blocks
+  :param clean: function that cleans text (normalize_text, possibly cached)
+  :param user_ids: dictionary of user ID -> hashed ID that mentions are replaced with (None keeps user IDs)
+  :return: string
+  """
+
+  elm_type = elm['type']
+  if elm_type == 'text':
+    return clean(elm['text'])
+  if elm_type == 'link':
+    if 'text' in elm:
+      link_text = elm['text']
+      if ('www' not in link_text) and ('.com' not in link_text):
+        return clean(link_text) + ' (LINK)'
+    return 'LINK'
+  if elm_type == 'emoji':
+    return elm['name'] + 'EMOJI'
+  if elm_type == 'user':
+    if user_ids is not None:
+      return '@' + user_ids.get(elm['user_id'], elm['user_id']) + 'USERID'
+    return '@' + elm['user_id'] + 'USERID'
+  if elm_type == 'broadcast':
+    return '@' + elm['range'] + 'USERID'
+  return ''
+
+
+
+def process_batch(msgs, channel_name, list_rem_gen, list_rem_thread, list_rem_blk, seed_val, liwc_engine,
+                  hash_dict = None, literals = None, print_cond = False, keep_epoch = False, user_ids = None, threads = None):
+  """
+  process_batch processes a batch of raw message JSONs stage by stage, giving the same messages as mod_msg_jsons_in_list
+
+  Keys are removed with precomputed sets, time stamps are formatted by the cached formatter of the process, and cleaning, hashing and LIWC
+  lookups are done once per unique text and token of the batch.
+
+  :param msgs: list or iterable of raw message JSONs
+  :param channel_name: name of the Slack channel the messages belong to
+  :param list_rem_gen: list of general keys to be removed from each message JSON
+  :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
+  :param list_rem_blk: list of keys under "blocks" to be removed
+  :param seed_val: parameter added to every token before hashing
+  :param liwc_engine: LiwcEngine used to score messages
+  :param hash_dict: dictionary of tokens and hashes that new tokens are added to (None starts a new one)
+  :param literals: set that tokens kept as they are (links, numbers, user IDs, emojis) are added to (None to skip)
+  :param print_cond: True or False to select whether errors or warnings should be printed
+  :param keep_epoch: also keep the unix time stamps as numbers ("ts_epoch")
+  :param user_ids: dictionary of user ID -> hashed ID that user fields and mentions are replaced with (None keeps user IDs)
+  :param threads: DayThreads that the thread messages of the batch are added to, before threading keys are removed (None to skip)
+  :return: list of processed messages, list of unprocessed messages (without "client_msg_id") and the hash dictionary
+  """
+
+  if hash_dict is None:
+    hash_dict = {}
+  run_metrics = get_run_metrics()
+  clock = time.perf_counter
+
+  # Removing keys and adding the channel name
+  start = clock()
+  msgs_selected = []
+  msgs_not_selected = []
+  for msg_json in msgs:
+    (msgs_selected if 'client_msg_id' in msg_json else msgs_not_selected).append(msg_json)
+  if threads is not None:
+    threads.add(msgs_selected)
+  msgs_selected = remove_keys_batch(msgs_selected, list_rem_gen, list_rem_thread, channel_name, print_cond, user_ids)
+  convert_ts_msgs(msgs_selected, keep_epoch)
+  with_blocks = [msg_json for msg_json in msgs_selected if 'blocks' in msg_json]
+  rem_blk = frozenset(list_rem_blk)
+  for msg_json in with_blocks:
+    if msg_json['blocks']:
+      if print_cond:
+        for key in list_rem_blk:
+          if key not in msg_json['blocks'][0]:
+            print(str(key) + ' is not present in ' + str(msg_json['client_msg_id']) + ' message')
+      msg_json['blocks'][0] = {key: val for key, val in msg_json['blocks'][0].items() if key not in rem_blk}
+  t_rem = clock()
+
+  # Flattening blocks
+  elements = [flatten_blocks(msg_json) for msg_json in with_blocks]
+  t_flatten = clock()
+
+  # Cleaning every distinct text of the batch once
+  cleaned = {}
+  def clean(text):
+    out = cleaned.get(text)
+    if out is None:
+      out = cleaned[text] = normalize_text(text)
+    return out
+  contents = [combine_contents([element_content(elm, clean, user_ids) for elm in msg_elements]) for msg_elements in elements]
+  t_clean = clock()
+
+  # Hashing every distinct token of the batch once (in order of first occurrence, so the hash dictionary keeps its order)
+  words = [content.split() for content in contents]
+  hash_cache = get_hash_cache(seed_val)
+  repls = {}
+  for word in dict.fromkeys(word for msg_words in words for word in msg_words):
+    if any(marker in word for marker in HASH_MARKERS):
+      repl = repls[word] = word.replace('USERID', '').replace('EMOJI', '')
+      if literals is not None:
+        literals.add(repl)
+    else:
+      repl = repls[word] = hash_cache.get(word)
+      if word not in hash_dict:
+        hash_dict[word] = repl
+  for msg_json, msg_words in zip(with_blocks, words):
+    del msg_json['blocks']
+    msg_json['hashed content'] = ' '.join([repls[word] for word in msg_words]).strip()
+  t_hash = clock()
+
+  # Scoring all messages at once, looking up every distinct token once
+  tokens = [tokenize(content.replace('USERID', '').replace('EMOJI', '')) for content in contents]
+  counts = liwc_engine.score_batch(tokens)
+  for msg_json, row in zip(with_blocks, counts):
+    msg_json['LIWC dict'] = liwc_engine.counts_to_dict(row)
+  t_liwc = clock()
+
+  if run_metrics is not None:
+    num_chars = sum(len(content) for content in contents)
+    run_metrics.add(channel_name, 'rem_items', t_rem - start, len(msgs_selected))
+    run_metrics.add(channel_name, 'flatten_blocks', t_flatten - t_rem, len(with_blocks))
+    run_metrics.add(channel_name, 'clean_text', t_clean - t_flatten, len(with_blocks), num_chars)
+    run_metrics.add(channel_name, 'hash_all_text', t_hash - t_clean, len(with_blocks), num_chars)
+    run_metrics.add(channel_name, 'body_to_liwc', t_liwc - t_hash, len(with_blocks), num_chars)
+  return msgs_selected, msgs_not_selected, hash_dict
+
+
+
+def iter_process_batches(msgs_iter, channel_name, list_rem_gen, list_rem_thread, list_rem_blk, seed_val, liwc_engine,
+                         hash_dict, msgs_not_selected, literals = None, print_cond = False, batch_size = BATCH_SIZE, keep_epoch = False,
+                         user_ids = None, threads = None):
+  """
+  iter_process_batches processes streamed message JSONs in batches of batch_size and yields the processed messages one at a time
+
+  :param msgs_iter: iterator of raw message JSONs
+  :param channel_name: name of the Slack channel the messages belong to
+  :param list_rem_gen: list of general keys to be removed from each message JSON
+  :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
+  :param list_rem_blk: list of keys under "blocks" to be removed
+  :param seed_val: parameter added to every token before hashing
+  :param liwc_engine: LiwcEngine used to score messages
+  :param hash_dict: dictionary of tokens and hashes that new tokens are added to
+  :param msgs_not_selected: list or sink (e.g. JsonLinesSink) that unprocessed messages are appended to
+  :param literals: set that tokens kept as they are are added to (None to skip)
+  :param print_cond: True or False to select whether errors or warnings should be printed
+  :param batch_size: number of messages processed at a time
+  :param keep_epoch: also keep the unix time stamps as numbers ("ts_epoch")
+  :param user_ids: dictionary of user ID -> hashed ID (None keeps user IDs)
+  :param threads: DayThreads that thread messages are added to (None to skip)
+  :return: generator of processed messages
+  """
+
+  batch = []
+  for msg_json in msgs_iter:
+    batch.append(msg_json)
+    if len(batch) == batch_size:
+      msgs_selected, batch_not_selected, _ = process_batch(batch, channel_name, list_rem_gen, list_rem_thread, list_rem_blk, seed_val,
+                                                           liwc_engine, hash_dict, literals, print_cond, keep_epoch, user_ids, threads)
+      for msg_json in batch_not_selected:
+        msgs_not_selected.append(msg_json)
+      yield from msgs_selected
+      batch = []
+  if batch:
+    msgs_selected, batch_not_selected, _ = process_batch(batch, channel_name, list_rem_gen, list_rem_thread, list_rem_blk, seed_val,
+                                                         liwc_engine, hash_dict, literals, print_cond, keep_epoch, user_ids, threads)
+    for msg_json in batch_not_selected:
+      msgs_not_selected.append(msg_json)
+    yield from msgs_selected
@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import random
+import hashlib
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import time
+import multiprocessing
+from datetime import datetime, timedelta
+import hashing
+import utils
+from utils import read_liwc_dictionary, process_workspace, init_worker
+from batch import process_batch, element_content
+from normalizer import normalize_text, combine_contents
+from liwc import LIWC_TABLES_FN
+from jsonio import read_day_file, write_day_file
+from metrics import STAGES, METRICS_FN, RunMetrics, enable_run_metrics, disable_run_metrics
+from timestamps import get_ts_formatter
+from pipeline import DEFAULT_PIPELINE_DEPTH
+from serializer import JsonBackend, available_backends
+
+
+
+# Words used to build synthetic message text (contractions, numbers and punctuation exercise every cleaning rule)
+BENCH_WORDS = ['hi', 'hello', 'thanks', 'for', 'creating', 'the', 'channel', "it's", "i'm", "can't", 'we', 'should', 'meet',
+               'on', 'the', '3rd', 'at', '10:30', 'e.g.', 'vs', 'café', 'great!', 'why?', 'ok.', 'looking', 'forward', 'to', 'it']
+# Small LIWC dictionary over BENCH_WORDS (full words and wildcard terms) used when no dictionary is given
+BENCH_LIWC = [['Pronoun', 'Social', 'Posemo', 'Time', 'Work'],
+              ['we', 'hi', 'thank.*', 'forward', 'channel'],
+              ["i'm", 'hello', 'great', 'meet', 'creat.*'],
+              ['it', 'meet', 'happ.*', '3rd', 'look.*']]
+# Keys removed from every message JSON, as in run.py
+LIST_REM_GEN = ['text', 'reactions', 'type', 'user_team', 'source_team', 'user_profile', 'attachments', 'files', 'upload', 'display_as_bot', 'edited', 'thread_ts']
+LIST_REM_THREAD = ['reply_count', 'reply_users_count', 'latest_reply','is_locked', 'subscribed', 'last_read', 'thread_ts', 'reply_users']
+LIST_REM_BLK = ['type', 'block_id']
+
+
+
+def make_text_blocks(num_msgs, words_per_msg, rand_seed = 0):
+  """
+  make_text_blocks builds synthetic message JSONs whose "blocks" key is already flattened, as returned by flatten_blocks
+
+  :param num_msgs: number of messages to generate
+  :param words_per_msg: number of words in every text element
+  :param rand_seed: seed of the random generator so runs are comparable
+  :return: list of message JSONs
+  """
+
+  rng = random.Random(rand_seed)
+  msgs = []
+  for _ in range(num_msgs):
+    blocks = []
+    for _ in range(rng.randint(1, 4)):
+      blocks.append({'type': 'text', 'text': ' '.join(rng.choice(BENCH_WORDS) for _ in range(words_per_msg))})
+      blocks.append(rng.choice([{'type': 'emoji', 'name': 'blush'}, {'type': 'user', 'user_id': 'U02MZ6P1EF9'}, {'type': 'link'}]))
+    msgs.append({'blocks': blocks})
+  return msgs
+
+
+
+def make_message(rng, ts, words_per_msg, reply_rate, num_users = 20):
+  """
+  make_message builds a synthetic message JSON shaped like a Slack export (rich text sections and lists, links, emojis, user mentions and threads)
+
+  :param rng: random generator
+  :param ts: unix time stamp of the message
+  :param words_per_msg: average number of words in the message
+  :param reply_rate: fraction of messages that start a thread
+  :param num_users: number of users in the workspace
+  :return: message JSON
+  """
+
+  def user_id():
+    return 'U{:08d}'.format(rng.randrange(num_users))
+
+  def text(num_words):
+    return ' '.join(rng.choice(BENCH_WORDS) for _ in range(max(num_words, 1)))
+
+  def section():
+    elements = [{'type': 'text', 'text': text(words_per_msg // 2)}]
+    for _ in range(rng.randint(0, 2)):
+      elements.append(rng.choice([{'type': 'emoji', 'name': rng.choice(['blush', 'tada', 'thumbsup'])},
+                                  {'type': 'user', 'user_id': user_id()},
+                                  {'type': 'link', 'url': 'https://example.com/' + str(rng.randrange(1000)), 'text': 'docs'}]))
+      elements.append({'type': 'text', 'text': ' ' + text(words_per_msg // 4), 'style': {'bold': rng.random() < 0.2}})
+    return {'type': 'rich_text_section', 'elements': elements}
+
+  blk_elements = [section()]
+  if rng.random() < 0.3:
+    blk_elements.append({'type': 'rich_text_list', 'style': 'bullet', 'indent': 0, 'elements': [section() for _ in range(rng.randint(2, 4))]})
+  if rng.random() < 0.1:
+    blk_elements.append({'type': rng.choice(['rich_text_quote', 'rich_text_preformatted']), 'elements': [{'type': 'text', 'text': text(words_per_msg // 2)}]})
+
+  user = user_id()
+  msg_json = {'client_msg_id': '{:08x}-{:04x}'.format(rng.getrandbits(32), rng.getrandbits(16)), 'type': 'message', 'text': text(words_per_msg),
+              'user': user, 'ts': '{}.{:06d}'.format(ts, rng.randrange(1000000)), 'team': 'T00000001', 'user_team': 'T00000001',
+              'source_team': 'T00000001', 'user_profile': {'avatar_hash': 'g0', 'real_name': 'User ' + user, 'is_restricted': False},
+              'blocks': [{'type': 'rich_text', 'block_id': '{:05x}'.format(rng.getrandbits(20)), 'elements': blk_elements}]}
+  if rng.random() < 0.1:
+    msg_json['reactions'] = [{'name': 'tada', 'users': [user_id()], 'count': 1}]
+  if rng.random() < reply_rate:
+    num_replies = rng.randint(1, 5)
+    replies = [{'user': user_id(), 'ts': '{}.{:06d}'.format(ts + 60 * (i + 1), rng.randrange(1000000))} for i in range(num_replies)]
+    msg_json.update({'thread_ts': msg_json['ts'], 'reply_count': num_replies, 'reply_users_count': len(set(r['user'] for r in replies)),
+                     'latest_reply': replies[-1]['ts'], 'reply_users': sorted(set(r['user'] for r in replies)), 'replies': replies,
+                     'is_locked': False, 'subscribed': False})
+  return msg_json
+
+
+
+def make_export(export_dir, num_channels = 4, num_days = 10, msgs_per_day = 200, words_per_msg = 30, reply_rate = 0.2, rand_seed = 0):
+  """
+  make_export writes a synthetic Slack workspace export (one folder per channel, one JSON file per day) and a small LIWC dictionary
+
+  About 5% of the messages are channel joins without "client_msg_id", so they end up with the unprocessed messages.
+
+  :param export_dir: directory of the export (replaced if it exists)
+  :param num_channels: number of channels
+  :param num_days: number of day files per channel
+  :param msgs_per_day: average number of messages per day file (day file sizes vary so scheduling is exercised)
+  :param words_per_msg: average number of words per message
+  :param reply_rate: fraction of messages that start a thread
+  :param rand_seed: seed of the random generator so exports are comparable
+  :return: path of the LIWC dictionary
+  """
+
+  rng = random.Random(rand_seed)
+  if os.path.exists(export_dir):
+    shutil.rmtree(export_dir)
+  os.makedirs(export_dir)
+  start_day = datetime(2021, 11, 1)
+  for channel_num in range(num_channels):
+    channel_path = os.path.join(export_dir, 'channel-{:03d}'.format(channel_num))
+    os.mkdir(channel_path)
+    for day_num in range(num_days):
+      day = start_day + timedelta(days = day_num)
+      ts_start = int((day - datetime(1970, 1, 1)).total_seconds())
+      msgs = []
+      for msg_num in range(rng.randint(msgs_per_day // 2, msgs_per_day * 3 // 2)):
+        ts = ts_start + msg_num * 30
+        if rng.random() < 0.05:
+          msgs.append({'type': 'message', 'subtype': 'channel_join', 'ts': '{}.000200'.format(ts), 'user': 'U00000000',
+                       'text': '<@U00000000> has joined the channel'})
+        else:
+          msgs.append(make_message(rng, ts, words_per_msg, reply_rate))
+      with open(os.path.join(channel_path, day.strftime('%Y-%m-%d') + '.json'), 'w', encoding = 'utf-8') as f:
+        json.dump(msgs, f, ensure_ascii = False, indent = 4)
+
+  liwc_fn = os.path.join(export_dir, 'liwc2007dictionary_poster.csv')
+  with open(liwc_fn, 'w', encoding = 'utf-8') as f:
+    for row in BENCH_LIWC:
+      f.write(','.join(row) + '\n')
+  return liwc_fn
+
+
+
+def time_day_file(unit):
+  """
+  time_day_file processes one day file with process_batch, like a worker process of process_workspace, and returns the time spent in
+  every stage (process_batch runs every stage over all messages of the day file before the next one)
+
+  :param unit: tuple of (channel path, day file name, output directory, seed value)
+  :return: run metrics of the day file (RunMetrics.take) and number of messages processed
+  """
+
+  channel_path, day, output_dir, seed_val = unit
+  channel_name = os.path.basename(channel_path)
+  run_metrics = enable_run_metrics()
+  get_ts_formatter().set_day(day)
+
+  start = time.perf_counter()
+  msgs = read_day_file(os.path.join(channel_path, day))
+  run_metrics.add(channel_name, 'json_read', time.perf_counter() - start)
+  msgs_selected, _, _ = process_batch(msgs, channel_name, LIST_REM_GEN, LIST_REM_THREAD, LIST_REM_BLK, seed_val, utils.liwc_engine,
+                                      literals = utils.literal_tokens)
+
+  start = time.perf_counter()
+  write_day_file(os.path.join(output_dir, channel_name + '-' + day), msgs_selected)
+  run_metrics.add(channel_name, 'json_write', time.perf_counter() - start)
+  return run_metrics.take(), len(msgs_selected)
+
+
+
+def bench_stages(export_dir, liwc_fn, parallel, num_workers = None, seed_val = 'bench'):
+  """
+  bench_stages times every stage of the pipeline over all day files of an export, sequentially or in a pool of worker processes
+
+  In parallel mode, workers attach to the LIWC tables written by the parent (init_worker, as in process_workspace), and stage times are
+  summed over the workers (CPU time spent per stage) while wall_sec is the elapsed time.
+
+  :param export_dir: directory of the export
+  :param liwc_fn: path of the LIWC dictionary
+  :param parallel: whether day files are processed in a pool of worker processes
+  :param num_workers: number of worker processes (None uses the number of CPUs)
+  :param seed_val: parameter added to every token before hashing
+  :return: dictionary of results
+  """
+
+  # Every mode starts with empty token hash and LIWC word caches
+  hashing._token_hash_cache = None
+  read_liwc_dictionary(liwc_fn)
+  output_dir = tempfile.mkdtemp(prefix = 'slack_bench_')
+  units = [(os.path.join(export_dir, channel_name), day, output_dir, seed_val)
+           for channel_name in sorted(os.listdir(export_dir)) if os.path.isdir(os.path.join(export_dir, channel_name))
+           for day in sorted(os.listdir(os.path.join(export_dir, channel_name)))]
+
+  start = time.perf_counter()
+  if parallel:
+    liwc_tables_path = os.path.join(output_dir, LIWC_TABLES_FN)
+    utils.liwc_engine.save_tables(liwc_tables_path)
+    with multiprocessing.Pool(processes = num_workers or multiprocessing.cpu_count(), initializer = init_worker,
+                              initargs = (liwc_tables_path, None, seed_val)) as pool:
+      unit_results = list(pool.imap_unordered(time_day_file, units))
+  else:
+    unit_results = [time_day_file(unit) for unit in units]
+    disable_run_metrics()
+  wall_time = time.perf_counter() - start
+  shutil.rmtree(output_dir)
+
+  run_metrics = RunMetrics()
+  for unit_metrics, _ in unit_results:
+    run_metrics.merge(unit_metrics)
+  stages = run_metrics.summary()['stages']
+  num_msgs = sum(unit_msgs for _, unit_msgs in unit_results)
+  stage_times = {stage: round(stages[stage]['seconds'], 4) if stage in stages else 0.0 for stage in STAGES}
+  results = {'wall_sec': round(wall_time, 4), 'msgs': num_msgs, 'msgs_per_sec': round(num_msgs / wall_time, 1), 'stages_sec': stage_times}
+  print('Stages ({}): {} messages in {:.2f} s ({:.0f} messages/sec)'.format('parallel' if parallel else 'sequential', num_msgs, wall_time, num_msgs / wall_time))
+  for stage in STAGES:
+    print('  {:<15} {:8.3f} s'.format(stage, stage_times[stage]))
+  return results
+
+
+
+def bench_workspace(export_dir, liwc_fn, parallel, num_workers = None, seed_val = 'bench', **kwargs):
+  """
+  bench_workspace times process_workspace end to end on an export (output is written to slack_output next to the export)
+
+  :param export_dir: directory of the export
+  :param liwc_fn: path of the LIWC dictionary
+  :param parallel: whether day files are processed in a pool of worker processes
+  :param num_workers: number of worker processes (None uses the number of CPUs)
+  :param seed_val: parameter added to every token before hashing
+  :param kwargs: other arguments of process_workspace (e.g. output_format)
+  :return: dictionary of results (with the time spent reading and writing day files and waiting for them when metrics are collected)
+  """
+
+  hashing._token_hash_cache = None
+  utils._reported_literals.clear()
+  cwd = os.getcwd()
+  # process_workspace expects to run from the directory of the export
+  os.chdir(export_dir)
+  try:
+    start = time.perf_counter()
+    process_workspace(path_liwc_dict = os.path.abspath(liwc_fn), channels_dir = os.path.abspath(export_dir), list_rem_gen = LIST_REM_GEN,
+                      list_rem_thread = LIST_REM_THREAD, list_rem_blk = LIST_REM_BLK, print_cond = False, seed_val = seed_val,
+                      parallel = parallel, num_workers = num_workers, **kwargs)
+    wall_time = time.perf_counter() - start
+  finally:
+    os.chdir(cwd)
+  results = {'wall_sec': round(wall_time, 4)}
+
+  if kwargs.get('collect_metrics'):
+    with open(os.path.join(os.path.dirname(os.path.abspath(export_dir)), 'slack_output', METRICS_FN), 'r', encoding = 'utf-8') as f:
+      stages = json.load(f)['stages']
+    def seconds(stage):
+      return stages[stage]['seconds'] if stage in stages else 0.0
+    # Without pipelining the processing waits for every read and write, with pipelining only for read_wait and write_wait
+    results['io_sec'] = round(seconds('json_read') + seconds('json_write'), 4)
+    results['io_wait_sec'] = round(seconds('read_wait') + seconds('write_wait'), 4) if 'read_wait' in stages else results['io_sec']
+  return results
+
+
+
+def bench_pipeline(export_dir, liwc_fn, parallel, num_workers = None, pipeline_depth = DEFAULT_PIPELINE_DEPTH, chunk_size = 4):
+  """
+  bench_pipeline runs process_workspace with and without pipelined I/O to measure how much reading and writing overlaps processing
+
+  :param export_dir: directory of the export
+  :param liwc_fn: path of the LIWC dictionary
+  :param parallel: whether day files are processed in a pool of worker processes
+  :param num_workers: number of worker processes (None uses the number of CPUs)
+  :param pipeline_depth: number of day files read ahead and waiting to be written
+  :param chunk_size: number of day files sent to a worker process at a time in parallel mode (pipelined within every chunk)
+  :return: dictionary of results
+  """
+
+  results = {}
+  for name, depth in [('off', 0), ('on', pipeline_depth)]:
+    results[name] = bench_workspace(export_dir, liwc_fn, parallel, num_workers, chunk_size = chunk_size, collect_metrics = True,
+                                    pipeline_depth = depth)
+  results['pipeline_depth'] = pipeline_depth
+  results['speedup'] = round(results['off']['wall_sec'] / max(results['on']['wall_sec'], 1e-9), 3)
+  print('Pipeline ({}): {:.2f} s without, {:.2f} s with (I/O {:.2f} s, waited {:.2f} s)'.format(
+        'parallel' if parallel else 'sequential', results['off']['wall_sec'], results['on']['wall_sec'], results['on']['io_sec'],
+        results['on']['io_wait_sec']))
+  return results
+
+
+
+def output_digest(output_dir):
+  """
+  output_digest returns the md5 hash of every output file of a run (except metrics and profiles, which hold times)
+
+  :param output_dir: directory of the output of data
+  :return: dictionary of relative path -> md5 hex digest
+  """
+
+  digests = {}
+  for root, dirs, files in os.walk(output_dir):
+    dirs[:] = [name for name in dirs if name != 'profiles']
+    for fn in files:
+      if fn != METRICS_FN:
+        with open(os.path.join(root, fn), 'rb') as f:
+          digests[os.path.relpath(os.path.join(root, fn), output_dir)] = hashlib.md5(f.read()).hexdigest()
+  return digests
+
+
+
+def bench_start_methods(export_dir, liwc_fn, num_workers = None):
+  """
+  bench_start_methods runs process_workspace in parallel mode with worker processes started by fork and by spawn, and checks that both
+  give the same output (spawned workers only have what the pool initializer gives them, e.g. the shared LIWC tables)
+
+  :param export_dir: directory of the export
+  :param liwc_fn: path of the LIWC dictionary
+  :param num_workers: number of worker processes (None uses the number of CPUs)
+  :return: dictionary of results
+  """
+
+  output_dir = os.path.join(os.path.dirname(os.path.abspath(export_dir)), 'slack_output')
+  results = {}
+  digests = []
+  for start_method in [method for method in ['fork', 'spawn'] if method in multiprocessing.get_all_start_methods()]:
+    results[start_method] = bench_workspace(export_dir, liwc_fn, True, num_workers, start_method = start_method)
+    digests.append(output_digest(output_dir))
+  results['same_output'] = all(digest == digests[0] for digest in digests)
+  print('Start methods: {} ({})'.format(', '.join('{} {:.2f} s'.format(method, results[method]['wall_sec']) for method in results
+                                                  if method != 'same_output'), 'same output' if results['same_output'] else 'OUTPUT DIFFERS'))
+  return results
+
+
+
+def bench_json(export_dir, repeat = 3):
+  """
+  bench_json measures parsing and serialization throughput of every installed JSON backend on the day files of an export, and checks
+  that every backend gives back the same messages (parsing the files and the compact and pretty-printed output of every backend)
+
+  :param export_dir: directory of the export
+  :param repeat: number of times every day file is parsed and serialized
+  :return: dictionary of backend name -> dictionary of results
+  """
+
+  paths = [os.path.join(export_dir, channel_name, day)
+           for channel_name in sorted(os.listdir(export_dir)) if os.path.isdir(os.path.join(export_dir, channel_name))
+           for day in sorted(os.listdir(os.path.join(export_dir, channel_name)))]
+  contents = []
+  for path in paths:
+    with open(path, 'rb') as f:
+      contents.append(f.read())
+  num_bytes = sum(len(data) for data in contents) * repeat
+  expected = [json.loads(data) for data in contents]
+  backends = [JsonBackend(name) for name in available_backends()]
+
+  results = {}
+  for backend in backends:
+    start = time.perf_counter()
+    for _ in range(repeat):
+      parsed = [backend.loads(data) for data in contents]
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+      for msgs in parsed:
+        backend.dumps(msgs)
+    dump_time = time.perf_counter() - start
+
+    # Round trip: parsing with this backend, and output of this backend parsed by every backend, gives back the same messages
+    round_trip = parsed == expected
+    for msgs in expected:
+      for pretty in [False, True]:
+        data = backend.dumps(msgs, pretty)
+        round_trip = round_trip and all(other.loads(data) == msgs for other in backends)
+    results[backend.name] = {'load_mb_per_sec': round(num_bytes / load_time / 1e6, 1), 'dump_mb_per_sec': round(num_bytes / dump_time / 1e6, 1),
+                             'round_trip': round_trip}
+    print('JSON backend {}: parse {:.1f} MB/s, serialize {:.1f} MB/s, round trip {}'.format(
+          backend.name, results[backend.name]['load_mb_per_sec'], results[backend.name]['dump_mb_per_sec'], 'ok' if round_trip else 'FAILED'))
+  return results
+
+
+
+def git_commit():
+  # Commit of the code being measured, so results of different commits can be compared
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True, check = True,
+                          cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+
+def run_benchmarks(work_dir, num_channels = 4, num_days = 10, msgs_per_day = 200, words_per_msg = 30, reply_rate = 0.2,
+                   num_workers = None, liwc_fn = None, pipeline_depth = DEFAULT_PIPELINE_DEPTH):
+  """
+  run_benchmarks generates a synthetic export and runs every benchmark in sequential and parallel modes
+
+  :param work_dir: directory of the synthetic export and its output
+  :param num_channels: number of channels
+  :param num_days: number of day files per channel
+  :param msgs_per_day: average number of messages per day file
+  :param words_per_msg: average number of words per message
+  :param reply_rate: fraction of messages that start a thread
+  :param num_workers: number of worker processes in parallel mode (None uses the number of CPUs)
+  :param liwc_fn: path of a LIWC dictionary (None uses a small synthetic dictionary)
+  :param pipeline_depth: number of day files read ahead and waiting to be written in the pipelined runs
+  :return: dictionary of results
+  """
+
+  export_dir = os.path.join(work_dir, 'export')
+  bench_liwc_fn = make_export(export_dir, num_channels, num_days, msgs_per_day, words_per_msg, reply_rate)
+  liwc_fn = os.path.abspath(liwc_fn or bench_liwc_fn)
+
+  results = {'commit': git_commit(),
+             'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+             'python': platform.python_version(),
+             'cpu_count': multiprocessing.cpu_count(),
+             'params': {'num_channels': num_channels, 'num_days': num_days, 'msgs_per_day': msgs_per_day, 'words_per_msg': words_per_msg,
+                        'reply_rate': reply_rate, 'num_workers': num_workers or multiprocessing.cpu_count(), 'liwc': os.path.basename(liwc_fn)},
+             'normalizer_msgs_per_sec': round(bench_normalizer(num_msgs = 20000, words_per_msg = words_per_msg), 1),
+             'json_backends': bench_json(export_dir),
+             'start_methods': bench_start_methods(export_dir, liwc_fn, num_workers)}
+  for mode, parallel in [('sequential', False), ('parallel', True)]:
+    results[mode] = {'stages': bench_stages(export_dir, liwc_fn, parallel, num_workers),
+                     'workspace': bench_workspace(export_dir, liwc_fn, parallel, num_workers),
+                     'pipeline': bench_pipeline(export_dir, liwc_fn, parallel, num_workers, pipeline_depth)}
+  return results
+
+
+
+def write_results(results, path):
+  """
+  write_results writes benchmark results to a JSON file
+
+  :param results: dictionary of results
+  :param path: path of the results file
+  """
+
+  with open(path, 'w', encoding = 'utf-8') as f:
+    json.dump(results, f, indent = 4)
+  print('Benchmark results written to ' + path)
+
+
+
+def bench_normalizer(num_msgs = 20000, words_per_msg = 30):
+  """
+  bench_normalizer measures the throughput of text normalization (element_content and combine_contents, as in process_batch) in messages
+  per second
+
+  :param num_msgs: number of messages to normalize
+  :param words_per_msg: number of words in every text element
+  :return: messages per second
+  """
+
+  msgs = make_text_blocks(num_msgs, words_per_msg)
+
+  # Every text is cleaned, without the cache of process_batch, so the normalizer itself is timed
+  start = time.perf_counter()
+  for msg_json in msgs:
+    combine_contents([element_content(elm, normalize_text) for elm in msg_json['blocks']])
+  elapsed = time.perf_counter() - start
+
+  msgs_per_sec = num_msgs / elapsed
+  print('Normalizer: {} messages in {:.2f} s ({:.0f} messages/sec)'.format(num_msgs, elapsed, msgs_per_sec))
+  return msgs_per_sec
+
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description = 'Benchmark the pipeline on a synthetic Slack export')
+  parser.add_argument('--channels', type = int, default = 4, help = 'number of channels')
+  parser.add_argument('--days', type = int, default = 10, help = 'number of day files per channel')
+  parser.add_argument('--msgs', type = int, default = 200, help = 'average number of messages per day file')
+  parser.add_argument('--words', type = int, default = 30, help = 'average number of words per message')
+  parser.add_argument('--reply-rate', type = float, default = 0.2, help = 'fraction of messages that start a thread')
+  parser.add_argument('--workers', type = int, default = None, help = 'number of worker processes in parallel mode (default: number of CPUs)')
+  parser.add_argument('--pipeline-depth', type = int, default = DEFAULT_PIPELINE_DEPTH,
+                      help = 'number of day files read ahead and waiting to be written in the pipelined runs')
+  parser.add_argument('--liwc', default = None, help = 'path of a LIWC dictionary (default: small synthetic dictionary)')
+  parser.add_argument('--work-dir', default = None, help = 'directory of the synthetic export (default: temporary directory, removed afterwards)')
+  parser.add_argument('--output', default = 'bench_results.json', help = 'path of the JSON results file')
+  args = parser.parse_args()
+
+  work_dir = args.work_dir or tempfile.mkdtemp(prefix = 'slack_bench_')
+  try:
+    results = run_benchmarks(work_dir, args.channels, args.days, args.msgs, args.words, args.reply_rate, args.workers, args.liwc,
+                             args.pipeline_depth)
+  finally:
+    if not args.work_dir:
+      shutil.rmtree(work_dir)
+  write_results(results, args.output)
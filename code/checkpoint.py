@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from multiprocessing.util import Finalize
+from serializer import get_json_backend
+
+
+
+# Directory of the checkpoints of a run in the output directory (removed once the run is complete)
+CHECKPOINTS_DIR = 'checkpoints'
+# Number of day files a process writes between checkpoints (0 disables checkpoints)
+DEFAULT_CHECKPOINT_EVERY = 50
+
+
+
+def sync_paths(paths):
+  """
+  sync_paths flushes files and the directories that hold them to disk, so files renamed into place survive a crash of the machine
+
+  :param paths: list of file paths
+  """
+
+  for path in list(paths) + sorted(set(os.path.dirname(path) for path in paths)):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+      os.fsync(fd)
+    finally:
+      os.close(fd)
+
+
+
+class Journal:
+  """
+  Journal records the day files completed by a process in a JSON Lines file of the checkpoints directory, so an interrupted run can be
+  resumed without processing them again
+
+  Every checkpoint spills the tokens and hashes of the day files to a sorted run, flushes their output files and the run to disk, and
+  then appends one line per day file: {"channel", "day", "size", "mtime" and "md5" of the input day file (see day_entry),
+  "msgs_not_processed" (raw messages), "threads" (see DayThreads), "literals" (tokens kept as they are that this process did not journal
+  before)}. A line is only appended once everything it refers to is on disk, and the file of every process is only appended to by that
+  process.
+
+  :param checkpoint_dir: directory of the journal files
+  :param hash_runs: HashRunWriter that the tokens and hashes of the day files are added to
+  :param literals: set of the tokens kept as they are by this process (e.g. literal_tokens)
+  :param every: number of day files between checkpoints
+  """
+
+  def __init__(self, checkpoint_dir, hash_runs, literals, every = DEFAULT_CHECKPOINT_EVERY):
+    self.checkpoint_dir = checkpoint_dir
+    self.hash_runs = hash_runs
+    self.literals = literals
+    self.every = max(every, 1)
+    # Process ID and start time, so a process that gets the ID of a process of the interrupted run has its own file
+    self.path = os.path.join(checkpoint_dir, '{}-{}.jsonl'.format(os.getpid(), time.time_ns()))
+    self.pending = []
+    self.paths = []
+    self._journaled_literals = set()
+
+  def add(self, entry, path, writer = None):
+    """
+    add records a completed day file, writing a checkpoint every "every" day files
+
+    :param entry: dictionary with "channel", the day entry of the input day file ("day", "size", "mtime", "md5"), "msgs_not_processed" and
+                  "threads"
+    :param path: path of the output day file
+    :param writer: AsyncWriter the output day file is queued on (None if it is already written)
+    """
+
+    self.pending.append(entry)
+    self.paths.append(path)
+    if len(self.pending) >= self.every:
+      self.checkpoint(writer)
+
+  def checkpoint(self, writer = None):
+    """
+    checkpoint journals the day files added since the last checkpoint
+
+    :param writer: AsyncWriter that output day files are queued on, the journal is then appended once they are written (None appends it
+                   right away)
+    """
+
+    if not self.pending:
+      return
+    paths = list(self.paths)
+    run_path = self.hash_runs.spill()
+    if run_path is not None:
+      paths.append(run_path)
+    # Tokens kept as they are go with the first line, which is on disk whenever any line of the checkpoint is
+    new_literals = list(self.literals - self._journaled_literals)
+    self._journaled_literals.update(new_literals)
+    entries = [dict(entry, literals = new_literals if i == 0 else []) for i, entry in enumerate(self.pending)]
+    self.pending = []
+    self.paths = []
+    if writer is not None:
+      writer.submit(None, self._append, entries, paths)
+    else:
+      self._append(entries, paths)
+
+  def _append(self, entries, paths):
+    sync_paths(paths)
+    dumps = get_json_backend().dumps
+    new_file = not os.path.exists(self.path)
+    with open(self.path, 'ab') as f:
+      f.writelines(dumps(entry) + b'\n' for entry in entries)
+      f.flush()
+      os.fsync(f.fileno())
+    if new_file:
+      sync_paths([self.path])
+
+
+
+def load_journal(checkpoint_dir):
+  """
+  load_journal reads the day files completed by every process of an interrupted run
+
+  A line cut short by the interruption ends the journal of its process. Tokens kept as they are are collected from every line, including
+  lines of day files that are processed again.
+
+  :param checkpoint_dir: directory of the journal files
+  :return: dictionary of (channel name, day file name) -> latest journal entry, and set of tokens kept as they are
+  """
+
+  backend = get_json_backend()
+  completed = {}
+  literals = set()
+  if not os.path.isdir(checkpoint_dir):
+    return completed, literals
+  for fn in sorted(os.listdir(checkpoint_dir)):
+    if not fn.endswith('.jsonl'):
+      continue
+    with open(os.path.join(checkpoint_dir, fn), 'rb') as f:
+      for line in f:
+        if not line.endswith(b'\n'):
+          break
+        try:
+          entry = backend.loads(line)
+        except ValueError:
+          break
+        completed[(entry['channel'], entry['day'])] = entry
+        literals.update(entry.pop('literals'))
+  return completed, literals
+
+
+
+# Journal of this worker process (its last checkpoint is written when the process exits)
+_worker_journal = None
+
+
+
+def get_worker_journal(checkpoint_dir, hash_runs, literals, every = DEFAULT_CHECKPOINT_EVERY):
+  """
+  get_worker_journal returns the journal of this worker process, created on first use
+
+  The day files it still holds are journaled when the worker process exits (before the run writer writes its last run), so the pool has
+  to be closed and joined (not terminated).
+
+  :param checkpoint_dir: directory of the journal files
+  :param hash_runs: HashRunWriter of this worker process
+  :param literals: set of the tokens kept as they are by this worker process
+  :param every: number of day files between checkpoints
+  :return: Journal
+  """
+
+  global _worker_journal
+  if _worker_journal is None or _worker_journal.checkpoint_dir != checkpoint_dir or _worker_journal.hash_runs is not hash_runs:
+    _worker_journal = Journal(checkpoint_dir, hash_runs, literals, every)
+    Finalize(_worker_journal, _worker_journal.checkpoint, exitpriority = 20)
+  return _worker_journal
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+import os
+from serializer import get_json_backend
+import numpy as np
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:
+  pa = None
+  pq = None
+
+
+
+# Columnar output formats (one Parquet file per channel and day file)
+COLUMNAR_FORMATS = ['parquet']
+# Number of messages written to a Parquet file at a time (one row group per batch)
+BATCH_SIZE = 10000
+# Message keys stored in their own columns, "hashed content" is stored as hashed_content
+MESSAGE_KEYS = ['client_msg_id', 'user', 'ts', 'team']
+# Prefix of the LIWC category columns
+LIWC_PREFIX = 'liwc_'
+
+
+
+def _require_pyarrow():
+  if pa is None:
+    raise ImportError('The parquet output format requires pyarrow (pip install pyarrow)')
+
+
+
+def message_schema(categories, token_ids = False, keep_epoch = False):
+  """
+  message_schema returns the schema of a Parquet day file: channel and date, message metadata, hashed content, other keys of the message
+  as a JSON string, and one integer column per LIWC category (in dictionary order)
+
+  :param categories: list of LIWC category names
+  :param token_ids: hashed content is stored as a list of packed 32-bit token codes (hashed_ids, see vocab.pack_hashed_content) instead
+                    of a string
+  :param keep_epoch: the unix time stamp of messages is stored in a float64 column (ts_epoch)
+  :return: pyarrow.Schema
+  """
+
+  _require_pyarrow()
+  fields = [pa.field('channel', pa.dictionary(pa.int32(), pa.string())), pa.field('date', pa.dictionary(pa.int32(), pa.string()))]
+  fields += [pa.field(key, pa.string()) for key in MESSAGE_KEYS]
+  if keep_epoch:
+    fields.append(pa.field('ts_epoch', pa.float64()))
+  fields += [pa.field('hashed_ids', pa.list_(pa.uint32())) if token_ids else pa.field('hashed_content', pa.string()), pa.field('extra', pa.string())]
+  fields += [pa.field(LIWC_PREFIX + cat, pa.int32()) for cat in categories]
+  return pa.schema(fields)
+
+
+
+def messages_to_batch(msgs, channel_name, date, categories, schema):
+  """
+  messages_to_batch converts processed message JSONs to a record batch of the Parquet day file schema
+
+  :param msgs: list of processed message JSONs
+  :param channel_name: name of the Slack channel
+  :param date: date of the day file
+  :param categories: list of LIWC category names
+  :param schema: schema returned by message_schema
+  :return: pyarrow.RecordBatch
+  """
+
+  cat_ids = {cat: i for i, cat in enumerate(categories)}
+  skip_keys = set(MESSAGE_KEYS) | {'channel', 'hashed content', 'hashed ids', 'LIWC dict'}
+  if schema.get_field_index('ts_epoch') >= 0:
+    skip_keys.add('ts_epoch')
+  liwc_counts = np.zeros((len(msgs), len(categories)), dtype = np.int32)
+  extra = []
+  dumps = get_json_backend().dumps
+  for row, msg_json in enumerate(msgs):
+    for cat, count in msg_json.get('LIWC dict', {}).items():
+      liwc_counts[row, cat_ids[cat]] = count
+    other = {key: val for key, val in msg_json.items() if key not in skip_keys}
+    extra.append(dumps(other).decode('utf-8') if other else None)
+
+  columns = [pa.DictionaryArray.from_arrays(pa.array(np.zeros(len(msgs), dtype = np.int32)), pa.array([name]))
+             for name in [channel_name, date]]
+  columns += [pa.array([msg_json.get(key) for msg_json in msgs], pa.string()) for key in MESSAGE_KEYS]
+  if 'ts_epoch' in skip_keys:
+    columns.append(pa.array([msg_json.get('ts_epoch') for msg_json in msgs], pa.float64()))
+  if schema.get_field_index('hashed_ids') >= 0:
+    # Token codes of all messages are concatenated into one array, split by offsets
+    codes = [msg_json.get('hashed ids', ()) for msg_json in msgs]
+    offsets = np.zeros(len(msgs) + 1, dtype = np.int32)
+    offsets[1:] = np.cumsum([len(msg_codes) for msg_codes in codes])
+    values = np.concatenate([np.frombuffer(msg_codes, dtype = np.uint32) for msg_codes in codes if len(msg_codes)] or [np.zeros(0, dtype = np.uint32)])
+    columns.append(pa.ListArray.from_arrays(pa.array(offsets), pa.array(values, pa.uint32())))
+  else:
+    columns.append(pa.array([msg_json.get('hashed content') for msg_json in msgs], pa.string()))
+  columns.append(pa.array(extra, pa.string()))
+  columns += [pa.array(liwc_counts[:, i]) for i in range(len(categories))]
+  return pa.RecordBatch.from_arrays(columns, schema = schema)
+
+
+
+def write_parquet_day(path, msgs, categories, batch_size = BATCH_SIZE, token_ids = False, keep_epoch = False):
+  """
+  write_parquet_day writes processed messages of a day file to a Parquet file, one row group per batch of messages as they arrive
+
+  :param path: path of the output file (<output_dir>/<channel>/<date>.parquet)
+  :param msgs: list or iterator of processed message JSONs
+  :param categories: list of LIWC category names
+  :param batch_size: number of messages per row group
+  :param token_ids: messages have packed token codes ("hashed ids") instead of "hashed content"
+  :param keep_epoch: messages have numeric time stamps ("ts_epoch")
+  :return: number of messages written
+  """
+
+  _require_pyarrow()
+  channel_name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+  date = os.path.splitext(os.path.basename(path))[0]
+  schema = message_schema(categories, token_ids, keep_epoch)
+
+  num_msgs = 0
+  batch = []
+  # Written to a temporary file that replaces the day file once complete
+  with pq.ParquetWriter(path + '.tmp', schema) as writer:
+    for msg_json in msgs:
+      batch.append(msg_json)
+      if len(batch) == batch_size:
+        writer.write_batch(messages_to_batch(batch, channel_name, date, categories, schema))
+        num_msgs += len(batch)
+        batch = []
+    if batch or not num_msgs:
+      writer.write_batch(messages_to_batch(batch, channel_name, date, categories, schema))
+      num_msgs += len(batch)
+  os.replace(path + '.tmp', path)
+  return num_msgs
+
+
+
+def day_files(output_dir, channels = None, start_date = None, end_date = None):
+  """
+  day_files lists the Parquet day files of a channel subset and date range from the file names, without opening any file
+
+  :param output_dir: directory of the output of data
+  :param channels: list of channel names (None selects every channel)
+  :param start_date: first date ("YYYY-MM-DD", inclusive, None for no limit)
+  :param end_date: last date ("YYYY-MM-DD", inclusive, None for no limit)
+  :return: list of paths, sorted by channel and date
+  """
+
+  if channels is None:
+    channels = [channel_name for channel_name in os.listdir(output_dir) if os.path.isdir(os.path.join(output_dir, channel_name))]
+  paths = []
+  for channel_name in sorted(channels):
+    channel_dir = os.path.join(output_dir, channel_name)
+    if not os.path.isdir(channel_dir):
+      continue
+    for fn in sorted(os.listdir(channel_dir)):
+      date, ext = os.path.splitext(fn)
+      if ext != '.parquet' or (start_date and date < start_date) or (end_date and date > end_date):
+        continue
+      paths.append(os.path.join(channel_dir, fn))
+  return paths
+
+
+
+def read_messages(output_dir, channels = None, start_date = None, end_date = None, columns = None):
+  """
+  read_messages loads the processed messages of a channel subset and date range written in the parquet output format
+
+  :param output_dir: directory of the output of data
+  :param channels: list of channel names (None selects every channel)
+  :param start_date: first date ("YYYY-MM-DD", inclusive, None for no limit)
+  :param end_date: last date ("YYYY-MM-DD", inclusive, None for no limit)
+  :param columns: list of columns to be read (None reads every column)
+  :return: pyarrow.Table (None if no day file matches)
+  """
+
+  _require_pyarrow()
+  tables = [pq.read_table(path, columns = columns) for path in day_files(output_dir, channels, start_date, end_date)]
+  if not tables:
+    return None
+  # LIWC columns can differ between runs with different dictionaries, missing columns are filled with nulls
+  return pa.concat_tables(tables, promote_options = 'default')
+
+
+
+def iter_message_batches(output_dir, channels = None, start_date = None, end_date = None, columns = None):
+  """
+  iter_message_batches yields the processed messages of a channel subset and date range one row group at a time
+
+  :param output_dir: directory of the output of data
+  :param channels: list of channel names (None selects every channel)
+  :param start_date: first date ("YYYY-MM-DD", inclusive, None for no limit)
+  :param end_date: last date ("YYYY-MM-DD", inclusive, None for no limit)
+  :param columns: list of columns to be read (None reads every column)
+  :return: generator of pyarrow.RecordBatch
+  """
+
+  _require_pyarrow()
+  for path in day_files(output_dir, channels, start_date, end_date):
+    parquet_file = pq.ParquetFile(path)
+    for row_group in range(parquet_file.num_row_groups):
+      yield from parquet_file.read_row_group(row_group, columns = columns).to_batches()
+
+
+
+def liwc_columns(table):
+  """
+  liwc_columns returns the LIWC counts of a table of messages as a matrix with one row per message and one column per category
+
+  :param table: pyarrow.Table returned by read_messages
+  :return: list of category names and NumPy array of counts
+  """
+
+  names = [name for name in table.column_names if name.startswith(LIWC_PREFIX)]
+  counts = np.column_stack([table.column(name).fill_null(0).to_numpy() for name in names]) if names else np.zeros((table.num_rows, 0), dtype = np.int32)
+  return [name[len(LIWC_PREFIX):] for name in names], counts
+
+
+
+def read_parquet_day(path):
+  """
+  read_parquet_day returns the rows of one Parquet day file
+
+  :param path: path of the day file
+  :return: list of dictionaries of column -> value
+  """
+
+  _require_pyarrow()
+  return pq.read_table(path).to_pylist()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import hashlib
+import itertools
+from collections import OrderedDict
+
+
+
+# Header of the on-disk cache file, followed by the md5 digest of the seed the hashes were computed with
+CACHE_MAGIC = b'SLKHASH1'
+# Default number of tokens kept in memory
+DEFAULT_CACHE_SIZE = 1000000
+
+
+
+def hash_token(word, seed_val):
+  """
+  hash_token returns the first 8 hexadecimal characters of the md5 hash of a token and seed value
+
+  :param word: token to be hashed
+  :param seed_val: parameter added to every token before hashing
+  :return: 8 character hash string
+  """
+
+  return hashlib.md5((word + str(seed_val)).encode()).hexdigest()[0:8]
+
+
+
+class TokenHashCache:
+  """
+  TokenHashCache is a bounded LRU cache of token -> hash for a single seed value
+
+  :param seed_val: parameter added to every token before hashing
+  :param max_size: maximum number of tokens kept in the cache
+  """
+
+  def __init__(self, seed_val, max_size = DEFAULT_CACHE_SIZE):
+    self.seed_val = str(seed_val)
+    self.max_size = max_size
+    self.hits = 0
+    self.misses = 0
+    self._hashes = OrderedDict()
+
+  def __len__(self):
+    return len(self._hashes)
+
+  def get(self, word):
+    """
+    get returns the hash of a token, computing and caching it if the token has not been seen before
+
+    :param word: token to be hashed
+    :return: 8 character hash string
+    """
+
+    repl = self._hashes.get(word)
+    if repl is not None:
+      self.hits += 1
+      self._hashes.move_to_end(word)
+      return repl
+
+    self.misses += 1
+    repl = hash_token(word, self.seed_val)
+    self.add(word, repl)
+    return repl
+
+  def add(self, word, repl):
+    """
+    add stores a known token and hash in the cache, evicting the least recently used token if the cache is full
+
+    :param word: token
+    :param repl: hash of the token
+    """
+
+    self._hashes[word] = repl
+    self._hashes.move_to_end(word)
+    if len(self._hashes) > self.max_size:
+      self._hashes.popitem(last = False)
+
+  def stats(self):
+    """
+    stats returns the number of cache hits and misses so far
+
+    :return: dictionary with "hits" and "misses"
+    """
+
+    return {'hits': self.hits, 'misses': self.misses}
+
+  def seed_digest(self):
+    return seed_digest(self.seed_val)
+
+  def save(self, path):
+    """
+    save writes the cache as a compact binary table: a header, then the utf-8 length, token and 4 raw hash bytes per entry
+
+    :param path: path of the cache file
+    """
+
+    with HashCacheWriter(path, self.seed_val, len(self._hashes)) as cache_writer:
+      cache_writer.write(self._hashes)
+
+  def load(self, path):
+    """
+    load reads a cache file written by save, ignoring it if it does not exist or was written with another seed value
+
+    :param path: path of the cache file
+    :return: number of tokens loaded
+    """
+
+    if not os.path.exists(path):
+      return 0
+
+    with open(path, 'rb') as f:
+      data = f.read()
+
+    header_len = len(CACHE_MAGIC) + 16
+    if data[:len(CACHE_MAGIC)] != CACHE_MAGIC or data[len(CACHE_MAGIC):header_len] != self.seed_digest():
+      print('Hash cache ' + path + ' was written with another seed value and is ignored')
+      return 0
+
+    num_entries = struct.unpack_from('<I', data, header_len)[0]
+    pos = header_len + 4
+    for _ in range(num_entries):
+      word_len = struct.unpack_from('<I', data, pos)[0]
+      pos += 4
+      word = data[pos:pos + word_len].decode('utf-8')
+      pos += word_len
+      self.add(word, data[pos:pos + 4].hex())
+      pos += 4
+    return num_entries
+
+
+
+def seed_digest(seed_val):
+  """
+  seed_digest returns the md5 digest of a seed value, stored in the header of a cache file so hashes of another seed are never loaded
+
+  :param seed_val: parameter added to every token before hashing
+  :return: 16 bytes
+  """
+
+  return hashlib.md5(str(seed_val).encode()).digest()
+
+
+
+class HashCacheWriter:
+  """
+  HashCacheWriter writes a cache file (see TokenHashCache.save) from tokens and hashes as they come, e.g. as runs are merged into the
+  hash dictionary, so they never have to be held in memory
+
+  Tokens are written in the order they come (token order for merged runs), which says nothing about how often or how recently they were
+  used, so the cache size has to be at least the size of the vocabulary for the file to hold every token of the run. Tokens beyond
+  max_size are dropped and counted, and close prints how many.
+
+  :param path: path of the cache file
+  :param seed_val: parameter the hashes were computed with
+  :param max_size: maximum number of tokens written, the size of the cache that loads the file
+  """
+
+  def __init__(self, path, seed_val, max_size = DEFAULT_CACHE_SIZE):
+    self.path = path
+    self.max_size = max_size
+    self.count = 0
+    self.dropped = 0
+    self._f = open(path + '.tmp', 'wb')
+    self._f.write(CACHE_MAGIC)
+    self._f.write(seed_digest(seed_val))
+    # Number of entries, written once they are all known
+    self._f.write(struct.pack('<I', 0))
+
+  def write(self, hash_dict):
+    """
+    write appends tokens and hashes to the cache file, dropping the tokens that come once max_size tokens are written
+
+    :param hash_dict: dictionary of tokens and hashes
+    """
+
+    num_written = self.count
+    for word, repl in itertools.islice(hash_dict.items(), self.max_size - self.count):
+      word_bytes = word.encode('utf-8')
+      self._f.write(struct.pack('<I', len(word_bytes)) + word_bytes + bytes.fromhex(repl))
+      self.count += 1
+    self.dropped += len(hash_dict) - (self.count - num_written)
+
+  def close(self):
+    if self.dropped:
+      print('Hash cache {} holds {} of {} tokens, the hash cache size should be at least the size of the vocabulary'.format(
+            self.path, self.count, self.count + self.dropped))
+    self._f.seek(len(CACHE_MAGIC) + 16)
+    self._f.write(struct.pack('<I', self.count))
+    self._f.close()
+    os.replace(self.path + '.tmp', self.path)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, *exc):
+    if exc_type is None:
+      self.close()
+    else:
+      self._f.close()
+      os.remove(self.path + '.tmp')
+
+
+
+# Cache shared by every channel processed in this process
+_token_hash_cache = None
+
+
+
+def get_hash_cache(seed_val, max_size = None):
+  """
+  get_hash_cache returns the token hash cache of this process, starting a new one if the seed value changed
+
+  :param seed_val: parameter added to every token before hashing
+  :param max_size: maximum number of tokens kept in the cache (None keeps the current size)
+  :return: TokenHashCache
+  """
+
+  global _token_hash_cache
+  if _token_hash_cache is None or _token_hash_cache.seed_val != str(seed_val):
+    _token_hash_cache = TokenHashCache(seed_val, max_size or DEFAULT_CACHE_SIZE)
+  elif max_size is not None:
+    _token_hash_cache.max_size = max_size
+  return _token_hash_cache
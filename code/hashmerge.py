@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+import os
+import heapq
+import itertools
+from multiprocessing.util import Finalize
+from serializer import get_json_backend
+
+
+
+# Directory of the sorted runs of tokens and hashes in the output directory (removed once they are merged into hash_dict.json)
+RUNS_DIR = 'hash_runs'
+# Number of tokens and hashes held in memory before they are written to a sorted run
+DEFAULT_SPILL_SIZE = 200000
+# Number of runs merged at a time (more runs are merged in several passes)
+MERGE_FAN_IN = 64
+# Size of the read buffer of every run that is merged
+RUN_BUFFER_SIZE = 1 << 16
+
+
+
+class HashRunWriter:
+  """
+  HashRunWriter collects tokens and hashes and writes them to sorted run files of at most spill_size tokens, so a process never holds
+  more than spill_size of them
+
+  Run files have one "token<TAB>hash" line per token, sorted by the utf-8 bytes of the token (the order of the code points). Tokens
+  never contain whitespace, as "hashed content" is split on it.
+
+  :param run_dir: directory of the run files
+  :param spill_size: number of tokens held before they are written
+  :param prefix: prefix of the run file names, unique per process (the process ID by default)
+  """
+
+  def __init__(self, run_dir, spill_size = DEFAULT_SPILL_SIZE, prefix = None):
+    self.run_dir = run_dir
+    self.spill_size = spill_size
+    self.prefix = prefix if prefix is not None else str(os.getpid())
+    self.buffer = {}
+    self.paths = []
+
+  def add(self, hash_dict):
+    """
+    add adds tokens and hashes, writing a run whenever spill_size tokens are held
+
+    :param hash_dict: dictionary (or iterable of items) of tokens and hashes
+    """
+
+    for word, repl in hash_dict.items() if isinstance(hash_dict, dict) else hash_dict:
+      self.buffer[word] = repl
+      if len(self.buffer) >= self.spill_size:
+        self.spill()
+
+  def spill(self):
+    """
+    spill writes the tokens held in memory to a new sorted run
+
+    :return: path of the run file (None if no token is held)
+    """
+
+    if not self.buffer:
+      return None
+    os.makedirs(self.run_dir, exist_ok = True)
+    # Runs left by an interrupted run (possibly by a process with the same ID) are kept
+    path = new_run_path(self.run_dir, self.prefix, len(self.paths))
+    write_run(path, sorted((word.encode('utf-8'), repl.encode('ascii')) for word, repl in self.buffer.items()))
+    self.buffer = {}
+    self.paths.append(path)
+    return path
+
+
+
+def new_run_path(run_dir, prefix, num_run):
+  """
+  new_run_path returns the path of a new run file, numbered from num_run and skipping the files that already exist
+
+  :param run_dir: directory of the run files
+  :param prefix: prefix of the run file name
+  :param num_run: first number tried
+  :return: path of the run file
+  """
+
+  path = os.path.join(run_dir, '{}-{:05d}.run'.format(prefix, num_run))
+  while os.path.exists(path):
+    num_run += 1
+    path = os.path.join(run_dir, '{}-{:05d}.run'.format(prefix, num_run))
+  return path
+
+
+
+def write_run(path, items):
+  """
+  write_run writes a sorted run file
+
+  :param path: path of the run file
+  :param items: sorted iterable of (utf-8 token, ascii hash)
+  """
+
+  tmp_path = path + '.tmp'
+  with open(tmp_path, 'wb') as f:
+    f.writelines(word + b'\t' + repl + b'\n' for word, repl in items)
+  os.replace(tmp_path, path)
+
+
+
+def iter_run(path):
+  """
+  iter_run yields the items of a run file
+
+  :param path: path of the run file
+  :return: generator of (utf-8 token, ascii hash)
+  """
+
+  with open(path, 'rb', buffering = RUN_BUFFER_SIZE) as f:
+    for line in f:
+      word, _, repl = line.rstrip(b'\n').partition(b'\t')
+      yield word, repl
+
+
+
+def iter_merged(paths, unique = True):
+  """
+  iter_merged merges sorted run files, keeping the first hash of tokens that are in several runs
+
+  :param paths: list of run files
+  :param unique: yield every token once (False yields every distinct item, for runs sorted by both fields that can have several items
+                 per key)
+  :return: generator of (utf-8 token, ascii hash) in token order, every token once
+  """
+
+  prev = None
+  if not unique:
+    for item in heapq.merge(*[iter_run(path) for path in paths]):
+      if item != prev:
+        prev = item
+        yield item
+    return
+  for word, repl in heapq.merge(*[iter_run(path) for path in paths], key = lambda item: item[0]):
+    if word != prev:
+      prev = word
+      yield word, repl
+
+
+
+def merge_runs(paths, run_dir, fan_in = MERGE_FAN_IN, unique = True):
+  """
+  merge_runs merges run files until at most fan_in are left, so no more than fan_in files are open at a time
+
+  :param paths: list of run files (merged files are removed)
+  :param run_dir: directory of the intermediate run files
+  :param fan_in: number of runs merged at a time
+  :param unique: keep one item per token (see iter_merged)
+  :return: list of run files left
+  """
+
+  paths = sorted(paths)
+  num_pass = 0
+  while len(paths) > fan_in:
+    merged = []
+    for i in range(0, len(paths), fan_in):
+      group = paths[i:i + fan_in]
+      path = new_run_path(run_dir, 'merge{}'.format(num_pass), len(merged))
+      write_run(path, iter_merged(group, unique))
+      for run_path in group:
+        os.remove(run_path)
+      merged.append(path)
+    paths = merged
+    num_pass += 1
+  return paths
+
+
+
+def iter_merged_chunks(run_dir, chunk_size = DEFAULT_SPILL_SIZE, fan_in = MERGE_FAN_IN, remove = True):
+  """
+  iter_merged_chunks merges every run file of a directory and yields the tokens and hashes in sorted chunks, removing the directory
+  once they are all read
+
+  :param run_dir: directory of the run files
+  :param chunk_size: number of tokens per chunk
+  :param fan_in: number of runs merged at a time
+  :param remove: remove the directory once every chunk is read (False keeps it, e.g. until the merged output is in place)
+  :return: generator of dictionaries of tokens and hashes (tokens in order, within and across chunks)
+  """
+
+  paths = [os.path.join(run_dir, fn) for fn in os.listdir(run_dir) if fn.endswith('.run')] if os.path.isdir(run_dir) else []
+  merged = iter_merged(merge_runs(paths, run_dir, fan_in))
+  while True:
+    chunk = {word.decode('utf-8'): repl.decode('ascii') for word, repl in itertools.islice(merged, chunk_size)}
+    if not chunk:
+      break
+    yield chunk
+  merged.close()
+  if not remove:
+    return
+  for fn in os.listdir(run_dir) if os.path.isdir(run_dir) else []:
+    os.remove(os.path.join(run_dir, fn))
+  if os.path.isdir(run_dir):
+    os.rmdir(run_dir)
+
+
+
+class HashDictWriter:
+  """
+  HashDictWriter writes hash_dict.json from chunks of tokens and hashes as they are merged: pretty-printed like json.dump with an
+  indent of 4, or compact
+
+  :param path: path of the hash dictionary file
+  :param pretty: indent the file instead of writing it compact
+  """
+
+  def __init__(self, path, pretty = False):
+    self.path = path
+    self.pretty = pretty
+    self.count = 0
+    self._dumps = get_json_backend().dumps
+    self._f = open(path + '.tmp', 'wb')
+    self._f.write(b'{')
+
+  def write(self, hash_dict):
+    sep, item_sep = (b',\n    ', b': ') if self.pretty else (b',', b':')
+    dumps = self._dumps
+    for word, repl in hash_dict.items():
+      self._f.write(sep if self.count else sep[1:])
+      self._f.write(dumps(word, self.pretty) + item_sep + dumps(repl, self.pretty))
+      self.count += 1
+
+  def close(self):
+    self._f.write(b'\n}' if self.pretty and self.count else b'}')
+    self._f.close()
+    os.replace(self.path + '.tmp', self.path)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, *exc):
+    if exc_type is None:
+      self.close()
+    else:
+      self._f.close()
+      os.remove(self.path + '.tmp')
+
+
+
+# Run writer of this worker process (its last run is written when the process exits)
+_worker_runs = None
+
+
+
+def get_worker_runs(run_dir, spill_size = DEFAULT_SPILL_SIZE):
+  """
+  get_worker_runs returns the run writer of this worker process, created on first use
+
+  The tokens it still holds are written when the worker process exits, so the pool has to be closed and joined (not terminated) before
+  the runs are merged.
+
+  :param run_dir: directory of the run files
+  :param spill_size: number of tokens held before they are written
+  :return: HashRunWriter
+  """
+
+  global _worker_runs
+  if _worker_runs is None or _worker_runs.run_dir != run_dir or _worker_runs.prefix != str(os.getpid()):
+    _worker_runs = HashRunWriter(run_dir, spill_size)
+    Finalize(_worker_runs, _worker_runs.spill, exitpriority = 10)
+  return _worker_runs
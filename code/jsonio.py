@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+from serializer import get_json_backend
+
+
+
+# Output formats of processed day files: pretty-printed JSON (default), compact JSON array, or JSON Lines
+OUTPUT_FORMATS = ['json', 'compact', 'jsonl']
+# Number of characters read from a day file at a time when streaming
+READ_CHUNK_SIZE = 1 << 16
+
+# Streaming parsers use the stdlib decoder whatever the JSON backend (see iter_json_array)
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+# Characters that can follow a complete item of a JSON array
+_ITEM_END = _WHITESPACE + ',]'
+
+
+
+def iter_json_array(f, chunk_size = READ_CHUNK_SIZE):
+  """
+  iter_json_array incrementally parses a file that contains a JSON array and yields its items one at a time
+
+  Items are always parsed by the stdlib parser (JSONDecoder.raw_decode on decoded text), not by the JSON backend: orjson and ujson only
+  parse whole documents and cannot tell where an item ends in a partial buffer. Whole day files read at once (read_day_file,
+  parse_day_file) and JSON Lines files go through the backend.
+
+  :param f: file object opened in text mode
+  :param chunk_size: number of characters read at a time
+  :return: generator of items in the array
+  """
+
+  buf = ''
+  pos = 0
+  eof = False
+
+  def fill(buf, pos, size):
+    # Dropping parsed characters and reading the next chunk
+    chunk = f.read(size)
+    return buf[pos:] + chunk, 0, not chunk
+
+  def skip_whitespace(buf, pos, eof):
+    while True:
+      while pos < len(buf) and buf[pos] in _WHITESPACE:
+        pos += 1
+      if pos < len(buf) or eof:
+        return buf, pos, eof
+      buf, pos, eof = fill(buf, pos, chunk_size)
+
+  name = str(getattr(f, 'name', 'file'))
+  buf, pos, eof = skip_whitespace(buf, pos, eof)
+  if pos >= len(buf) or buf[pos] != '[':
+    raise ValueError('Expected a JSON array at the start of ' + name)
+  buf, pos, eof = skip_whitespace(buf, pos + 1, eof)
+  if pos < len(buf) and buf[pos] == ']':
+    return
+
+  while True:
+    # Decoding the next item, reading more of the file while the item is incomplete
+    while True:
+      try:
+        item, end = _decoder.raw_decode(buf, pos)
+        # An item cut at the end of the buffer (e.g. "1." of "1.5") may continue in the next chunk
+        if eof or (end < len(buf) and buf[end] in _ITEM_END):
+          break
+      except ValueError:
+        if eof:
+          raise
+      buf, pos, eof = fill(buf, pos, max(chunk_size, len(buf)))
+    yield item
+
+    # Items are followed by "," or the closing "]"
+    buf, pos, eof = skip_whitespace(buf, end, eof)
+    if pos >= len(buf):
+      raise ValueError('Unexpected end of JSON array in ' + name)
+    if buf[pos] == ']':
+      return
+    if buf[pos] != ',':
+      raise ValueError('Expected "," between items of JSON array in ' + name)
+    buf, pos, eof = skip_whitespace(buf, pos + 1, eof)
+
+
+
+def iter_json_object(f, chunk_size = READ_CHUNK_SIZE):
+  """
+  iter_json_object incrementally parses a file that contains a JSON object and yields its items one at a time
+
+  Like iter_json_array, keys and values are always parsed by the stdlib parser, whatever the JSON backend.
+
+  :param f: file object opened in text mode
+  :param chunk_size: number of characters read at a time
+  :return: generator of (key, value) items in file order
+  """
+
+  buf = ''
+  pos = 0
+  eof = False
+  name = str(getattr(f, 'name', 'file'))
+
+  def fill(buf, pos, size):
+    chunk = f.read(size)
+    return buf[pos:] + chunk, 0, not chunk
+
+  def skip_whitespace(buf, pos, eof):
+    while True:
+      while pos < len(buf) and buf[pos] in _WHITESPACE:
+        pos += 1
+      if pos < len(buf) or eof:
+        return buf, pos, eof
+      buf, pos, eof = fill(buf, pos, chunk_size)
+
+  def decode(buf, pos, eof, end_chars):
+    # Decoding the next key or value, reading more of the file while it is incomplete
+    while True:
+      try:
+        val, end = _decoder.raw_decode(buf, pos)
+        if eof or (end < len(buf) and buf[end] in end_chars):
+          return val, end, buf, pos, eof
+      except ValueError:
+        if eof:
+          raise
+      buf, pos, eof = fill(buf, pos, max(chunk_size, len(buf)))
+
+  buf, pos, eof = skip_whitespace(buf, pos, eof)
+  if pos >= len(buf) or buf[pos] != '{':
+    raise ValueError('Expected a JSON object at the start of ' + name)
+  buf, pos, eof = skip_whitespace(buf, pos + 1, eof)
+  if pos < len(buf) and buf[pos] == '}':
+    return
+
+  while True:
+    key, end, buf, pos, eof = decode(buf, pos, eof, _WHITESPACE + ':')
+    if not isinstance(key, str):
+      raise ValueError('Expected a string key in JSON object in ' + name)
+    buf, pos, eof = skip_whitespace(buf, end, eof)
+    if pos >= len(buf) or buf[pos] != ':':
+      raise ValueError('Expected ":" after key of JSON object in ' + name)
+    buf, pos, eof = skip_whitespace(buf, pos + 1, eof)
+    val, end, buf, pos, eof = decode(buf, pos, eof, _WHITESPACE + ',}')
+    yield key, val
+
+    # Items are followed by "," or the closing "}"
+    buf, pos, eof = skip_whitespace(buf, end, eof)
+    if pos >= len(buf):
+      raise ValueError('Unexpected end of JSON object in ' + name)
+    if buf[pos] == '}':
+      return
+    if buf[pos] != ',':
+      raise ValueError('Expected "," between items of JSON object in ' + name)
+    buf, pos, eof = skip_whitespace(buf, pos + 1, eof)
+
+
+
+def iter_day_file(path):
+  """
+  iter_day_file yields the messages of a day file one at a time (JSON array or JSON Lines)
+
+  JSON Lines are parsed line by line by the JSON backend, JSON arrays by the stdlib parser (see iter_json_array).
+
+  :param path: path of the day file
+  :return: generator of message JSONs
+  """
+
+  if path.endswith('.jsonl'):
+    loads = get_json_backend().loads
+    with open(path, 'rb') as f:
+      for line in f:
+        if line.strip():
+          yield loads(line)
+  else:
+    with open(path, 'r', encoding = 'utf-8') as f:
+      yield from iter_json_array(f)
+
+
+
+def read_day_file(path):
+  """
+  read_day_file returns all messages of a day file (JSON array or JSON Lines) as a list
+
+  :param path: path of the day file
+  :return: list of message JSONs
+  """
+
+  with open(path, 'rb') as f:
+    return parse_day_file(f.read(), path)
+
+
+
+def parse_day_file(data, name):
+  """
+  parse_day_file returns all messages of a day file that was already read (e.g. by DayPrefetcher)
+
+  :param data: contents of the day file (bytes)
+  :param name: name or path of the day file, ".jsonl" files are parsed as JSON Lines
+  :return: list of message JSONs
+  """
+
+  loads = get_json_backend().loads
+  if name.endswith('.jsonl'):
+    return [loads(line) for line in data.splitlines() if line.strip()]
+  return loads(data)
+
+
+
+def output_file_name(day, output_format):
+  """
+  output_file_name returns the name of the processed day file for an output format
+
+  :param day: name of the input day file
+  :param output_format: one of OUTPUT_FORMATS or "parquet"
+  :return: name of the output day file
+  """
+
+  if output_format in ['jsonl', 'parquet']:
+    return os.path.splitext(day)[0] + '.' + output_format
+  return day
+
+
+
+def write_day_file(path, msgs, output_format = 'json'):
+  """
+  write_day_file writes processed messages to a day file, consuming them one at a time unless the default format is used
+
+  "json" is pretty-printed, "compact" and "jsonl" are written without whitespace by the JSON backend of the process.
+
+  :param path: path of the output day file
+  :param msgs: list or iterator of message JSONs
+  :param output_format: one of OUTPUT_FORMATS
+  :return: number of messages written
+  """
+
+  if output_format not in OUTPUT_FORMATS:
+    raise ValueError('Unknown output format ' + str(output_format) + ', expected one of ' + str(OUTPUT_FORMATS))
+
+  backend = get_json_backend()
+  num_msgs = 0
+  # Written to a temporary file that replaces the day file once complete, so a day file is never left half written
+  with open(path + '.tmp', 'wb') as f:
+    if output_format == 'jsonl':
+      for msg_json in msgs:
+        f.write(backend.dumps(msg_json))
+        f.write(b'\n')
+        num_msgs += 1
+
+    elif output_format == 'compact':
+      f.write(b'[')
+      for msg_json in msgs:
+        if num_msgs:
+          f.write(b',')
+        f.write(backend.dumps(msg_json))
+        num_msgs += 1
+      f.write(b']')
+
+    else:
+      msgs = list(msgs)
+      backend.dump(msgs, f, pretty = True)
+      num_msgs = len(msgs)
+
+  os.replace(path + '.tmp', path)
+  return num_msgs
+
+
+
+class JsonLinesSink:
+  """
+  JsonLinesSink appends messages to a JSON Lines file as they arrive, so they never have to be collected in memory
+
+  :param path: path of the JSON Lines file
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.count = 0
+    self._dumps = get_json_backend().dumps
+    self._f = open(path, 'wb')
+
+  def append(self, msg_json):
+    self._f.write(self._dumps(msg_json))
+    self._f.write(b'\n')
+    self.count += 1
+
+  def close(self):
+    self._f.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
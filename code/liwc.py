@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+
+import os
+import csv
+import hashlib
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+import numpy as np
+from nltk.stem import PorterStemmer
+
+
+
+# Ways of matching wildcard terms: longest prefix in a trie, or Porter stem of the word (original behaviour)
+PREFIX_MATCH_MODES = ['trie', 'stem']
+# Name of the file of shared LIWC tables written to the output directory for the worker processes of a run
+LIWC_TABLES_FN = 'liwc_tables.bin'
+# Header of the file of shared read-only tables of a compiled dictionary, followed by the length of its JSON description
+TABLES_MAGIC = b'SLKLIWC1'
+# Flat arrays of a PrefixTrie, in the order of PrefixTrie.from_arrays
+TRIE_ARRAYS = ['labels', 'child_lo', 'child_hi', 'cat_lo', 'cat_hi', 'cat_ids']
+# Version of the compiled index (a tables file written by LiwcEngine.save_tables), part of its key
+INDEX_VERSION = 3
+
+
+
+def index_key(liwc_fn, prefix_match):
+  """
+  index_key identifies the compiled index of a dictionary: the md5 hash of the contents of the .csv file, the prefix match and the
+  index version, so a copied or checked out .csv file with an older modification time is never matched with a stale index
+
+  :param liwc_fn: path of the .csv file
+  :param prefix_match: "trie" or "stem"
+  :return: string
+  """
+
+  md5 = hashlib.md5()
+  with open(liwc_fn, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      md5.update(chunk)
+  return '{}:{}:{}'.format(md5.hexdigest(), prefix_match, INDEX_VERSION)
+
+
+
+def read_liwc_csv(liwc_fn):
+  """
+  read_liwc_csv reads a LIWC dictionary in the liwc2007dictionary_poster.csv format (one column of terms per category)
+
+  :param liwc_fn: path of the .csv file
+  :return: list of category names, dictionary of full words -> category names and dictionary of prefixes -> category names
+  """
+
+  categories = []
+  words2categories = {}
+  prefixes2categories = {}
+  with open(liwc_fn) as csvfile:
+    csvreader = csv.reader(csvfile)
+    header = next(csvreader)
+    for cat in header:
+      if cat not in categories:
+        categories.append(cat)
+    for row in csvreader:
+      for cat, term in zip(header, row):
+        term = term.lower().strip()
+        if not term:
+          continue
+        if '.*' in term:
+          # Wildcard terms ("abandon.*") match every word starting with the prefix
+          prefixes2categories.setdefault(term.replace('.*', ''), []).append(cat)
+        else:
+          words2categories.setdefault(term, []).append(cat)
+  return categories, words2categories, prefixes2categories
+
+
+
+class PrefixTrie:
+  """
+  PrefixTrie finds the longest wildcard prefix of a word in a trie stored as flat arrays (nodes in breadth-first order)
+
+  The children of a node are contiguous and sorted by character, so every step of a lookup is a binary search
+  over the children of the current node and the whole lookup is O(word length).
+
+  :param prefixes2ids: dictionary of wildcard prefixes -> tuple of category ids
+  """
+
+  def __init__(self, prefixes2ids):
+    # Building a temporary nested trie: node -> {character: child node}, and node -> category ids
+    children = [{}]
+    node_ids = [()]
+    for prefix, ids in prefixes2ids.items():
+      node = 0
+      for ch in prefix:
+        if ch not in children[node]:
+          children[node][ch] = len(children)
+          children.append({})
+          node_ids.append(())
+        node = children[node][ch]
+      node_ids[node] = tuple(sorted(set(node_ids[node]) | set(ids)))
+
+    # Flattening in breadth-first order so the children of every node get consecutive positions
+    self.labels = array('i', [0])
+    self.child_lo = array('i')
+    self.child_hi = array('i')
+    self.cat_lo = array('i')
+    self.cat_hi = array('i')
+    self.cat_ids = array('i')
+    queue = [0]
+    for old_node in queue:
+      self.child_lo.append(len(queue))
+      for ch in sorted(children[old_node]):
+        self.labels.append(ord(ch))
+        queue.append(children[old_node][ch])
+      self.child_hi.append(len(queue))
+      self.cat_lo.append(len(self.cat_ids))
+      self.cat_ids.extend(node_ids[old_node])
+      self.cat_hi.append(len(self.cat_ids))
+
+  @classmethod
+  def from_arrays(cls, labels, child_lo, child_hi, cat_lo, cat_hi, cat_ids):
+    """
+    from_arrays returns a trie over flat arrays that were already built (e.g. memoryviews of a memory-mapped tables file)
+
+    :return: PrefixTrie
+    """
+
+    trie = cls.__new__(cls)
+    trie.labels, trie.child_lo, trie.child_hi, trie.cat_lo, trie.cat_hi, trie.cat_ids = labels, child_lo, child_hi, cat_lo, cat_hi, cat_ids
+    return trie
+
+  def __len__(self):
+    return len(self.labels)
+
+  def longest_match(self, word):
+    """
+    longest_match returns the category ids of the longest wildcard prefix of a word
+
+    :param word: token
+    :return: tuple of category ids (empty if no prefix matches)
+    """
+
+    labels, child_lo, child_hi = self.labels, self.child_lo, self.child_hi
+    node = 0
+    best = 0 if self.cat_hi[0] > self.cat_lo[0] else -1
+    for ch in word:
+      lo, hi = child_lo[node], child_hi[node]
+      node = bisect_left(labels, ord(ch), lo, hi)
+      if node == hi or labels[node] != ord(ch):
+        break
+      if self.cat_hi[node] > self.cat_lo[node]:
+        best = node
+    if best < 0:
+      return ()
+    return tuple(self.cat_ids[self.cat_lo[best]:self.cat_hi[best]])
+
+
+
+class TermTable:
+  """
+  TermTable maps terms (full words or stems) to category ids with sorted utf-8 terms stored in flat arrays, so it can be read in place
+  from a memory-mapped file by every process, and behaves like the dictionary it replaces for lookups
+
+  :param buf: buffer of the tables (bytes or mmap)
+  :param text_pos: position of the concatenated terms in buf
+  :param offsets: array of the n + 1 offsets of the terms (relative to text_pos)
+  :param cat_offsets: array of the n + 1 offsets of the category ids of the terms in cat_ids
+  :param cat_ids: array of category ids
+  """
+
+  def __init__(self, buf, text_pos, offsets, cat_offsets, cat_ids):
+    self.buf = buf
+    self.text_pos = text_pos
+    self.offsets = offsets
+    self.cat_offsets = cat_offsets
+    self.cat_ids = cat_ids
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def get(self, word, default = None):
+    key = word.encode('utf-8')
+    buf, pos, offsets = self.buf, self.text_pos, self.offsets
+    lo, hi = 0, len(offsets) - 1
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if buf[pos + offsets[mid]:pos + offsets[mid + 1]] < key:
+        lo = mid + 1
+      else:
+        hi = mid
+    if lo < len(offsets) - 1 and buf[pos + offsets[lo]:pos + offsets[lo + 1]] == key:
+      return tuple(self.cat_ids[self.cat_offsets[lo]:self.cat_offsets[lo + 1]])
+    return default
+
+
+
+def term_arrays(terms2ids):
+  """
+  term_arrays builds the flat arrays of a TermTable
+
+  :param terms2ids: dictionary of terms -> tuple of category ids
+  :return: concatenated utf-8 terms, and arrays of term offsets, category id offsets and category ids
+  """
+
+  terms = sorted((term.encode('utf-8'), ids) for term, ids in terms2ids.items())
+  offsets = array('q', [0])
+  cat_offsets = array('i', [0])
+  cat_ids = array('i')
+  for term, ids in terms:
+    offsets.append(offsets[-1] + len(term))
+    cat_ids.extend(ids)
+    cat_offsets.append(len(cat_ids))
+  return b''.join(term for term, _ in terms), offsets, cat_offsets, cat_ids
+
+
+
+class LiwcTables:
+  """
+  LiwcTables is a file of the read-only tables of a compiled dictionary (categories, word table, prefix trie or stem table) that
+  processes memory-map instead of building or unpickling their own copy: attaching is O(1) and the pages are shared by every process
+
+  :param path: path of the tables file written by LiwcEngine.save_tables
+  """
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as f:
+      self._mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    if self._mm[:len(TABLES_MAGIC)] != TABLES_MAGIC:
+      raise ValueError(path + ' is not a LIWC tables file')
+    meta_len, = struct.unpack_from('<Q', self._mm, len(TABLES_MAGIC))
+    self.meta = json.loads(self._mm[len(TABLES_MAGIC) + 8:len(TABLES_MAGIC) + 8 + meta_len])
+    self.data_pos = len(TABLES_MAGIC) + 8 + meta_len
+    self.data_pos += -self.data_pos % 8
+
+  def array(self, name):
+    """
+    array returns a section of the file as a read-only memoryview of integers
+
+    :param name: name of the section
+    :return: memoryview
+    """
+
+    pos, length, typecode = self.meta['sections'][name]
+    return memoryview(self._mm)[self.data_pos + pos:self.data_pos + pos + length].cast(typecode)
+
+  def term_table(self, prefix):
+    return TermTable(self._mm, self.data_pos + self.meta['sections'][prefix + '_text'][0], self.array(prefix + '_offsets'),
+                     self.array(prefix + '_cat_offsets'), self.array(prefix + '_cat_ids'))
+
+
+
+class LiwcEngine:
+  """
+  LiwcEngine scores tokens against a LIWC dictionary using integer category ids and per-word caches of categories
+
+  Wildcard terms are matched with a prefix trie (the longest matching prefix counts). prefix_match = 'stem' keeps the
+  original behaviour of matching the Porter stem of the word against the stems of the prefixes.
+
+  :param categories: list of category names (the position of a category is its id)
+  :param words2categories: dictionary of full words -> category names
+  :param prefixes2categories: dictionary of wildcard prefixes -> category names
+  :param prefix_match: "trie" or "stem"
+  """
+
+  def __init__(self, categories, words2categories, prefixes2categories, prefix_match = 'trie'):
+    if prefix_match not in PREFIX_MATCH_MODES:
+      raise ValueError('Unknown prefix match ' + str(prefix_match) + ', expected one of ' + str(PREFIX_MATCH_MODES))
+    self.categories = list(categories)
+    self.cat_ids = {cat: i for i, cat in enumerate(self.categories)}
+    self.prefix_match = prefix_match
+    self.stemmer = PorterStemmer()
+
+    self.words2ids = {word: self._to_ids(cats) for word, cats in words2categories.items()}
+    if prefix_match == 'trie':
+      self.trie = PrefixTrie({prefix: self._to_ids(cats) for prefix, cats in prefixes2categories.items()})
+      self.stems2ids = None
+    else:
+      # Prefixes are matched by stem, like the original read_liwc_dictionary
+      stems2categories = {}
+      for prefix, cats in prefixes2categories.items():
+        stems2categories.setdefault(self.stemmer.stem(prefix), []).extend(cats)
+      self.stems2ids = {stem: self._to_ids(cats) for stem, cats in stems2categories.items()}
+      self.trie = None
+
+    # Caches of word -> stem and word -> category ids
+    self._stem_cache = {}
+    self._word_cache = {}
+
+  @classmethod
+  def from_csv(cls, liwc_fn, prefix_match = 'trie'):
+    return cls(*read_liwc_csv(liwc_fn), prefix_match = prefix_match)
+
+  def save_tables(self, path, key = None):
+    """
+    save_tables writes the compiled dictionary as a file of flat read-only tables that other processes attach to with attach
+
+    The tables file is also the compiled index kept across runs: its description holds the key of the dictionary it was built from,
+    so a mismatch is found by attach without reading the tables.
+
+    :param path: path of the tables file
+    :param key: key of the dictionary the engine was built from (see index_key)
+    """
+
+    tables = getattr(self, 'tables', None)
+    if tables is not None:
+      # An attached engine writes the sections of its own tables file as they are
+      sections = [(name, array(typecode, tables.array(name))) for name, (_, _, typecode) in tables.meta['sections'].items()]
+    else:
+      sections = [('word_' + name, data) for name, data in zip(['text', 'offsets', 'cat_offsets', 'cat_ids'], term_arrays(self.words2ids))]
+      if self.trie is not None:
+        sections += [('trie_' + name, array('i', getattr(self.trie, name))) for name in TRIE_ARRAYS]
+      else:
+        sections += [('stem_' + name, data) for name, data in zip(['text', 'offsets', 'cat_offsets', 'cat_ids'], term_arrays(self.stems2ids))]
+
+    # Sections start at multiples of 8 bytes, positions are relative to the end of the header (padded to 8 bytes)
+    positions = {}
+    pos = 0
+    for name, data in sections:
+      pos += -pos % 8
+      positions[name] = [pos, len(data) * data.itemsize if isinstance(data, array) else len(data), data.typecode if isinstance(data, array) else 'B']
+      pos += positions[name][1]
+    meta = json.dumps({'categories': self.categories, 'prefix_match': self.prefix_match, 'key': key, 'sections': positions}).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+      f.write(TABLES_MAGIC)
+      f.write(struct.pack('<Q', len(meta)))
+      f.write(meta)
+      for name, data in sections:
+        f.write(b'\0' * (-f.tell() % 8))
+        f.write(data if isinstance(data, bytes) else data.tobytes())
+    os.replace(tmp_path, path)
+
+  @classmethod
+  def attach(cls, path, key = None):
+    """
+    attach returns an engine that reads the tables of a file written by save_tables in place (memory-mapped), with its own caches
+
+    :param path: path of the tables file
+    :param key: expected key of the tables (see index_key), None to attach them whatever their key
+    :return: LiwcEngine, or None if the key of the tables is not the expected one
+    """
+
+    tables = LiwcTables(path)
+    if key is not None and tables.meta.get('key') != key:
+      return None
+    engine = cls.__new__(cls)
+    engine.tables = tables
+    engine.categories = tables.meta['categories']
+    engine.cat_ids = {cat: i for i, cat in enumerate(engine.categories)}
+    engine.prefix_match = tables.meta['prefix_match']
+    engine.stemmer = PorterStemmer()
+    engine.words2ids = tables.term_table('word')
+    if engine.prefix_match == 'trie':
+      engine.trie = PrefixTrie.from_arrays(*[tables.array('trie_' + name) for name in TRIE_ARRAYS])
+      engine.stems2ids = None
+    else:
+      engine.trie = None
+      engine.stems2ids = tables.term_table('stem')
+    engine._stem_cache = {}
+    engine._word_cache = {}
+    return engine
+
+  def _to_ids(self, cats):
+    return tuple(sorted(set(self.cat_ids[cat] for cat in cats)))
+
+  @property
+  def num_categories(self):
+    return len(self.categories)
+
+  def stem(self, word):
+    stem = self._stem_cache.get(word)
+    if stem is None:
+      stem = self._stem_cache[word] = self.stemmer.stem(word)
+    return stem
+
+  def word_ids(self, word):
+    """
+    word_ids returns the ids of the categories of a word (full word match and wildcard prefix match), cached per word
+
+    :param word: token
+    :return: tuple of category ids
+    """
+
+    ids = self._word_cache.get(word)
+    if ids is None:
+      cats = set(self.words2ids.get(word, ()))
+      if self.trie is not None:
+        cats.update(self.trie.longest_match(word))
+      else:
+        cats.update(self.stems2ids.get(self.stem(word), ()))
+      ids = self._word_cache[word] = tuple(sorted(cats))
+    return ids
+
+  def score_tokens(self, tokens):
+    """
+    score_tokens counts the categories of a list of tokens
+
+    :param tokens: list of tokens
+    :return: NumPy array of counts per category id
+    """
+
+    word_ids = self.word_ids
+    ids = [i for word in tokens for i in word_ids(word)]
+    return np.bincount(np.asarray(ids, dtype = np.intp), minlength = len(self.categories)).astype(np.int32)
+
+  def score_batch(self, token_lists, sparse = False):
+    """
+    score_batch counts the categories of many messages at once, looking up every unique word only once
+
+    :param token_lists: list of lists of tokens (one per message)
+    :param sparse: return a scipy.sparse CSR matrix instead of a dense NumPy array
+    :return: matrix of counts with one row per message and one column per category id
+    """
+
+    rows = []
+    cols = []
+    word_ids = self.word_ids
+    for row, tokens in enumerate(token_lists):
+      for word in tokens:
+        ids = word_ids(word)
+        if ids:
+          cols.extend(ids)
+          rows.extend([row] * len(ids))
+
+    shape = (len(token_lists), len(self.categories))
+    rows = np.asarray(rows, dtype = np.intp)
+    cols = np.asarray(cols, dtype = np.intp)
+    if sparse:
+      from scipy.sparse import csr_matrix
+      # Duplicate (row, column) entries are summed
+      return csr_matrix((np.ones(len(rows), dtype = np.int32), (rows, cols)), shape = shape)
+
+    # Counting every (row, column) pair through its position in the flattened matrix
+    counts = np.bincount(rows * shape[1] + cols, minlength = shape[0] * shape[1])
+    return counts.reshape(shape).astype(np.int32)
+
+  def counts_to_dict(self, counts):
+    """
+    counts_to_dict converts a row of category counts to a dictionary of category names and counts, sorted by count
+
+    :param counts: NumPy array of counts per category id
+    :return: dictionary of category names and counts (categories with equal counts are kept in dictionary order)
+    """
+
+    nonzero = np.flatnonzero(counts)
+    order = nonzero[np.argsort(-counts[nonzero], kind = 'stable')]
+    return {self.categories[i]: int(counts[i]) for i in order}
+
+
+
+def tokenize(text):
+  """
+  tokenize splits cleaned message content into the tokens that are scored
+
+  :param text: cleaned message content ("all content")
+  :return: list of tokens
+  """
+
+  return text.split()
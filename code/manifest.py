@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+from serializer import get_json_backend
+
+
+
+# Name of the manifest file in the output directory
+MANIFEST_FN = 'manifest.json'
+
+
+
+def file_digest(path):
+  """
+  file_digest returns the md5 hash of the contents of a file
+
+  :param path: path of the file
+  :return: hexadecimal md5 hash
+  """
+
+  md5 = hashlib.md5()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+      md5.update(chunk)
+  return md5.hexdigest()
+
+
+
+def run_config(seed_val, list_rem_gen, list_rem_thread, list_rem_blk, path_liwc_dict, liwc_prefix_match, output_format, token_ids = False, keep_epoch = False,
+               members_csv = None):
+  """
+  run_config collects every setting that changes the output of a day file, so a change forces a full rebuild
+
+  :param seed_val: parameter added to every token before hashing (only its md5 hash is stored)
+  :param list_rem_gen: list of general keys to be removed from each message JSON
+  :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
+  :param list_rem_blk: list of keys under "blocks" to be removed
+  :param path_liwc_dict: name of .csv file that contains the LIWC dictionary (its contents are hashed)
+  :param liwc_prefix_match: how LIWC wildcard terms are matched
+  :param output_format: format of the processed day files
+  :param token_ids: whether "hashed content" is written as packed token codes
+  :param keep_epoch: whether numeric time stamps are kept
+  :param members_csv: .csv file of workspace users whose user IDs are hashed (its contents are hashed, None if user IDs are kept)
+  :return: dictionary of settings
+  """
+
+  return {'seed_md5': hashlib.md5(str(seed_val).encode()).hexdigest(),
+          'list_rem_gen': list(list_rem_gen),
+          'list_rem_thread': list(list_rem_thread),
+          'list_rem_blk': list(list_rem_blk),
+          'liwc_md5': file_digest(path_liwc_dict),
+          'liwc_prefix_match': liwc_prefix_match,
+          'output_format': output_format,
+          'token_ids': token_ids,
+          'keep_epoch': keep_epoch,
+          'members_md5': file_digest(members_csv) if members_csv else None}
+
+
+
+def load_manifest(output_dir):
+  """
+  load_manifest reads the manifest of the previous run
+
+  :param output_dir: directory of the output of data
+  :return: manifest dictionary, or None if there is no manifest
+  """
+
+  path = os.path.join(output_dir, MANIFEST_FN)
+  if not os.path.exists(path):
+    return None
+  with open(path, 'rb') as f:
+    return get_json_backend().load(f)
+
+
+
+def save_manifest(output_dir, manifest):
+  """
+  save_manifest writes the manifest of this run, replacing the previous one only once it is completely written
+
+  :param output_dir: directory of the output of data
+  :param manifest: manifest dictionary
+  """
+
+  path = os.path.join(output_dir, MANIFEST_FN)
+  with open(path + '.tmp', 'wb') as f:
+    get_json_backend().dump(manifest, f, pretty = True)
+  os.replace(path + '.tmp', path)
+
+
+
+def day_entry(channels_dir, channel_name, day, prev_entry = None, digest = True):
+  """
+  day_entry describes an input day file by size, modification time and content hash
+
+  The content hash of the previous run is reused when size and modification time did not change. Otherwise the file is only read to
+  hash it if digest is set, e.g. by incremental runs that tell a touched day file from a changed one; full runs leave "md5" empty rather
+  than reading every day file an extra time.
+
+  :param channels_dir: path to directory that contains the exported Slack workspace
+  :param channel_name: name of the Slack channel
+  :param day: name of the day file
+  :param prev_entry: entry of the day file in the previous manifest (None if it is new)
+  :param digest: hash the contents of the day file when they cannot be reused from prev_entry
+  :return: dictionary with "day", "size", "mtime" and "md5" (None if the contents were not hashed)
+  """
+
+  path = os.path.join(channels_dir, channel_name, day)
+  stat = os.stat(path)
+  entry = {'day': day, 'size': stat.st_size, 'mtime': stat.st_mtime}
+  if prev_entry and prev_entry.get('size') == entry['size'] and prev_entry.get('mtime') == entry['mtime']:
+    entry['md5'] = prev_entry.get('md5')
+  else:
+    entry['md5'] = file_digest(path) if digest else None
+  return entry
+
+
+
+def same_day_file(entry, prev_entry):
+  """
+  same_day_file checks whether a day file is unchanged since an entry was recorded (in a manifest or a journal): same size and
+  modification time, or same content hash if both entries have one
+
+  :param entry: current entry of the day file (see day_entry)
+  :param prev_entry: recorded entry of the day file (None if there is none)
+  :return: True or False
+  """
+
+  if prev_entry is None:
+    return False
+  if prev_entry.get('size') == entry['size'] and prev_entry.get('mtime') == entry['mtime']:
+    return True
+  return entry['md5'] is not None and entry['md5'] == prev_entry.get('md5')
+
+
+
+def plan_incremental(channels_dir, channel_list, prev_manifest, channel_days = None, digest = True):
+  """
+  plan_incremental compares the input day files with the manifest of the previous run
+
+  :param channels_dir: path to directory that contains the exported Slack workspace
+  :param channel_list: list of channel names in the workspace
+  :param prev_manifest: manifest of the previous run (None if everything has to be processed)
+  :param channel_days: dictionary of channel name -> list of day files of the run (None lists every day file, e.g. a shard)
+  :param digest: hash the contents of day files whose size or modification time changed (see day_entry)
+  :return: dictionary of channel name -> list of new or changed day files, dictionary of channel name -> list of removed day files,
+           list of removed channels, and dictionary of channel name -> dictionary of day file name -> day entry
+  """
+
+  prev_channels = prev_manifest['channels'] if prev_manifest else {}
+  changed_days = {}
+  removed_days = {}
+  day_entries = {}
+  for channel_name in channel_list:
+    prev_entries = {entry['day']: entry for entry in prev_channels.get(channel_name, {}).get('days', [])}
+    days = os.listdir(os.path.join(channels_dir, channel_name)) if channel_days is None else channel_days[channel_name]
+    day_entries[channel_name] = {day: day_entry(channels_dir, channel_name, day, prev_entries.get(day), digest) for day in days}
+    changed_days[channel_name] = [day for day in days if not same_day_file(day_entries[channel_name][day], prev_entries.get(day))]
+    removed_days[channel_name] = [day for day in prev_entries if day not in day_entries[channel_name]]
+  removed_channels = [channel_name for channel_name in prev_channels if channel_name not in channel_list]
+  return changed_days, removed_days, removed_channels, day_entries
+
+
+
+def split_by_day(msgs, day_counts):
+  """
+  split_by_day splits the unprocessed messages of a channel (written in day order) back into the messages of every day file
+
+  :param msgs: list of unprocessed messages of the channel
+  :param day_counts: list of (day file name, number of unprocessed messages) in the order they were written
+  :return: dictionary of day file name -> list of unprocessed messages
+  """
+
+  per_day = {}
+  pos = 0
+  for day, count in day_counts:
+    per_day[day] = msgs[pos:pos + count]
+    pos += count
+  return per_day
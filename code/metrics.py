@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import cProfile
+import pstats
+from serializer import get_json_backend
+
+
+
+# Stages of the pipeline that are timed, in processing order
+STAGES = ['json_read', 'rem_items', 'flatten_blocks', 'clean_text', 'hash_all_text', 'body_to_liwc', 'json_write']
+# Name of the run metrics file in the output directory
+METRICS_FN = 'run_metrics.json'
+# Name of the merged profile in the output directory
+PROFILE_FN = 'profile.pstats'
+
+
+
+class RunMetrics:
+  """
+  RunMetrics accumulates wall time, number of calls and bytes processed per channel and stage
+
+  Bytes are the size of the files read or written for the JSON stages and the number of characters of message content for the text stages.
+  Worker processes hand their counters to the parent with take, and the parent adds them up with merge.
+  """
+
+  def __init__(self):
+    self.start = time.perf_counter()
+    # Channel name -> stage -> [seconds, calls, bytes]
+    self.channels = {}
+
+  def add(self, channel_name, stage, seconds, calls = 1, num_bytes = 0):
+    stages = self.channels.get(channel_name)
+    if stages is None:
+      stages = self.channels[channel_name] = {}
+    counters = stages.get(stage)
+    if counters is None:
+      counters = stages[stage] = [0.0, 0, 0]
+    counters[0] += seconds
+    counters[1] += calls
+    counters[2] += num_bytes
+
+  def take(self):
+    """
+    take returns the counters accumulated so far and starts new ones
+
+    :return: dictionary of channel name -> stage -> [seconds, calls, bytes]
+    """
+
+    channels = self.channels
+    self.channels = {}
+    return channels
+
+  def merge(self, channels):
+    """
+    merge adds the counters of another process
+
+    :param channels: dictionary of channel name -> stage -> [seconds, calls, bytes] (as returned by take)
+    """
+
+    for channel_name, stages in channels.items():
+      for stage, (seconds, calls, num_bytes) in stages.items():
+        self.add(channel_name, stage, seconds, calls, num_bytes)
+
+  def summary(self):
+    """
+    summary returns the counters per stage (over all channels) and per channel and stage
+
+    :return: dictionary with "wall_sec", "stages" and "channels"
+    """
+
+    def to_dict(counters):
+      return {'seconds': round(counters[0], 6), 'calls': counters[1], 'bytes': counters[2]}
+
+    def stage_order(stage):
+      return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage)
+
+    totals = {}
+    for stages in self.channels.values():
+      for stage, counters in stages.items():
+        total = totals.setdefault(stage, [0.0, 0, 0])
+        for i, val in enumerate(counters):
+          total[i] += val
+    return {'wall_sec': round(time.perf_counter() - self.start, 6),
+            'stages': {stage: to_dict(totals[stage]) for stage in sorted(totals, key = stage_order)},
+            'channels': {channel_name: {stage: to_dict(stages[stage]) for stage in sorted(stages, key = stage_order)}
+                         for channel_name, stages in sorted(self.channels.items())}}
+
+  def save(self, output_dir, **extra):
+    """
+    save writes the summary (and any other statistics of the run) to the run metrics file in the output directory
+
+    :param output_dir: directory of the output of data
+    :param extra: other statistics of the run added to the summary (e.g. worker usage)
+    :return: path of the run metrics file
+    """
+
+    summary = self.summary()
+    summary.update(extra)
+    path = os.path.join(output_dir, METRICS_FN)
+    with open(path, 'wb') as f:
+      get_json_backend().dump(summary, f, pretty = True)
+    return path
+
+  def print_summary(self):
+    for stage, counters in self.summary()['stages'].items():
+      print('Stage {}: {:.3f} s, {} calls, {} bytes'.format(stage, counters['seconds'], counters['calls'], counters['bytes']))
+
+
+
+# Metrics of this process (None when metrics are disabled, so the pipeline only pays for a None check)
+_run_metrics = None
+
+
+
+def enable_run_metrics():
+  """
+  enable_run_metrics starts collecting metrics in this process (keeping the metrics collected so far if already enabled)
+
+  :return: RunMetrics
+  """
+
+  global _run_metrics
+  if _run_metrics is None:
+    _run_metrics = RunMetrics()
+  return _run_metrics
+
+
+
+def disable_run_metrics():
+  global _run_metrics
+  _run_metrics = None
+
+
+
+def get_run_metrics():
+  return _run_metrics
+
+
+
+# Profiler of this worker process, kept across the work units it processes
+_worker_profiler = None
+
+
+
+def worker_profiler():
+  """
+  worker_profiler returns the cProfile profiler of this worker process, starting a new one on the first call
+
+  :return: cProfile.Profile
+  """
+
+  global _worker_profiler
+  if _worker_profiler is None:
+    _worker_profiler = cProfile.Profile()
+  return _worker_profiler
+
+
+
+def timed_iter(iterable, elapsed):
+  """
+  timed_iter yields the items of an iterator, adding the time spent producing them to elapsed[0]
+
+  :param iterable: iterable (e.g. generator of messages read from a day file)
+  :param elapsed: list whose first item accumulates the time in seconds
+  :return: generator of items
+  """
+
+  it = iter(iterable)
+  while True:
+    start = time.perf_counter()
+    try:
+      item = next(it)
+    except StopIteration:
+      elapsed[0] += time.perf_counter() - start
+      return
+    elapsed[0] += time.perf_counter() - start
+    yield item
+
+
+
+def merge_profiles(profile_paths, output_dir, num_lines = 20):
+  """
+  merge_profiles combines the cProfile statistics of the parent and worker processes into one file and prints the top functions
+
+  :param profile_paths: list of paths of .pstats files
+  :param output_dir: directory of the output of data
+  :param num_lines: number of functions printed (by cumulative time)
+  :return: path of the merged profile
+  """
+
+  path = os.path.join(output_dir, PROFILE_FN)
+  stats = pstats.Stats(*profile_paths)
+  stats.dump_stats(path)
+  stats.sort_stats('cumulative').print_stats(num_lines)
+  return path
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import re
+import contractions
+
+
+
+# Patterns used to tag numbers and sentence endings and to drop everything else that is not a letter
+_NUM_RE = re.compile(r'[0-9]+')
+_SENTEND_RE = re.compile(r'[\?|!|\.]+')
+_NON_ALPHA_RE = re.compile(r'[^A-Za-z]+')
+
+# Patterns used to collapse repeated tags and whitespace in the combined message content
+_NUM_RUN_RE = re.compile(r'(NUM *)+')
+_SENT_END_RUN_RE = re.compile(r'(SENT_END *)+')
+# Ordinal suffixes after a number are the only edit whose result depends on how often the content is cleaned
+_ORDINAL_RE = re.compile(r'NUM\s*(?:th|st|nd)')
+
+# Abbreviations expanded whenever a word contains them, in the order they are checked
+_ABBREVIATIONS = (('e.g', 'example'), ('vs', 'versus'), ('i.e', 'that is'))
+
+# Precomputed contraction table: lowercased word -> lowercased expansion (only words that change are stored)
+_contraction_table = {}
+_contraction_seen = set()
+
+
+
+def expand_contraction(word):
+  """
+  expand_contraction returns the lowercased expansion of a single lowercased word, using a precomputed table
+
+  :param word: lowercased token
+  :return: expanded token, or the token itself if there is nothing to expand
+  """
+
+  if word in _contraction_seen:
+    return _contraction_table.get(word, word)
+
+  expanded = contractions.fix(word).lower()
+  _contraction_seen.add(word)
+  if expanded != word:
+    _contraction_table[word] = expanded
+  return expanded
+
+
+
+def normalize_text(text):
+  """
+  normalize_text removes unnecessary characters and punctuations in text content, producing the same output as the original clean_text
+
+  The contraction table is consulted once per word and the whole text is only rewritten for the few words that actually expand,
+  so the cost is linear in the length of the text for ordinary messages.
+
+  :param text: any string
+  :return: modified string
+  """
+
+  # Replacing certain sets of characters with spaces and lowercasing all text
+  text = text.replace('\xa0', ' ').replace('\r', ' ').replace('\t', ' ').lower()
+
+  # Expanding contractions or abbreviations
+  # Replacements are applied to the whole text in word order, exactly like the original word-by-word loop
+  for word in text.split():
+    expanded = expand_contraction(word)
+    if expanded != word:
+      text = text.replace(word, expanded)
+    for abbr, repl in _ABBREVIATIONS:
+      if abbr in word:
+        text = text.replace(abbr, repl)
+
+  # Tagging numbers and sentence endings, folding accents and removing all other non-letters
+  text = _NUM_RE.sub(' NUM ', text)
+  text = _SENTEND_RE.sub(' SENTEND ', text)
+  text = text.replace('é', 'e').replace('è', 'e')
+  text = _NON_ALPHA_RE.sub(' ', text)
+
+  return text.replace('SENTEND', 'SENT_END')
+
+
+
+def collapse_repeats(text):
+  """
+  collapse_repeats removes any repetitions of NUM, SENT_END or newline characters, producing the same output as the original clean_repeats_in_text
+
+  :param text: any string
+  :return: modified string
+  """
+
+  # Whitespace is collapsed by splitting, which also turns every newline into a single space
+  text = ' '.join(text.split())
+
+  # Passes are skipped when the tag they collapse does not occur at all
+  if 'NUM' in text:
+    text = text.replace('NUM th', 'NUM').replace('NUM st', 'NUM').replace('NUM nd', 'NUM')
+    text = _NUM_RUN_RE.sub(' NUM ', text)
+  if 'SENT_END' in text:
+    text = _SENT_END_RUN_RE.sub(' SENT_END ', text)
+
+  return ' '.join(text.split())
+
+
+
+def combine_contents(contents):
+  """
+  combine_contents joins the cleaned contents of all elements of a message into a single string
+
+  The original combine_blk_content collapsed repeats after every element was appended. Collapsing once over the joined string
+  gives the same result as long as no number is followed by an ordinal suffix, so the element-by-element collapse is only
+  replayed from the element where the first such suffix appears.
+
+  :param contents: list of cleaned element contents
+  :return: combined content string
+  """
+
+  if not contents:
+    return ''
+
+  joined = ' ' + ' '.join(contents)
+  match = _ORDINAL_RE.search(joined)
+  if match is None:
+    return collapse_repeats(joined)
+
+  # Finding the element that completes the first ordinal suffix (every element is preceded by a space in the joined string)
+  pos = 0
+  for first_replay, content in enumerate(contents):
+    pos += len(content) + 1
+    if pos >= match.end():
+      break
+
+  # Elements before it are collapsed in a single pass, the remaining ones are appended and collapsed one by one
+  combined = collapse_repeats(' ' + ' '.join(contents[:first_replay])) if first_replay else ''
+  for content in contents[first_replay:]:
+    combined = collapse_repeats(combined + ' ' + content)
+  return combined
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import queue
+import threading
+from collections import namedtuple
+
+
+
+# Number of day files read ahead of processing and of processed day files waiting to be written (0 disables pipelining)
+DEFAULT_PIPELINE_DEPTH = 2
+# Stages recorded in the run metrics when pipelining: time the processing thread waited for a read or for room in the write queue
+PIPELINE_STAGES = ['read_wait', 'write_wait']
+
+# Day file read by the prefetch thread: path, contents (bytes), seconds spent reading it and seconds the consumer waited for it
+PrefetchedFile = namedtuple('PrefetchedFile', ['path', 'data', 'read_sec', 'wait_sec'])
+
+_DONE = object()
+
+
+
+class DayPrefetcher:
+  """
+  DayPrefetcher reads day files in a background thread while earlier day files are processed
+
+  At most depth files are held in memory: the thread blocks once the queue is full until the consumer takes the next file.
+  Errors raised while reading are raised again by the iterator, for the file that failed.
+
+  :param paths: list of paths of the day files, in processing order
+  :param depth: maximum number of files read ahead
+  """
+
+  def __init__(self, paths, depth = DEFAULT_PIPELINE_DEPTH):
+    self._queue = queue.Queue(maxsize = max(depth, 1))
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target = self._run, args = (list(paths),), daemon = True)
+    self._thread.start()
+
+  def _put(self, item):
+    # Waiting for room in the queue, unless the consumer stopped early
+    while not self._stop.is_set():
+      try:
+        self._queue.put(item, timeout = 0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def _run(self, paths):
+    for path in paths:
+      start = time.perf_counter()
+      try:
+        with open(path, 'rb') as f:
+          item = (path, f.read(), time.perf_counter() - start, None)
+      except OSError as e:
+        item = (path, None, time.perf_counter() - start, e)
+      if not self._put(item):
+        return
+    self._put(_DONE)
+
+  def __iter__(self):
+    while True:
+      start = time.perf_counter()
+      item = self._queue.get()
+      if item is _DONE:
+        return
+      path, data, read_sec, error = item
+      if error is not None:
+        raise error
+      yield PrefetchedFile(path, data, read_sec, time.perf_counter() - start)
+
+  def close(self):
+    self._stop.set()
+    self._thread.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+
+class AsyncWriter:
+  """
+  AsyncWriter serializes and writes processed day files in a background thread while the next day files are processed
+
+  Jobs wait in a queue of at most depth day files, so submit blocks (back-pressure) when writing falls behind processing.
+  The first error raised by a job is raised again by the next submit or by close, and later jobs are skipped.
+
+  :param depth: maximum number of jobs waiting to be written
+  """
+
+  def __init__(self, depth = DEFAULT_PIPELINE_DEPTH):
+    self._queue = queue.Queue(maxsize = max(depth, 1))
+    self._error = None
+    # (key, seconds) of every job that was written, in order
+    self.timings = []
+    self._thread = threading.Thread(target = self._run, daemon = True)
+    self._thread.start()
+
+  def _run(self):
+    while True:
+      job = self._queue.get()
+      if job is _DONE:
+        return
+      if self._error is not None:
+        continue
+      key, func, args = job
+      start = time.perf_counter()
+      try:
+        func(*args)
+      except BaseException as e:
+        self._error = e
+        continue
+      if key is not None:
+        self.timings.append((key, time.perf_counter() - start))
+
+  def submit(self, key, func, *args):
+    """
+    submit queues a write job, blocking while the queue is full
+
+    :param key: identifies the job in timings (e.g. channel name and output path), None to leave it out
+    :param func: function that writes the output
+    :param args: arguments of func
+    :return: seconds spent waiting for room in the queue
+    """
+
+    if self._error is not None:
+      raise self._error
+    start = time.perf_counter()
+    self._queue.put((key, func, args))
+    return time.perf_counter() - start
+
+  def close(self):
+    """
+    close waits until every queued job is written
+    """
+
+    self._queue.put(_DONE)
+    self._thread.join()
+    if self._error is not None:
+      raise self._error
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, *exc):
+    if exc_type is None:
+      self.close()
+    else:
+      # Not raising a write error over the error that is already propagating
+      self._queue.put(_DONE)
+      self._thread.join()
+
+
+
+def iter_pipelined(items, paths, depth, write_metrics = None):
+  """
+  iter_pipelined reads the files of a list of work items ahead of processing and writes their outputs in the background
+
+  The writer is closed (every output written) when the generator is exhausted, and the time spent writing every output is then added to
+  write_metrics with its key (channel name and output path).
+
+  :param items: list of work items (e.g. day file names)
+  :param paths: list of paths of the files read for every item
+  :param depth: maximum number of files read ahead and of outputs waiting to be written (0 disables pipelining)
+  :param write_metrics: RunMetrics that write times are added to as json_write (None to skip)
+  :return: generator of (item, PrefetchedFile, AsyncWriter), or (item, None, None) when pipelining is disabled
+  """
+
+  if not depth:
+    for item in items:
+      yield item, None, None
+    return
+
+  with DayPrefetcher(paths, depth) as prefetcher, AsyncWriter(depth) as writer:
+    for item, prefetched in zip(items, prefetcher):
+      yield item, prefetched, writer
+  if write_metrics is not None:
+    for (channel_name, out_path), seconds in writer.timings:
+      write_metrics.add(channel_name, 'json_write', seconds, num_bytes = os.path.getsize(out_path))
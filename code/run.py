@@ -1,19 +1,103 @@
 import sys
-from utils_slack import *
+import argparse
+from utils import *
 
-parallelize = True if sys.argv[1].lower() == 'parallel' or sys.argv[1].lower() == 'p' else False
-data_dir = sys.argv[2]
-seed_val = sys.argv[3]
-os.chdir(data_dir)
+parser = argparse.ArgumentParser(description = 'Process and hash an exported Slack workspace')
+parser.add_argument('mode', help = '"sequential" (s) or "parallel" (p), or "merge" to combine the outputs of --shard-count shards into slack_output')
+parser.add_argument('data_dir', help = 'directory of the exported Slack workspace')
+parser.add_argument('seed_val', nargs = '?', default = None, help = 'parameter added to every token before hashing (not needed to merge)')
+parser.add_argument('--output-format', default = 'json', choices = OUTPUT_FORMATS + COLUMNAR_FORMATS,
+                    help = '"json" writes pretty-printed day files, "compact" and "jsonl" stream day files message by message, '
+                           '"parquet" writes columnar day files with one column per LIWC category')
+parser.add_argument('--liwc-stem-prefixes', action = 'store_true',
+                    help = 'match LIWC wildcard terms by Porter stem (original behaviour) instead of longest prefix')
+parser.add_argument('--workers', type = int, default = None,
+                    help = 'number of worker processes in parallel mode (default: number of CPUs)')
+parser.add_argument('--chunk-size', type = int, default = 1,
+                    help = 'number of day files sent to a worker process at a time in parallel mode')
+parser.add_argument('--pipeline-depth', type = int, default = 0,
+                    help = 'number of day files read ahead and written in background threads while the next one is processed '
+                           '(0 disables; in parallel mode use --chunk-size larger than 1)')
+parser.add_argument('--json-backend', default = 'auto', choices = ['auto'] + JSON_BACKENDS,
+                    help = 'library that parses and serializes JSON, "auto" picks the fastest one installed (orjson, ujson, then json)')
+parser.add_argument('--members-csv', default = None,
+                    help = '.csv file of workspace users (userid, email), relative to the export directory, whose user IDs are replaced with hashed email IDs '
+                           '(keyed with the seed) in user fields and mentions, the mapping is written to slack_output/hash_dict_ids.json')
+parser.add_argument('--hash-spill-size', type = int, default = DEFAULT_SPILL_SIZE,
+                    help = 'number of tokens and hashes a process holds before writing them to a sorted run, which are merged into '
+                           'slack_output/hash_dict.json sorted by token')
+parser.add_argument('--start-method', default = None, choices = ['fork', 'spawn', 'forkserver'],
+                    help = 'start method of the worker processes in parallel mode (default: the default of the platform)')
+parser.add_argument('--shard-index', type = int, default = 0,
+                    help = 'index of the shard processed by this run (from 0), with --shard-count')
+parser.add_argument('--shard-count', type = int, default = None,
+                    help = 'number of shards the day files are split into (by size and a stable hash, the same on every machine), '
+                           'each shard is processed into slack_output_shards/shard-<index>-of-<count> with zero-padded numbers (e.g. shard-000-of-002) and combined by the merge mode')
+parser.add_argument('--checkpoint-every', type = int, default = DEFAULT_CHECKPOINT_EVERY,
+                    help = 'number of day files a process writes between checkpoints, which journal the completed day files and their tokens '
+                           'so an interrupted run can be resumed (0 disables)')
+parser.add_argument('--resume', action = 'store_true',
+                    help = 'continue the run interrupted in the output directory from its checkpoints, skipping the day files it completed '
+                           '(with the same mode, settings and shard)')
+parser.add_argument('--incremental', action = 'store_true',
+                    help = 'only process day files that are new or changed since the previous run')
+parser.add_argument('--token-ids', action = 'store_true',
+                    help = 'write "hashed content" as packed 32-bit token codes ("hashed ids"), rendered back with slack_output/vocab.bin')
+parser.add_argument('--keep-epoch', action = 'store_true',
+                    help = 'also keep the unix time stamps of messages and replies as numbers ("ts_epoch") for sorting')
+parser.add_argument('--metrics', action = 'store_true',
+                    help = 'write the time, calls and bytes of every stage per channel to run_metrics.json in the output directory')
+parser.add_argument('--profile', action = 'store_true',
+                    help = 'profile the run with cProfile (including worker processes) and write profile.pstats to the output directory')
+# Worker processes started with spawn or forkserver import this script, which must not run again
+if __name__ == '__main__':
+  args = parser.parse_args()
+  if args.mode.lower() == 'merge':
+    if not args.shard_count:
+      parser.error('the merge mode needs --shard-count')
+    merge_shards(os.path.abspath(args.data_dir), args.shard_count, args.hash_spill_size)
+    sys.exit()
+  if args.seed_val is None:
+    parser.error('the seed_val argument is required')
+  shard = (args.shard_index, args.shard_count) if args.shard_count else None
 
-process_workspace(path_liwc_dict = 'liwc2007dictionary_poster.csv',
-                  channels_dir = data_dir, 
-                  list_rem_gen = ['text', 'reactions', 'type', 'user_team', 'source_team', 'user_profile', 'attachments', 'files', 'upload', 'display_as_bot', 'edited', 'thread_ts'],
-                  list_rem_thread = ['reply_count', 'reply_users_count', 'latest_reply','is_locked', 'subscribed', 'last_read', 'thread_ts', 'reply_users'], 
-                  list_rem_blk = ['type', 'block_id'], 
-                  print_cond = False, 
-                  seed_val = seed_val,
-                  parallel = parallelize)
+  parallelize = True if args.mode.lower() == 'parallel' or args.mode.lower() == 'p' else False
+  data_dir = args.data_dir
+  seed_val = args.seed_val
+  # Token hashes are cached next to the output directory so nightly runs skip hashing known vocabulary
+  hash_cache_path = os.path.join(os.path.abspath(os.path.join(data_dir, os.pardir)), 'hash_cache.bin')
+  # The compiled LIWC dictionary is kept next to it and rebuilt whenever the .csv file changes
+  liwc_index_path = os.path.join(os.path.abspath(os.path.join(data_dir, os.pardir)), 'liwc_index.bin')
+  if shard is not None:
+    # Shards running on the same machine keep their own files
+    hash_cache_path = '{}.shard-{}-of-{}{}'.format(os.path.splitext(hash_cache_path)[0], *shard, os.path.splitext(hash_cache_path)[1])
+    liwc_index_path = '{}.shard-{}-of-{}{}'.format(os.path.splitext(liwc_index_path)[0], *shard, os.path.splitext(liwc_index_path)[1])
+  os.chdir(data_dir)
 
-# Generate dictionary of user IDs and hashed email IDs (If applicable)
-#hash_ids('members.csv')
\ No newline at end of file
+  process_workspace(path_liwc_dict = 'liwc2007dictionary_poster.csv',
+                    channels_dir = data_dir, 
+                    list_rem_gen = ['text', 'reactions', 'type', 'user_team', 'source_team', 'user_profile', 'attachments', 'files', 'upload', 'display_as_bot', 'edited', 'thread_ts'],
+                    list_rem_thread = ['reply_count', 'reply_users_count', 'latest_reply','is_locked', 'subscribed', 'last_read', 'thread_ts', 'reply_users'], 
+                    list_rem_blk = ['type', 'block_id'], 
+                    print_cond = False, 
+                    seed_val = seed_val,
+                    parallel = parallelize,
+                    hash_cache_path = hash_cache_path,
+                    output_format = args.output_format,
+                    liwc_prefix_match = 'stem' if args.liwc_stem_prefixes else 'trie',
+                    liwc_index_path = liwc_index_path,
+                    num_workers = args.workers,
+                    chunk_size = args.chunk_size,
+                    incremental = args.incremental,
+                    collect_metrics = args.metrics,
+                    profile = args.profile,
+                    token_ids = args.token_ids,
+                    keep_epoch = args.keep_epoch,
+                    pipeline_depth = args.pipeline_depth,
+                    json_backend = args.json_backend,
+                    members_csv = args.members_csv,
+                    hash_spill_size = args.hash_spill_size,
+                    start_method = args.start_method,
+                    shard = shard,
+                    checkpoint_every = args.checkpoint_every,
+                    resume = args.resume)
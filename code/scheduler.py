@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+
+
+def plan_day_units(channels_dir, channel_list, channel_days = None):
+  """
+  plan_day_units splits the channels of a workspace into (channel, day file) work units, largest day files first
+
+  Scheduling the largest units first keeps a single huge channel from occupying one worker long after the others finish.
+
+  :param channels_dir: path to directory that contains the exported Slack workspace
+  :param channel_list: list of channel names to be processed
+  :param channel_days: dictionary of channel name -> list of day files to be processed (None processes every day file)
+  :return: list of (channel name, day file name, size in bytes) tuples
+  """
+
+  units = []
+  for channel_name in channel_list:
+    channel_path = os.path.join(channels_dir, channel_name)
+    days = os.listdir(channel_path) if channel_days is None else channel_days[channel_name]
+    for day in days:
+      units.append((channel_name, day, os.path.getsize(os.path.join(channel_path, day))))
+  # Sorting by size (descending), then by name so the order is the same on every run
+  units.sort(key = lambda unit: (-unit[2], unit[0], unit[1]))
+  return units
+
+
+
+class WorkerUsage:
+  """
+  WorkerUsage accumulates the busy time reported by every worker process to summarize how well the pool was utilized
+  """
+
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.busy = {}
+    self.units = {}
+
+  def add(self, worker_id, busy_time):
+    self.busy[worker_id] = self.busy.get(worker_id, 0.0) + busy_time
+    self.units[worker_id] = self.units.get(worker_id, 0) + 1
+
+  def summary(self):
+    """
+    summary returns the number of units, busy time and utilization (busy time / wall time of the pool) per worker
+
+    :return: dictionary of worker id -> dictionary of statistics
+    """
+
+    wall_time = max(time.perf_counter() - self.start, 1e-9)
+    return {worker_id: {'units': self.units[worker_id], 'busy_sec': round(busy, 3), 'utilization': round(busy / wall_time, 3)}
+            for worker_id, busy in sorted(self.busy.items())}
+
+  def print_summary(self):
+    for worker_id, stats in self.summary().items():
+      print('Worker {}: {} day files, busy {:.2f} s, utilization {:.0%}'.format(worker_id, stats['units'], stats['busy_sec'], stats['utilization']))
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import json
+try:
+  import orjson
+except ImportError:
+  orjson = None
+try:
+  import ujson
+except ImportError:
+  ujson = None
+
+
+
+# JSON backends in order of preference ("auto" picks the first one that is installed)
+JSON_BACKENDS = ['orjson', 'ujson', 'json']
+# Indentation of pretty-printed files
+PRETTY_INDENT = 4
+
+
+
+class JsonBackend:
+  """
+  JsonBackend parses and serializes JSON with one library, from and to UTF-8 bytes so files never have to be decoded into strings
+
+  Every backend gives the same values back (floats may be written with a different exponent notation, e.g. 1e16 and 1e+16).
+  Compact output has no whitespace. Pretty-printed output is indented by 4 spaces, which orjson does not support, so it always goes
+  through the stdlib encoder and pretty-printed files are the same whatever the backend.
+
+  :param name: one of JSON_BACKENDS
+  """
+
+  def __init__(self, name):
+    if name not in JSON_BACKENDS:
+      raise ValueError('Unknown JSON backend ' + str(name) + ', expected one of ' + str(JSON_BACKENDS))
+    if (name == 'orjson' and orjson is None) or (name == 'ujson' and ujson is None):
+      raise ImportError('The ' + name + ' JSON backend is not installed (pip install ' + name + ')')
+    self.name = name
+
+  def loads(self, data):
+    """
+    loads parses a JSON document
+
+    :param data: bytes (UTF-8) or string
+    :return: parsed value
+    """
+
+    if self.name == 'orjson':
+      return orjson.loads(data)
+    if self.name == 'ujson':
+      return ujson.loads(data)
+    return json.loads(data)
+
+  def dumps(self, obj, pretty = False):
+    """
+    dumps serializes a value to UTF-8 bytes, non-ASCII characters are written as they are
+
+    :param obj: value made of dictionaries (string keys), lists, strings, numbers, booleans and None
+    :param pretty: indent the output by PRETTY_INDENT spaces instead of writing it compact
+    :return: bytes
+    """
+
+    if pretty:
+      return json.dumps(obj, ensure_ascii = False, indent = PRETTY_INDENT).encode('utf-8')
+    if self.name == 'orjson':
+      return orjson.dumps(obj)
+    if self.name == 'ujson':
+      return ujson.dumps(obj, ensure_ascii = False, escape_forward_slashes = False).encode('utf-8')
+    return json.dumps(obj, ensure_ascii = False, separators = (',', ':')).encode('utf-8')
+
+  def load(self, f):
+    """
+    load parses the JSON document of a file
+
+    :param f: file object opened in binary mode
+    :return: parsed value
+    """
+
+    return self.loads(f.read())
+
+  def dump(self, obj, f, pretty = False):
+    """
+    dump serializes a value to a file
+
+    :param obj: value to serialize
+    :param f: file object opened in binary mode
+    :param pretty: indent the output instead of writing it compact
+    """
+
+    f.write(self.dumps(obj, pretty))
+
+
+
+def available_backends():
+  """
+  available_backends returns the JSON backends that are installed, in order of preference
+
+  :return: list of backend names
+  """
+
+  return [name for name, module in zip(JSON_BACKENDS, [orjson, ujson, json]) if module is not None]
+
+
+
+# Backend used by this process (set by set_json_backend, the fastest installed one by default)
+_json_backend = None
+
+
+
+def set_json_backend(name = 'auto'):
+  """
+  set_json_backend selects the JSON backend used by this process
+
+  :param name: one of JSON_BACKENDS, or "auto" for the fastest one installed
+  :return: JsonBackend
+  """
+
+  global _json_backend
+  _json_backend = JsonBackend(available_backends()[0] if name == 'auto' else name)
+  return _json_backend
+
+
+
+def get_json_backend():
+  """
+  get_json_backend returns the JSON backend used by this process
+
+  :return: JsonBackend
+  """
+
+  if _json_backend is None:
+    return set_json_backend()
+  return _json_backend
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+from scheduler import plan_day_units
+
+
+
+# Directory of the outputs of the shards of a workspace, next to slack_output (one directory per shard)
+SHARDS_DIR = 'slack_output_shards'
+
+
+
+def stable_hash(key):
+  """
+  stable_hash returns a hash of a string that is the same in every process and on every machine (unlike hash())
+
+  :param key: string
+  :return: 64-bit integer
+  """
+
+  return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+
+def check_shard(shard_index, num_shards):
+  if num_shards < 1 or not 0 <= shard_index < num_shards:
+    raise ValueError('Invalid shard {} of {}, expected 0 <= shard index < shard count'.format(shard_index, num_shards))
+
+
+
+def shard_output_dir(channels_dir, shard_index, num_shards):
+  """
+  shard_output_dir returns the output directory of a shard
+
+  :param channels_dir: path to directory that contains the exported Slack workspace
+  :param shard_index: index of the shard (from 0)
+  :param num_shards: number of shards
+  :return: <parent of channels_dir>/slack_output_shards/shard-<index>-of-<count>, numbers zero-padded to 3 digits (e.g. shard-000-of-002)
+  """
+
+  return os.path.join(os.path.abspath(os.path.join(channels_dir, os.pardir)), SHARDS_DIR, 'shard-{:03d}-of-{:03d}'.format(shard_index, num_shards))
+
+
+
+def plan_shards(channels_dir, channel_list, num_shards):
+  """
+  plan_shards assigns every (channel, day file) unit of a workspace to a shard, so the shards hold about the same number of bytes
+
+  Units are assigned largest first to the least loaded shard. Among equally loaded shards, the stable hash of the unit picks one, so
+  every shard computes the same plan from the same export without talking to the others.
+
+  :param channels_dir: path to directory that contains the exported Slack workspace
+  :param channel_list: list of channel names in the workspace
+  :param num_shards: number of shards
+  :return: dictionary of (channel name, day file name) -> shard index
+  """
+
+  loads = [0] * num_shards
+  assignment = {}
+  for channel_name, day, size in plan_day_units(channels_dir, channel_list):
+    start = stable_hash(channel_name + '/' + day) % num_shards
+    shard_index = min(range(num_shards), key = lambda i: (loads[i], (i - start) % num_shards))
+    # Empty day files count as one byte so they are spread too
+    loads[shard_index] += max(size, 1)
+    assignment[(channel_name, day)] = shard_index
+  return assignment
+
+
+
+def shard_channel_days(channels_dir, channel_list, shard_index, num_shards):
+  """
+  shard_channel_days returns the day files of every channel processed by a shard (channels without day files go to shard 0)
+
+  :param channels_dir: path to directory that contains the exported Slack workspace
+  :param channel_list: list of channel names in the workspace
+  :param shard_index: index of the shard (from 0)
+  :param num_shards: number of shards
+  :return: dictionary of channel name -> list of day files, only channels with day files in the shard
+  """
+
+  check_shard(shard_index, num_shards)
+  assignment = plan_shards(channels_dir, channel_list, num_shards)
+  channel_days = {}
+  for channel_name in channel_list:
+    all_days = os.listdir(os.path.join(channels_dir, channel_name))
+    days = [day for day in all_days if assignment[(channel_name, day)] == shard_index]
+    if days or (not all_days and shard_index == 0):
+      channel_days[channel_name] = days
+  return channel_days
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import os
+from collections import OrderedDict
+from serializer import get_json_backend
+from jsonio import read_day_file
+from columnar import read_parquet_day, COLUMNAR_FORMATS
+
+
+
+# Directory of the thread index of every channel in the output directory (one <channel>.json file per channel)
+THREADS_DIR = 'threads'
+# Number of parsed day files kept in memory while threads are read
+MAX_CACHED_DAYS = 4
+
+
+
+class DayThreads:
+  """
+  DayThreads collects the thread messages of one day file while it is processed, by position in the output day file
+
+  Messages are added in the order they are written, before threading keys are removed: a message whose "thread_ts" is its own "ts"
+  starts a thread, any other message with a "thread_ts" is a reply to that thread.
+  """
+
+  def __init__(self):
+    self.num_msgs = 0
+    # (position, thread_ts, whether the message starts the thread)
+    self.entries = []
+
+  def add(self, msgs):
+    """
+    add records the selected messages of a batch
+
+    :param msgs: list of raw message JSONs, in output order
+    """
+
+    for msg_json in msgs:
+      thread_ts = msg_json.get('thread_ts')
+      if thread_ts is not None:
+        self.entries.append((self.num_msgs, thread_ts, thread_ts == msg_json.get('ts')))
+      self.num_msgs += 1
+
+
+
+class ThreadIndex:
+  """
+  ThreadIndex maps the threads of a channel (by the raw "ts" of the message that started them) to the positions of their messages in the
+  output day files
+
+  The sidecar file is <output_dir>/threads/<channel>.json: {"days": [output day files], "threads": {thread_ts: {"parent": [day, position]
+  or null if the parent is not in the export, "replies": [[day, position], ...]}}}, days are indexes in "days" and replies are in day order.
+
+  :param channel_name: name of the Slack channel
+  """
+
+  def __init__(self, channel_name):
+    self.channel_name = channel_name
+    # Output day file name -> list of (position, thread_ts, whether the message starts the thread)
+    self.days = {}
+
+  def set_day(self, day, entries):
+    """
+    set_day replaces the thread messages of an output day file
+
+    :param day: name of the output day file
+    :param entries: DayThreads.entries of the day file
+    """
+
+    self.days[day] = list(entries)
+
+  def remove_day(self, day):
+    self.days.pop(day, None)
+
+  def threads(self):
+    """
+    threads returns the positions of the messages of every thread, threads ordered by their first message
+
+    :return: sorted list of day file names and ordered dictionary of thread_ts -> (parent (day, position) or None, list of replies)
+    """
+
+    days = sorted(self.days)
+    threads = {}
+    for day_idx, day in enumerate(days):
+      for pos, thread_ts, is_parent in self.days[day]:
+        thread = threads.get(thread_ts)
+        if thread is None:
+          thread = threads[thread_ts] = [None, []]
+        if is_parent:
+          thread[0] = (day_idx, pos)
+        else:
+          thread[1].append((day_idx, pos))
+
+    def first_position(item):
+      parent, replies = item[1]
+      return min([parent] + replies[:1] if parent is not None else replies[:1])
+    return days, OrderedDict(sorted(threads.items(), key = first_position))
+
+  def save(self, output_dir):
+    """
+    save writes the sidecar file of the channel (compact JSON)
+
+    :param output_dir: directory of the output of data
+    :return: path of the sidecar file
+    """
+
+    days, threads = self.threads()
+    path = os.path.join(output_dir, THREADS_DIR, self.channel_name + '.json')
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'wb') as f:
+      get_json_backend().dump({'days': days,
+                               'threads': {thread_ts: {'parent': parent, 'replies': replies} for thread_ts, (parent, replies) in threads.items()}}, f)
+    return path
+
+  @classmethod
+  def from_file(cls, output_dir, channel_name):
+    """
+    from_file loads the thread index of a channel
+
+    :param output_dir: directory of the output of data
+    :param channel_name: name of the Slack channel
+    :return: ThreadIndex (empty if the channel has no sidecar file)
+    """
+
+    index = cls(channel_name)
+    path = os.path.join(output_dir, THREADS_DIR, channel_name + '.json')
+    if not os.path.exists(path):
+      return index
+    with open(path, 'rb') as f:
+      data = get_json_backend().load(f)
+    index.days = {day: [] for day in data['days']}
+    for thread_ts, thread in data['threads'].items():
+      if thread['parent'] is not None:
+        day_idx, pos = thread['parent']
+        index.days[data['days'][day_idx]].append((pos, thread_ts, True))
+      for day_idx, pos in thread['replies']:
+        index.days[data['days'][day_idx]].append((pos, thread_ts, False))
+    for entries in index.days.values():
+      entries.sort()
+    return index
+
+
+
+def read_output_day(path):
+  """
+  read_output_day returns the messages of an output day file (rows for the parquet format)
+
+  :param path: path of the output day file
+  :return: list of messages
+  """
+
+  if os.path.splitext(path)[1][1:] in COLUMNAR_FORMATS:
+    return read_parquet_day(path)
+  return read_day_file(path)
+
+
+
+def iter_threads(output_dir, channel_name, max_cached_days = MAX_CACHED_DAYS):
+  """
+  iter_threads yields the threads of a channel one at a time, reading only the day files that hold their messages
+
+  Threads are yielded in order of their first message, so day files are mostly read once. At most max_cached_days parsed day files are
+  kept in memory.
+
+  :param output_dir: directory of the output of data
+  :param channel_name: name of the Slack channel
+  :param max_cached_days: number of parsed day files kept in memory
+  :return: generator of dictionaries with "thread_ts", "parent" (message, or None if it is not in the export) and "replies" (list of
+           messages in day order)
+  """
+
+  days, threads = ThreadIndex.from_file(output_dir, channel_name).threads()
+  cache = OrderedDict()
+
+  def message(day_idx, pos):
+    msgs = cache.get(day_idx)
+    if msgs is None:
+      msgs = cache[day_idx] = read_output_day(os.path.join(output_dir, channel_name, days[day_idx]))
+      if len(cache) > max_cached_days:
+        cache.popitem(last = False)
+    else:
+      cache.move_to_end(day_idx)
+    return msgs[pos]
+
+  for thread_ts, (parent, replies) in threads.items():
+    yield {'thread_ts': thread_ts,
+           'parent': message(*parent) if parent is not None else None,
+           'replies': [message(*reply) for reply in replies]}
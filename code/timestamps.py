@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import os
+import calendar
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+
+# Format of converted time stamps
+TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Default number of formatted seconds kept in memory
+DEFAULT_TS_CACHE_SIZE = 100000
+SECONDS_PER_DAY = 86400
+
+# "00" to "59", the hours, minutes and seconds of a clock time
+_TWO_DIGITS = ['{:02d}'.format(num) for num in range(60)]
+
+
+
+class TimestampFormatter:
+  """
+  TimestampFormatter converts unix time stamps to "%Y-%m-%d %H:%M:%S" (UTC)
+
+  Time stamps within the day of the current day file are formatted from their offset to midnight, other time stamps are kept in a
+  bounded LRU cache per integer second (reply time stamps repeat across the messages of a thread).
+
+  :param max_size: maximum number of seconds kept in the cache
+  """
+
+  def __init__(self, max_size = DEFAULT_TS_CACHE_SIZE):
+    self.max_size = max_size
+    self._cache = OrderedDict()
+    self.day_start = None
+    self.day_prefix = None
+
+  def set_day(self, day):
+    """
+    set_day sets the day of the day file being processed, whose time stamps take the fast path
+
+    :param day: name of the day file ("YYYY-MM-DD.json") or date, None to disable the fast path
+    """
+
+    self.day_start = None
+    self.day_prefix = None
+    if day is None:
+      return
+    try:
+      date = datetime.strptime(os.path.splitext(os.path.basename(day))[0], '%Y-%m-%d')
+    except ValueError:
+      return
+    self.day_start = calendar.timegm(date.timetuple())
+    # Built from the parsed date, so names without zero padding (e.g. "2021-1-5.json") give the same time stamps as the slow path
+    self.day_prefix = date.strftime('%Y-%m-%d ')
+
+  def format_seconds(self, seconds):
+    """
+    format_seconds formats an integer unix time stamp
+
+    :param seconds: seconds since the epoch
+    :return: date-time string
+    """
+
+    if self.day_start is not None:
+      offset = seconds - self.day_start
+      if 0 <= offset < SECONDS_PER_DAY:
+        hours, offset = divmod(offset, 3600)
+        minutes, secs = divmod(offset, 60)
+        return self.day_prefix + _TWO_DIGITS[hours] + ':' + _TWO_DIGITS[minutes] + ':' + _TWO_DIGITS[secs]
+
+    out = self._cache.get(seconds)
+    if out is not None:
+      self._cache.move_to_end(seconds)
+      return out
+    out = self._cache[seconds] = datetime.fromtimestamp(seconds, timezone.utc).strftime(TS_FORMAT)
+    if len(self._cache) > self.max_size:
+      self._cache.popitem(last = False)
+    return out
+
+  def format(self, ts):
+    """
+    format formats a unix time stamp as found in message JSONs (fractions of a second are dropped)
+
+    :param ts: time stamp (string such as "1637696571.000200", or number)
+    :return: date-time string
+    """
+
+    return self.format_seconds(int(float(ts)))
+
+
+
+# Formatter shared by every day file processed in this process
+_ts_formatter = None
+
+
+
+def get_ts_formatter():
+  """
+  get_ts_formatter returns the time stamp formatter of this process
+
+  :return: TimestampFormatter
+  """
+
+  global _ts_formatter
+  if _ts_formatter is None:
+    _ts_formatter = TimestampFormatter()
+  return _ts_formatter
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import pandas as pd
+
+
+
+# Name of the mapping of user IDs to hashed email IDs in the output directory
+USER_IDS_FN = 'hash_dict_ids.json'
+# Number of rows of the members .csv file read at a time
+CSV_CHUNK_SIZE = 100000
+# Keys of a message JSON (and of its replies) that hold a user ID
+USER_KEYS = ('user', 'parent_user_id')
+
+
+
+def id_hash_key(seed_val):
+  """
+  id_hash_key derives the key of the email hash from a seed value
+
+  :param seed_val: seed of the hash (None for the unseeded md5 hash of earlier versions)
+  :return: 32 byte key, or None
+  """
+
+  if seed_val is None:
+    return None
+  return hashlib.sha256(str(seed_val).encode()).digest()
+
+
+
+def hash_email(email, key = None):
+  """
+  hash_email returns the hashed ID of a user: the keyed BLAKE2b hash of the email (32 hexadecimal characters), or its plain md5 hash
+  without a key
+
+  :param email: email of the user
+  :param key: key returned by id_hash_key (None for md5)
+  :return: hexadecimal hash string
+  """
+
+  if key is None:
+    return hashlib.md5(email.encode()).hexdigest()
+  return hashlib.blake2b(email.encode(), key = key, digest_size = 16).hexdigest()
+
+
+
+def iter_user_id_chunks(csv_path, seed_val = None, chunk_size = CSV_CHUNK_SIZE, id_col = 'userid', email_col = 'email'):
+  """
+  iter_user_id_chunks reads the members .csv file in chunks and yields the hashed email IDs of every chunk, so the file never has to be
+  held in memory (rows without user ID or email are skipped)
+
+  :param csv_path: path of the .csv file with metadata of workspace users
+  :param seed_val: seed of the keyed hash (None for the unseeded md5 hash)
+  :param chunk_size: number of rows read at a time
+  :param id_col: column of the user IDs
+  :param email_col: column of the emails
+  :return: generator of (dictionary of user ID -> hashed email ID, number of rows skipped)
+  """
+
+  key = id_hash_key(seed_val)
+  for chunk in pd.read_csv(csv_path, usecols = [id_col, email_col], dtype = str, chunksize = chunk_size):
+    valid = chunk[id_col].notna() & chunk[email_col].notna()
+    ids = chunk[id_col][valid].tolist()
+    emails = chunk[email_col][valid].tolist()
+    yield dict(zip(ids, [hash_email(email, key) for email in emails])), int((~valid).sum())
+
+
+
+def map_user_ids(msg_json, user_ids):
+  """
+  map_user_ids replaces the user IDs of a message JSON and its replies with hashed IDs (user IDs that are not in the mapping are kept)
+
+  :param msg_json: JSON contents of the message (modified in place)
+  :param user_ids: dictionary of user ID -> hashed ID
+  """
+
+  for key in USER_KEYS:
+    if key in msg_json:
+      msg_json[key] = user_ids.get(msg_json[key], msg_json[key])
+  for resp in msg_json.get('replies', ()):
+    if 'user' in resp:
+      resp['user'] = user_ids.get(resp['user'], resp['user'])
@@ -1,364 +1,416 @@
 # -*- coding: utf-8 -*-
 
-import contractions
-import pandas as pd
-import numpy as np
-import string
-import json
 import os
-import hashlib
-import re
 from datetime import datetime
 import multiprocessing
-import nltk
 from nltk.stem import *
-import csv
-from collections import Counter
-from operator import add, itemgetter
+from collections import Counter, namedtuple
+from operator import itemgetter
 import shutil
+import time
+import cProfile
+from hashing import get_hash_cache, HashCacheWriter, DEFAULT_CACHE_SIZE
+from liwc import LiwcEngine, read_liwc_csv, index_key, LIWC_TABLES_FN
+from scheduler import plan_day_units, WorkerUsage
+from manifest import run_config, load_manifest, save_manifest, plan_incremental, same_day_file, split_by_day
+from jsonio import iter_day_file, iter_json_object, read_day_file, parse_day_file, write_day_file, output_file_name, JsonLinesSink, OUTPUT_FORMATS
+from columnar import write_parquet_day, COLUMNAR_FORMATS
+from vocab import VocabularyWriter, VOCAB_FN, VOCAB_RUNS_DIR, pack_hashed_content, codes_to_text
+from batch import process_batch, iter_process_batches
+from metrics import RunMetrics, enable_run_metrics, disable_run_metrics, get_run_metrics, timed_iter, worker_profiler, merge_profiles
+from timestamps import get_ts_formatter
+from pipeline import iter_pipelined
+from serializer import set_json_backend, get_json_backend, JSON_BACKENDS
+from userids import iter_user_id_chunks, USER_IDS_FN, CSV_CHUNK_SIZE
+from threads import DayThreads, ThreadIndex, THREADS_DIR
+from sharding import shard_channel_days, shard_output_dir
+from hashmerge import HashRunWriter, HashDictWriter, get_worker_runs, iter_merged_chunks, RUNS_DIR, DEFAULT_SPILL_SIZE
+from checkpoint import Journal, get_worker_journal, load_journal, CHECKPOINTS_DIR, DEFAULT_CHECKPOINT_EVERY
 stemmer = PorterStemmer()
 
 
 
-def rem_items(msg_json, list_rem_gen, list_rem_thread, print_cond):
+# Tokens of "hashed content" that are kept as they are (links, numbers, sentence ends, user IDs and emojis)
+literal_tokens = set()
+# User ID -> hashed ID of workspace members that user fields and mentions are replaced with (None keeps user IDs)
+user_id_map = None
+
+
+
+def iter_mod_msg_jsons(msgs_iter, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, 
+                       universal_hash_dict, seed_val, channel_name, msgs_not_selected, keep_epoch = False, day_threads = None):
   """
-  rem_items removes unnecessary keys in the message JSON 
+  iter_mod_msg_jsons processes message JSONs in batches as they are read (see process_batch), so a whole day file never has to be held in memory
 
-  :param msg_json: JSON contents of the message
-  :param list_rem_gen: list of general keys to be removed
-  :param list_rem_thread: list of keys to be removed that relate to threading or responses
-  :print_cond: "True" or "False" to select whether errors or warnings should be printed
+  :param msgs_iter: iterator of message JSONs
+  :param list_rem_gen: list of general keys to be removed from each message JSON
+  :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
+  :param list_rem_blk: list of keys under "blocks" to be removed
+  :param print_cond: "True" or "False" to select whether errors or warnings should be printed
+  :param universal_hash_dict: dictionary of hashes and tokens (continuously updated for each message)
+  :param seed_val: parameter added to every token before hashing
+  :param channel_name: name of the Slack channel the message belongs to
+  :param msgs_not_selected: list or sink (e.g. JsonLinesSink) that unprocessed messages are appended to
+  :param keep_epoch: also keep the unix time stamps as numbers ("ts_epoch")
+  :param day_threads: DayThreads that thread messages are added to (None to skip)
+  :return: generator of modified messages
   """ 
 
-  # Generating an ID for the message 
-  if 'client_msg_id' in msg_json.keys():
-    id = str(msg_json['client_msg_id'])
-  else:
-    id = 'NO CLIENT MESSAGE ID AVAILABLE'
-
-  # Removing general items
-  for key in list_rem_gen:
-    try:
-      msg_json.pop(key)
-    except:
-      if print_cond:
-        print(str(key) + ' is not present in ' + id + ' message')
-  
-  # Removing items that apply to messages with responses (thread)
-  if 'reply_count' in msg_json.keys():
-    if print_cond:
-      print(id + ' message contains responses (thread)')
-    for key in list_rem_thread:
-      try:
-        msg_json.pop(key)
-      except:
-        if print_cond:
-          print(str(key) + ' is not present in ' + id + ' message')
+  # Messages are processed in batches as they are read
+  return iter_process_batches(msgs_iter, channel_name, list_rem_gen, list_rem_thread, list_rem_blk, seed_val, liwc_engine,
+                              universal_hash_dict, msgs_not_selected, literal_tokens, print_cond, keep_epoch = keep_epoch,
+                              user_ids = user_id_map, threads = day_threads)
 
-  # Convert UNIX time stamp of message to month, day, year, hour, minute, second format
-  convert_unix_ts(msg_json)
-  
 
 
-def rem_blk_items(msg_json, list_rem_blk, print_cond):
+def mod_msg_jsons_in_list(msgs_list, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, 
+                          universal_hash_dict, seed_val, channel_name, keep_epoch = False, day_threads = None):
   """
-  rem_blk_items removes unecessary contents under the "blocks" key of the message JSON
+  mod_msg_jsons_in_list calls a sequence of functions to process every message JSON in a list of messages
 
-  :param msg_json: JSON contents of the message
+  :param msgs_list: list of message JSONs
+  :param list_rem_gen: list of general keys to be removed from each message JSON
+  :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
   :param list_rem_blk: list of keys under "blocks" to be removed
-  :print_cond: "True" or "False" to select whether errors or warnings should be printed
+  :param print_cond: "True" or "False" to select whether errors or warnings should be printed
+  :param universal_hash_dict: dictionary of hashes and tokens (continuously updated for each message)
+  :param seed_val: parameter added to every token before hashing
+  :param channel_name: name of the Slack channel the message belongs to
+  :param keep_epoch: also keep the unix time stamps as numbers ("ts_epoch")
+  :param day_threads: DayThreads that thread messages are added to (None to skip)
+  :return: list of modified messages and list of unprocessed messages
   """ 
-
-  # Generating an ID for the message 
-  if 'client_msg_id' in msg_json.keys():
-    id = str(msg_json['client_msg_id'])
-  else:
-    id = 'NO CLIENT MESSAGE ID AVAILABLE'
-
-  # Removing items under block item 
-  for key in list_rem_blk:
-    try: 
-      msg_json['blocks'][0].pop(key)
-    except:
-      if print_cond:
-        print(str(key) + ' is not present in ' + id + ' message')
-
   
+  # Every stage runs over the whole list of messages (see process_batch)
+  msgs_selected, msgs_not_selected, _ = process_batch(msgs_list, channel_name, list_rem_gen, list_rem_thread, list_rem_blk, seed_val,
+                                                      liwc_engine, universal_hash_dict, literal_tokens, print_cond, keep_epoch,
+                                                      user_id_map, day_threads)
+  return msgs_selected, msgs_not_selected
 
-def convert_unix_ts(msg_json):
+def pack_token_ids(msgs, as_text):
   """
-  convert_unix_ts changes the format of all time stamps in the message JSON from unix to date-time
+  pack_token_ids replaces "hashed content" of every message with "hashed ids", the packed array of its token codes
 
-  :param msg_json: JSON contents of the message
-  """ 
+  :param msgs: list or iterator of processed message JSONs
+  :param as_text: store the array as a base64 string (JSON output) instead of an array('I')
+  :return: generator of message JSONs
+  """
 
-  # Generate time stamp for main time stamp key
-  msg_json['ts'] = datetime.utcfromtimestamp(int(float(msg_json['ts']))).strftime('%Y-%m-%d %H:%M:%S')
-  if 'replies' in msg_json.keys():
-    # Generate time stamps for all replies 
-    for resp in msg_json['replies']:
-      resp['ts'] = datetime.utcfromtimestamp(int(float(resp['ts']))).strftime('%Y-%m-%d %H:%M:%S')
+  for msg_json in msgs:
+    if 'hashed content' in msg_json:
+      codes = pack_hashed_content(msg_json.pop('hashed content'))
+      msg_json['hashed ids'] = codes_to_text(codes) if as_text else codes
+    yield msg_json
 
 
 
-def add_channel_name(msg_json, channel_name):
+def write_output_day(path, msgs, output_format, token_ids = False, keep_epoch = False):
+  """
+  write_output_day writes the processed messages of a day file with the JSON writer or, for the parquet format, the columnar writer
+
+  :param path: path of the output day file
+  :param msgs: list or iterator of processed message JSONs
+  :param output_format: one of OUTPUT_FORMATS or COLUMNAR_FORMATS
+  :param token_ids: write "hashed content" as packed token codes ("hashed ids")
+  :param keep_epoch: messages have numeric time stamps ("ts_epoch"), stored in their own column by the columnar writer
+  :return: number of messages written
   """
-  add_channel_name includes 'channel': 'name of channel' as a key-value pair in the message JSON
-
-  :param msg_json: JSON contents of the message
-  :param channel_name: name of the Slack channel the message belongs to
-  """ 
 
-  # Add channel as a key to the message
-  msg_json['channel'] = channel_name
+  if token_ids:
+    msgs = pack_token_ids(msgs, output_format not in COLUMNAR_FORMATS)
+  if output_format in COLUMNAR_FORMATS:
+    return write_parquet_day(path, msgs, liwc_engine.categories, token_ids = token_ids, keep_epoch = keep_epoch)
+  return write_day_file(path, msgs, output_format)
 
 
 
-def extract_blk_elements(msg_json):
+def process_day(channel_path, day, channel_mod, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, hash_dict, seed_val,
+                output_format, msgs_not_processed, token_ids = False, keep_epoch = False, prefetched = None, writer = None):
   """
-  extract_blk_elements flattens all nested text contents under the "blocks" key of the message JSON and re-assigns it to the "blocks" key
-
-  :param msg_json: JSON contents of the message
-  """ 
+  process_day processes the messages of one day file of a channel and writes them to the output directory
 
-  elements_list = []
-  for blk in msg_json['blocks'][0]['elements']:
-    
-    # Main block is a section
-    if blk['type'] in ['rich_text_section', 'rich_text_preformatted', 'rich_text', 'rich_text_quote']:
-      elements_list.extend(blk['elements'])
-    
-    # Main block is a list of multiple blocks
-    elif blk['type'] == 'rich_text_list':
-      for sub_blk in blk['elements']:
-        elements_list.extend(sub_blk['elements'])
-    
-    # Main block is something else
-    else:
-      print(blk['type'] + ' is not recognized and elements cannot be extracted')
-  
-  # Assigning formatted and aggregated items to the blocks item
-  msg_json['blocks'] = elements_list
+  :param channel_path: path of the channel folder in the exported Slack workspace (its name is the channel name)
+  :param day: name of the day file
+  :param channel_mod: path of the channel folder in the output directory
+  :param list_rem_gen: list of general keys to be removed from each message JSON
+  :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
+  :param list_rem_blk: list of keys under "blocks" to be removed
+  :param print_cond: "True" or "False" to select whether errors or warnings should be printed
+  :param hash_dict: dictionary of hashes and tokens (continuously updated for each message)
+  :param seed_val: parameter added to every token before hashing
+  :param output_format: "json" (pretty-printed, default), "compact"/"jsonl" to stream day files message by message, or "parquet" (columnar)
+  :param msgs_not_processed: list or sink that unprocessed messages are appended to
+  :param token_ids: write "hashed content" as packed token codes ("hashed ids")
+  :param keep_epoch: also keep the unix time stamps as numbers ("ts_epoch")
+  :param prefetched: PrefetchedFile with the contents of the day file already read (None reads the day file)
+  :param writer: AsyncWriter the output day file is queued on (None writes it before returning)
+  :return: thread messages of the day file, by position in the output day file (see DayThreads)
+  """
 
+  channel_name = os.path.basename(os.path.normpath(channel_path))
+  # Time stamps of the day file are formatted from its midnight
+  get_ts_formatter().set_day(day)
+  # Messages that start or reply to a thread, for the thread index of the channel
+  day_threads = DayThreads()
+  if writer is not None:
+    pipelined_process_day(prefetched, writer, channel_name, day, channel_mod, list_rem_gen, list_rem_thread, list_rem_blk, print_cond,
+                          hash_dict, seed_val, output_format, msgs_not_processed, token_ids, keep_epoch, day_threads)
+    return day_threads.entries
+  run_metrics = get_run_metrics()
+  if run_metrics is not None:
+    timed_process_day(run_metrics, channel_path, day, channel_mod, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, hash_dict, seed_val,
+                      output_format, msgs_not_processed, token_ids, keep_epoch, day_threads)
+    return day_threads.entries
+
+  if output_format == 'json':
+    msgs_per_day = read_day_file(os.path.join(channel_path, day))
 
+    # Call the function to process messages in a list
+    mod_msgs_per_day, msgs_not_processed_per_day = mod_msg_jsons_in_list(msgs_per_day, list_rem_gen, list_rem_thread, list_rem_blk, 
+                                                                          print_cond, hash_dict, seed_val, channel_name, keep_epoch, day_threads)
+    # Creating a list of messages do not get processed across all days
+    msgs_not_processed.extend(msgs_not_processed_per_day)
+  else:
+    # Messages are read, processed and written one at a time, unprocessed messages go straight to the sink
+    mod_msgs_per_day = iter_mod_msg_jsons(iter_day_file(os.path.join(channel_path, day)), list_rem_gen, list_rem_thread, list_rem_blk, 
+                                          print_cond, hash_dict, seed_val, channel_name, msgs_not_processed, keep_epoch, day_threads)
 
-def clean_text(text): 
-  """
-  clean_text removes unnecessary characters, punctuations in text content  
+  # Upload modified messages to new folder in output directory
+  write_output_day(os.path.join(channel_mod, output_file_name(day, output_format)), mod_msgs_per_day, output_format, token_ids, keep_epoch)
+  return day_threads.entries
 
-  :param text: any string
-  :return: modified string
-  """ 
 
-  # Replacing certain sets of characters with spaces 
-  text = text.replace('\xa0', ' ')
-  text = text.replace('\r', ' ')
-  text = text.replace('\t', ' ')
-  
-  # Lowercase all text
-  text = text.lower()
-
-  # Expanding contractions or abbreviations
-  for word in text.split():
-    # Addressing contractions like "it's", "hasn't", etc. using module
-    text = text.replace(word, (contractions.fix(word)))
-    # Lowercase the text again since replacement with contractions module may reverse the initial lowercasing
-    text = text.lower()
-
-    # Addressing common abbreviations
-    if 'e.g' in word:
-      text = text.replace('e.g', 'example')
-    if 'vs' in word:
-     text = text.replace('vs', 'versus')
-    if 'i.e' in word:
-      text = text.replace('i.e', 'that is')
-  
-  text = re.sub(r'[0-9]+', ' NUM ', text)
-  text = re.sub(r'[\?|!|\.]+', ' SENTEND ', text)
-  text = re.sub(r'é|è', 'e', text)
-  text = re.sub(r'[^A-Za-z]+', ' ', text)
-    
-  text = text.replace('SENTEND', 'SENT_END')
-  
-  return text
 
+def timed_process_day(run_metrics, channel_path, day, channel_mod, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, hash_dict, seed_val,
+                      output_format, msgs_not_processed, token_ids = False, keep_epoch = False, day_threads = None):
+  """
+  timed_process_day processes one day file like process_day, adding the time and bytes of reading and writing it to the run metrics
 
+  When day files are streamed, reading is the time spent parsing messages and writing is the time of write_day_file without the time
+  spent producing the messages it writes.
 
-def clean_repeats_in_text(text):
+  :param run_metrics: RunMetrics of this process
+  :param channel_path: path of the channel folder in the exported Slack workspace (its name is the channel name)
+  :param day: name of the day file
+  :param channel_mod: path of the channel folder in the output directory
+  :param list_rem_gen: list of general keys to be removed from each message JSON
+  :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
+  :param list_rem_blk: list of keys under "blocks" to be removed
+  :param print_cond: "True" or "False" to select whether errors or warnings should be printed
+  :param hash_dict: dictionary of hashes and tokens (continuously updated for each message)
+  :param seed_val: parameter added to every token before hashing
+  :param output_format: "json" (pretty-printed, default), "compact"/"jsonl" to stream day files message by message, or "parquet" (columnar)
+  :param msgs_not_processed: list or sink that unprocessed messages are appended to
+  :param token_ids: write "hashed content" as packed token codes ("hashed ids")
+  :param keep_epoch: also keep the unix time stamps as numbers ("ts_epoch")
+  :param day_threads: DayThreads that thread messages are added to (None to skip)
   """
-  clean_repeats_in_text removes any repititions of NUM, SENT_END or newline characters 
 
-  :param text: any string
-  :return: modified string
-  """ 
-  # General cleaning
-  text = re.sub('\s+', ' ', text) 
-  text = text.replace('NUM th', 'NUM')
-  text = text.replace('NUM st', 'NUM')
-  text = text.replace('NUM nd', 'NUM')
-
-  # Replacing repetitions of "NUM" or "\n" of any number, and separating by any number of spaces, with a single "NUM" or "\n"
-  text = re.sub('(NUM *)+', ' NUM ', text) 
-  text = re.sub('(SENT_END *)+', ' SENT_END ', text) 
-  text = re.sub('(\n *)+', ' \n ', text) 
-  
-  # Replacing more than one space anywhere in text with a single space
-  text = re.sub('\s+', ' ', text) 
-  text = text.strip()
-  
-  return text
+  channel_name = os.path.basename(os.path.normpath(channel_path))
+  in_path = os.path.join(channel_path, day)
+  out_path = os.path.join(channel_mod, output_file_name(day, output_format))
+  clock = time.perf_counter
 
-    
+  if output_format == 'json':
+    start = clock()
+    msgs_per_day = read_day_file(in_path)
+    run_metrics.add(channel_name, 'json_read', clock() - start, num_bytes = os.path.getsize(in_path))
 
-def combine_blk_content(msg_json):
+    mod_msgs_per_day, msgs_not_processed_per_day = mod_msg_jsons_in_list(msgs_per_day, list_rem_gen, list_rem_thread, list_rem_blk, 
+                                                                          print_cond, hash_dict, seed_val, channel_name, keep_epoch, day_threads)
+    msgs_not_processed.extend(msgs_not_processed_per_day)
+    start = clock()
+    write_output_day(out_path, mod_msgs_per_day, output_format, token_ids, keep_epoch)
+    run_metrics.add(channel_name, 'json_write', clock() - start, num_bytes = os.path.getsize(out_path))
+    return
+
+  read_time = [0.0]
+  produce_time = [0.0]
+  mod_msgs_per_day = iter_mod_msg_jsons(timed_iter(iter_day_file(in_path), read_time), list_rem_gen, list_rem_thread, list_rem_blk, 
+                                        print_cond, hash_dict, seed_val, channel_name, msgs_not_processed, keep_epoch, day_threads)
+  start = clock()
+  write_output_day(out_path, timed_iter(mod_msgs_per_day, produce_time), output_format, token_ids, keep_epoch)
+  write_time = clock() - start - produce_time[0]
+  run_metrics.add(channel_name, 'json_read', read_time[0], num_bytes = os.path.getsize(in_path))
+  run_metrics.add(channel_name, 'json_write', write_time, num_bytes = os.path.getsize(out_path))
+
+
+
+def pipelined_process_day(prefetched, writer, channel_name, day, channel_mod, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, hash_dict,
+                          seed_val, output_format, msgs_not_processed, token_ids = False, keep_epoch = False, day_threads = None):
+  """
+  pipelined_process_day processes one day file like process_day from its contents read ahead by a DayPrefetcher, and queues the output
+  on an AsyncWriter instead of writing it
+
+  The whole day file is processed at once in every output format, memory is bounded by the depth of the prefetch and write queues.
+  When metrics are collected, json_read is the time the prefetch thread spent reading plus parsing, and read_wait and write_wait are the
+  times this thread waited for the prefetch thread and for room in the write queue (json_write is added once the writer is closed).
+
+  :param prefetched: PrefetchedFile of the day file
+  :param writer: AsyncWriter that writes the output day file
+  :param channel_name: name of the Slack channel
+  :param day: name of the day file
+  :param channel_mod: path of the channel folder in the output directory
+  :param list_rem_gen: list of general keys to be removed from each message JSON
+  :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
+  :param list_rem_blk: list of keys under "blocks" to be removed
+  :param print_cond: "True" or "False" to select whether errors or warnings should be printed
+  :param hash_dict: dictionary of hashes and tokens (continuously updated for each message)
+  :param seed_val: parameter added to every token before hashing
+  :param output_format: "json" (pretty-printed, default), "compact"/"jsonl", or "parquet" (columnar)
+  :param msgs_not_processed: list or sink that unprocessed messages are appended to
+  :param token_ids: write "hashed content" as packed token codes ("hashed ids")
+  :param keep_epoch: also keep the unix time stamps as numbers ("ts_epoch")
+  :param day_threads: DayThreads that thread messages are added to (None to skip)
   """
-  combine_blk_content combine all relevant contents under the "blocks" structure of the message JSON and assign it to a new key "all content"
 
-  :param msg_json: JSON contents of the message
-  """ 
+  run_metrics = get_run_metrics()
+  start = time.perf_counter()
+  msgs_per_day = parse_day_file(prefetched.data, day)
+  parse_time = time.perf_counter() - start
 
-  # Initiliazing empty string for all message contents
-  all_msg_content = ''  
+  mod_msgs_per_day, msgs_not_processed_per_day = mod_msg_jsons_in_list(msgs_per_day, list_rem_gen, list_rem_thread, list_rem_blk, 
+                                                                        print_cond, hash_dict, seed_val, channel_name, keep_epoch, day_threads)
+  # Unprocessed messages are added right away, so they stay in day order whatever the writer is doing
+  for msg_json in msgs_not_processed_per_day:
+    msgs_not_processed.append(msg_json)
 
-  for elm in msg_json['blocks']:
-    # Initiliazing empty string for content per element
-    elm_content = ''
+  out_path = os.path.join(channel_mod, output_file_name(day, output_format))
+  write_wait = writer.submit((channel_name, out_path), write_output_day, out_path, mod_msgs_per_day, output_format, token_ids, keep_epoch)
+  if run_metrics is not None:
+    run_metrics.add(channel_name, 'json_read', prefetched.read_sec + parse_time, num_bytes = len(prefetched.data))
+    run_metrics.add(channel_name, 'read_wait', prefetched.wait_sec)
+    run_metrics.add(channel_name, 'write_wait', write_wait)
 
-    # Formatting text items
-    if elm['type'] == 'text':
-      elm_content = clean_text(elm['text'])
-    
-    # Addressing links 
-    elif elm['type'] == 'link':
-    # Capturing text associated with a link if the item exists
-      if 'text' in elm.keys():
-        link_text = elm['text']
-        # Sometimes the text associated with a link is the link itself: "www.abc.com" is present under the text and hyperlink items in the block
-        # Create exception to avoid capturing the text in these such instances
-        if ('www' not in link_text) and ('.com' not in link_text):
-          # Add () around LINK for hyperlinked text
-          elm_content = clean_text(link_text)+' (LINK)'
-        else: 
-          elm_content = 'LINK'
-      else:
-        elm_content = 'LINK'
-   
-    # Addressing emojis
-    elif elm['type'] == 'emoji':
-      elm_content = elm['name']+'EMOJI'
-    
-    # Addressing user IDs
-    elif elm['type'] == 'user':
-      elm_content = '@'+elm['user_id']+'USERID'
 
-    # Addressing channel broadcast
-    elif elm['type'] == 'broadcast':
-      elm_content = '@'+elm['range']+'USERID'
 
-    # Combining all text elements into a single string
-    all_msg_content += (' ' + elm_content)
-    all_msg_content = clean_repeats_in_text(all_msg_content)
-  
-  # Creating a key for all content in the main json
-  msg_json['all content'] = all_msg_content
+# Tokens kept as they are already returned to the parent by this worker process
+_reported_literals = set()
+# Work unit of the pool: one day file of a channel, with the settings of the run that the worker process needs
+DayUnit = namedtuple('DayUnit', ['channels_dir', 'channel_name', 'day', 'output_dir', 'list_rem_gen', 'list_rem_thread', 'list_rem_blk',
+                                 'print_cond', 'seed_val', 'output_format', 'token_ids', 'keep_epoch', 'collect_metrics', 'profile',
+                                 'pipeline_depth', 'json_backend', 'hash_spill_size', 'checkpoint'])
+# Checkpoint settings of a work unit: checkpoints directory, number of day files between checkpoints and entry of the input day file
+UnitCheckpoint = namedtuple('UnitCheckpoint', ['checkpoint_dir', 'every', 'day_entry'])
 
-  # Removing blocks key since all content has been combined
-  msg_json.pop('blocks')
 
 
+def init_worker(liwc_tables_path, user_ids_path = None, seed_val = None, hash_cache_size = None, hash_cache_path = None):
+  """
+  init_worker is the initializer of the worker processes of the pool: it attaches to the LIWC tables shared by the parent and loads
+  what forked workers would inherit, so workers started with "spawn" or "forkserver" have the same state
 
-def check_val_in_list(val, list_words):
+  :param liwc_tables_path: path of the LIWC tables written by the parent (LiwcEngine.save_tables)
+  :param user_ids_path: path of the mapping of user IDs to hashed email IDs written by the parent (None keeps user IDs)
+  :param seed_val: parameter added to every token before hashing
+  :param hash_cache_size: maximum number of tokens kept in the token hash cache
+  :param hash_cache_path: path of the token hash cache file preloaded by the parent (None to disable)
   """
-  check_val_in_list checks if a given value is present in any word in a list of words
 
-  :param val: string
-  :param list_words: list of strings
-  :return: True or False
-  """ 
+  global liwc_engine, user_id_map
+  # Memory-mapped tables are shared by every worker, instead of a copy-on-write copy of the parent's engine
+  liwc_engine = LiwcEngine.attach(liwc_tables_path)
+  if user_ids_path and user_id_map is None:
+    with open(user_ids_path, 'rb') as f:
+      user_id_map = get_json_backend().load(f)
+  hash_cache = get_hash_cache(seed_val, hash_cache_size)
+  if hash_cache_path and not len(hash_cache):
+    hash_cache.load(hash_cache_path)
 
-  # Checking if a given value is present in any word in a list of words
-  for word in list_words:
-    if word in val:
-      return True 
-  return False
 
 
+def process_day_unit(unit, prefetched = None, writer = None):
+  """
+  process_day_unit is run by a worker process of the pool to process one (channel, day file) work unit
 
-def hash_all_text(msg_json, universal_hash_dict, seed_val):
+  :param unit: DayUnit, its checkpoint is a UnitCheckpoint or None
+  :param prefetched: PrefetchedFile with the contents of the day file already read (None reads the day file)
+  :param writer: AsyncWriter the output day file is queued on (None writes it before returning)
+  :return: channel name, day file name, new tokens kept as they are (not yet returned by this worker), unprocessed messages, thread messages, statistics of the unit, (worker id, busy time) and run metrics of the unit (None if not
+           collected)
   """
-  hash_all_text use md5 to hash the text content and store it under a new "hashed content" key in the message JSON
 
-  :param msg_json: JSON contents of the message
-  :param universal_hash_dict: dictionary of hashes and tokens (continuously updated for each message)
-  :param seed_val: parameter added to every token before hashing
-  :return universal_hash_dict: dictionary of hashes and tokens
-  """ 
-  all_hashes_str = ''
-  
-  for word in msg_json['all content'].split():
-    
-    # Not hashing links, emojis, numbers or user IDs
-    if not check_val_in_list(word, ['LINK', 'EMOJI', 'NUM', 'SENT_END', 'USERID']):
-      # Adding seed value to the word to be hashed
-      hash_object = hashlib.md5((word+str(seed_val)).encode())
-      # Hexadecimal version of the md5hash
-      repl = str(hash_object.hexdigest())[0:8]
-      
-      # Adding words and hashes to a universal hash dictionary
-      if word not in universal_hash_dict.keys():
-        universal_hash_dict[word] = repl
+  start = time.perf_counter()
+  set_json_backend(unit.json_backend)
+  if unit.collect_metrics:
+    enable_run_metrics()
+  if unit.profile:
+    worker_profiler().enable()
 
-    # If the word is one of the not-to-be hashed elements, the word itself is used in place of a hash
-    elif check_val_in_list(word, ['LINK', '(LINK)', 'EMOJI', 'NUM', 'SENT_END', 'USERID']):
-      repl = word.replace('USERID', '').replace('EMOJI', '')
+  hash_dict = {}
+  msgs_not_processed = []
+  hash_cache = get_hash_cache(unit.seed_val)
+  stats_before = hash_cache.stats()
+  thread_entries = process_day(os.path.join(unit.channels_dir, unit.channel_name), unit.day, os.path.join(unit.output_dir, unit.channel_name),
+                               unit.list_rem_gen, unit.list_rem_thread, unit.list_rem_blk, unit.print_cond, hash_dict, unit.seed_val,
+                               unit.output_format, msgs_not_processed, unit.token_ids, unit.keep_epoch, prefetched, writer)
+
+  # Tokens and hashes are written to sorted runs by the worker, only tokens kept as they are that it has not returned before are sent back
+  worker_runs = get_worker_runs(os.path.join(unit.output_dir, RUNS_DIR), unit.hash_spill_size)
+  worker_runs.add(hash_dict)
+  if unit.checkpoint is not None:
+    get_worker_journal(unit.checkpoint.checkpoint_dir, worker_runs, literal_tokens, unit.checkpoint.every).add(
+      dict(unit.checkpoint.day_entry, channel = unit.channel_name, msgs_not_processed = msgs_not_processed, threads = thread_entries),
+      os.path.join(unit.output_dir, unit.channel_name, output_file_name(unit.day, unit.output_format)), writer)
+  new_literals = list(literal_tokens - _reported_literals)
+  _reported_literals.update(new_literals)
+
+  if unit.profile:
+    worker_profiler().disable()
+    worker_profiler().dump_stats(os.path.join(unit.output_dir, 'profiles', 'worker-{}.pstats'.format(os.getpid())))
+
+  unit_stats = {key: val - stats_before[key] for key, val in hash_cache.stats().items()}
+  unit_metrics = get_run_metrics().take() if unit.collect_metrics else None
+  return (unit.channel_name, unit.day, new_literals, msgs_not_processed, thread_entries, unit_stats, (os.getpid(), time.perf_counter() - start),
+          unit_metrics)
+
+
+
+def process_day_units(units):
+  """
+  process_day_units is run by a worker process of the pool to process a chunk of work units as a pipeline: day files of the chunk are
+  read ahead and written in the background while the next ones are processed
 
-    # Combining all the hashes
-    all_hashes_str += (repl + ' ')
-  
-  # Add list of hashes to the message
-  msg_json['hashed content'] = all_hashes_str.strip()
-  # Remove identifiers from all content since hashing is done
-  msg_json['all content'] = msg_json['all content'].replace('USERID', '').replace('EMOJI', '')
+  :param units: list of DayUnit with the same settings
+  :return: list of the results of process_day_unit, once every output day file of the chunk is written
+  """
 
-  return universal_hash_dict
+  collect_metrics = units[0].collect_metrics
+  set_json_backend(units[0].json_backend)
+  if collect_metrics:
+    enable_run_metrics()
+  results = []
+  paths = [os.path.join(unit.channels_dir, unit.channel_name, unit.day) for unit in units]
+  for unit, prefetched, writer in iter_pipelined(units, paths, units[0].pipeline_depth, get_run_metrics()):
+    results.append(process_day_unit(unit, prefetched, writer))
 
+  if collect_metrics:
+    # Day files are written after their units return, so write times are returned with the last unit of the chunk
+    unit_metrics = RunMetrics()
+    unit_metrics.merge(results[-1][-1])
+    unit_metrics.merge(get_run_metrics().take())
+    results[-1] = results[-1][:-1] + (unit_metrics.take(),)
+  return results
 
 
-def mod_msg_jsons_in_list(msgs_list, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, 
-                          universal_hash_dict, seed_val, channel_name):
+
+def msgs_not_processed_path(output_dir, channel_name, output_format):
   """
-  mod_msg_jsons_in_list calls a sequence of functions to process every message JSON in a list of messages
+  msgs_not_processed_path returns the path of the file with the unprocessed messages of a channel
+
+  :param output_dir: directory of the output of data
+  :param channel_name: name of the Slack channel
+  :param output_format: "json" writes a JSON array, the streaming formats write JSON Lines
+  :return: path of the file
+  """
+
+  return os.path.join(output_dir, 'messages_not_processed', channel_name + ('.json' if output_format == 'json' else '.jsonl'))
 
-  :param msgs_list: list of message JSONs
-  :param list_rem_gen: list of general keys to be removed from each message JSON
-  :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
-  :param list_rem_blk: list of keys under "blocks" to be removed
-  :param print_cond: "True" or "False" to select whether errors or warnings should be printed
-  :param universal_hash_dict: dictionary of hashes and tokens (continuously updated for each message)
-  :param seed_val: parameter added to every token before hashing
-  :param channel_name: name of the Slack channel the message belongs to
-  :return: list of modified messages and list of unprocessed messages
-  """ 
-  
-  # Create a list of selected messages
-  msgs_selected = [msg_json for msg_json in msgs_list if 'client_msg_id' in msg_json.keys()]
-  # Create a list of unselected messages
-  msgs_not_selected = [msg_json for msg_json in msgs_list if msg_json not in msgs_selected]
-
-  # Processing messages in the selected group of messages
-  for msg_json in msgs_selected:
-    add_channel_name(msg_json, channel_name)
-    rem_items(msg_json, list_rem_gen, list_rem_thread, print_cond)
-    if 'blocks' in msg_json.keys():
-      rem_blk_items(msg_json, list_rem_blk, print_cond)
-      extract_blk_elements(msg_json)
-      combine_blk_content(msg_json)
-      universal_hash_dict = hash_all_text(msg_json, universal_hash_dict, seed_val)
-      msg_json['LIWC dict'] = body_to_liwc(msg_json['all content'])
-      msg_json.pop('all content')
-  return msgs_selected, msgs_not_selected
 
-def process_channel(path_liwc_dict, channels_dir, channel_name, output_dir, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, seed_val):
+
+def process_channel(path_liwc_dict, channels_dir, channel_name, output_dir, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, seed_val,
+                    output_format = 'json', days = None, token_ids = False, keep_epoch = False, pipeline_depth = 0, journal = None,
+                    day_entries = None, completed = None):
   """
   process_workspace_channel loads necessary files, calls main function for message JSON processing, and writes results to specified path
   :param path_liwc_dict: name of .csv file that contains the LIWC dictionary
@@ -369,43 +421,98 @@ def process_channel(path_liwc_dict, channels_dir, channel_name, output_dir, list
   :param list_rem_thread: list of keys to be removed from each message JSON that relate to threading or responses
   :param print_cond: "True" or "False" to select whether errors or warnings should be printed
   :param seed_val: parameter added to every token before hashing
+  :param output_format: "json" (pretty-printed, default), "compact"/"jsonl" to stream day files message by message, or "parquet" (columnar)
+  :param days: list of day files to be processed (None processes every day file in the channel)
+  :param token_ids: write "hashed content" as packed token codes ("hashed ids")
+  :param keep_epoch: also keep the unix time stamps as numbers ("ts_epoch")
+  :param pipeline_depth: number of day files read ahead and written in the background while the next one is processed (0 disables)
+  :param journal: Journal that completed day files are recorded in (None to disable checkpoints), their tokens and hashes then go to
+                  its run writer instead of the returned dictionary
+  :param day_entries: dictionary of day file name -> entry of the day file (see day_entry), recorded in the journal
+  :param completed: dictionary of day file name -> journal entry of the day files already processed by an interrupted run, which are
+                    skipped
+  :return: dictionary of tokens and hashes in the channel and dictionary of channel statistics (token hash cache hits and misses, 
+           unprocessed messages in total and per day file, thread messages per output day file)
   """ 
 
   print('Processing channel {} at: {}'.format(channel_name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
       
   # Initialize dictionary with tokens and hashes
   hash_dict = {}
+  # Cache hits and misses before the channel is processed
+  hash_cache = get_hash_cache(seed_val)
+  stats_before = hash_cache.stats()
   
   # New channel name with "mod"
   channel_mod = os.path.join(output_dir, channel_name)
   if not os.path.exists(channel_mod):
     os.mkdir(channel_mod)
 
-  # Initializing a list for messages that do not get processed
-  all_msgs_not_processed = []
+  # Unprocessed messages of the channel are collected in the output directory and written once (or streamed as JSON Lines)
+  not_processed_path = msgs_not_processed_path(output_dir, channel_name, output_format)
+  os.makedirs(os.path.dirname(not_processed_path), exist_ok = True)
+  if output_format == 'json':
+    all_msgs_not_processed = []
+  else:
+    all_msgs_not_processed = JsonLinesSink(not_processed_path)
 
   # Extracting messages from every day (each file) in the channel
-  for day in os.listdir(channel_name):
-    with open(os.path.join(channel_name, day), 'r', encoding = 'utf-8') as f:
-      msgs_per_day = json.load(f)
-
-    # Call the function to process messages in a list
-    mod_msgs_per_day, msgs_not_processed_per_day = mod_msg_jsons_in_list(msgs_per_day, list_rem_gen, list_rem_thread, list_rem_blk, 
-                                                                          print_cond, hash_dict, seed_val, channel_name)
-
-    # Creating a list of messages do not get processed across all days
-    all_msgs_not_processed.extend(msgs_not_processed_per_day)
-
-    # Upload modified messages to new folder in output directory
-    with open(os.path.join(channel_mod, day), 'w', encoding = 'utf-8') as f:
-      json.dump(mod_msgs_per_day, f, ensure_ascii = False, indent = 4)
-
-    # Add list of unprocessed messages in channel to the new "channelname_mod" folder
-    with open(os.path.join(channels_dir, channel_name, 'messages_not_processed.json'), 'w', encoding = 'utf-8') as f:
-      json.dump(all_msgs_not_processed, f, ensure_ascii = False, indent = 4)
-  return hash_dict
-
-def process_workspace(path_liwc_dict, channels_dir, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, seed_val, parallel):
+  day_counts = []
+  day_threads = {}
+  days = os.listdir(channel_name) if days is None else days
+  completed = completed or {}
+  day_order = {day: i for i, day in enumerate(days)}
+  done_days = [day for day in days if day in completed]
+
+  def add_completed(until):
+    # Day files completed by an interrupted run (before position until) add what the journal recorded of them, in day order
+    while done_days and day_order[done_days[0]] < until:
+      entry = completed[done_days.pop(0)]
+      for msg_json in entry['msgs_not_processed']:
+        all_msgs_not_processed.append(msg_json)
+      day_threads[output_file_name(entry['day'], output_format)] = entry['threads']
+      day_counts.append((entry['day'], len(entry['msgs_not_processed'])))
+
+  todo_days = [day for day in days if day not in completed]
+  for day, prefetched, writer in iter_pipelined(todo_days, [os.path.join(channel_name, day) for day in todo_days], pipeline_depth,
+                                                get_run_metrics()):
+    add_completed(day_order[day])
+    # Unprocessed messages of the day file are kept for the journal before they go to the file of the channel
+    day_msgs_not_processed = [] if journal is not None else all_msgs_not_processed
+    num_before = len(all_msgs_not_processed) if output_format == 'json' else all_msgs_not_processed.count
+    thread_entries = process_day(channel_name, day, channel_mod, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, hash_dict, seed_val,
+                                 output_format, day_msgs_not_processed, token_ids, keep_epoch, prefetched, writer)
+    day_threads[output_file_name(day, output_format)] = thread_entries
+    if journal is not None:
+      for msg_json in day_msgs_not_processed:
+        all_msgs_not_processed.append(msg_json)
+      # Tokens of the day file go to the sorted runs the journal checkpoints
+      journal.hash_runs.add(hash_dict)
+      hash_dict.clear()
+      journal.add(dict(day_entries[day], channel = channel_name, msgs_not_processed = day_msgs_not_processed, threads = thread_entries),
+                  os.path.join(channel_mod, output_file_name(day, output_format)), writer)
+    num_after = len(all_msgs_not_processed) if output_format == 'json' else all_msgs_not_processed.count
+    day_counts.append((day, num_after - num_before))
+  add_completed(len(days))
+
+  # Add list of unprocessed messages in channel to the output directory
+  if output_format == 'json':
+    write_day_file(not_processed_path, all_msgs_not_processed, output_format)
+  else:
+    all_msgs_not_processed.close()
+
+  channel_stats = {key: val - stats_before[key] for key, val in hash_cache.stats().items()}
+  channel_stats['msgs_not_processed'] = sum(count for _, count in day_counts)
+  channel_stats['days'] = day_counts
+  channel_stats['threads'] = day_threads
+  return hash_dict, channel_stats
+
+def process_workspace(path_liwc_dict, channels_dir, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, seed_val, parallel,
+                      hash_cache_path = None, hash_cache_size = DEFAULT_CACHE_SIZE, output_format = 'json',
+                      liwc_prefix_match = 'trie', liwc_index_path = None, num_workers = None, chunk_size = 1, incremental = False,
+                      collect_metrics = False, profile = False, token_ids = False, keep_epoch = False, pipeline_depth = 0, json_backend = 'auto',
+                      members_csv = None, hash_spill_size = DEFAULT_SPILL_SIZE, start_method = None, shard = None,
+                      checkpoint_every = DEFAULT_CHECKPOINT_EVERY, resume = False):
   """
   process_workspace loads necessary files, loops through all workspace channels, processes message JSONs, and writes results to specified path
 
@@ -417,100 +524,532 @@ def process_workspace(path_liwc_dict, channels_dir, list_rem_gen, list_rem_threa
   :param print_cond: True or False to select whether errors or warnings should be printed
   :param seed_val: parameter added to every token before hashing
   :param parallel: whether channels should be processed sequentially or in parallel
+  :param hash_cache_path: path of the token hash cache file that is preloaded and saved after the run (None to disable)
+  :param hash_cache_size: maximum number of tokens kept in the token hash cache (and saved to the cache file, so it should be at least the
+                          size of the vocabulary, see HashCacheWriter)
+  :param output_format: "json" (pretty-printed, default), "compact"/"jsonl" to stream day files message by message, or "parquet" (columnar)
+  :param liwc_prefix_match: "trie" to match LIWC wildcard terms by longest prefix, "stem" for the original Porter stem matching
+  :param liwc_index_path: path of the compiled LIWC index that is reused across runs (None to disable)
+  :param num_workers: number of worker processes when processing in parallel (None uses the number of CPUs)
+  :param chunk_size: number of day files sent to a worker process at a time when processing in parallel
+  :param incremental: only process day files that are new or changed since the previous run (as recorded in its manifest)
+  :param collect_metrics: write the time, calls and bytes of every stage per channel to run_metrics.json in the output directory
+  :param profile: profile the run (parent and worker processes) with cProfile and write profile.pstats to the output directory
+  :param token_ids: write "hashed content" as packed token codes ("hashed ids"), rendered back to hashes with the vocabulary file
+  :param keep_epoch: also keep the unix time stamps of messages and replies as numbers ("ts_epoch"), for sorting without parsing dates
+  :param pipeline_depth: number of day files read ahead and written in the background while the next one is processed (0 disables),
+                         in parallel mode within every chunk of chunk_size day files sent to a worker process
+  :param json_backend: library that parses and serializes JSON ("orjson", "ujson", "json"), "auto" picks the fastest one installed
+  :param members_csv: path of the .csv file with metadata of workspace users (userid, email), whose user IDs are replaced with hashed
+                      email IDs in user fields and mentions while messages are processed (None keeps user IDs)
+  :param hash_spill_size: number of tokens and hashes a process holds before it writes them to a sorted run, which bounds the memory of
+                          the hash dictionary
+  :param start_method: start method of the worker processes ("fork", "spawn" or "forkserver", None for the default of the platform)
+  :param shard: (index, count) of the shard of the day files processed by this run, written to slack_output_shards/shard-<index>-of-<count>
+                and combined with the other shards by merge_shards (None processes every day file into slack_output)
+  :param checkpoint_every: number of day files a process writes between checkpoints of a full run, which journal the completed day files
+                           and their tokens in the checkpoints directory of the output directory (0 disables)
+  :param resume: continue the run interrupted in the output directory from its checkpoints, skipping the day files it completed (a
+                 fresh run if there are no checkpoints with the same settings)
   """ 
   start = datetime.now()
   print("Processing started at: ", start.strftime("%Y-%m-%d %H:%M:%S"))
+  json_backend = set_json_backend(json_backend).name
+  print("JSON backend: " + json_backend)
+
+  # Metrics are collected from a clean state in every run
+  disable_run_metrics()
+  run_metrics = enable_run_metrics() if collect_metrics else None
+  if profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
   
   # Output_dir is in the same directory as the data
   output_dir = os.path.join(os.path.abspath(os.path.join(channels_dir, os.pardir)), 'slack_output')
-  # Removing directory if it already exists so we start fresh 
-  if os.path.exists(output_dir):
-    shutil.rmtree(output_dir)
-  os.mkdir(output_dir)
-  
-  # Initialize dictionary with tokens and hashes
-  hash_dict = {}
+  # Extracting all channels in the Slack workspace
+  channel_list = [channel_name for channel_name in os.listdir(channels_dir) if (os.path.isdir(channel_name))]
+  # A shard only processes its own day files, into its own output directory that merge_shards combines with the other shards
+  channel_days = None
+  if shard is not None:
+    if incremental:
+      raise ValueError('Sharded runs cannot be incremental, run the merged output incrementally instead')
+    output_dir = shard_output_dir(channels_dir, *shard)
+    channel_days = shard_channel_days(channels_dir, channel_list, *shard)
+    channel_list = list(channel_days)
+    print('Shard {} of {}: {} day files in {} channels'.format(shard[0], shard[1], sum(len(days) for days in channel_days.values()),
+                                                               len(channel_list)))
+
+  # Comparing the export with the manifest of the previous run, which is only reused if no setting changed
+  config = run_config(seed_val, list_rem_gen, list_rem_thread, list_rem_blk, path_liwc_dict, liwc_prefix_match, output_format, token_ids, keep_epoch,
+                      members_csv)
+  prev_manifest = load_manifest(output_dir) if incremental else None
+  if prev_manifest is not None and prev_manifest['config'] != config:
+    print('Seed, LIWC dictionary or settings changed since the previous run, all day files are processed')
+    prev_manifest = None
+  # Day files are only hashed by incremental runs, full runs (and resumed ones) tell them apart by size and modification time
+  changed_days, removed_days, removed_channels, day_entries = plan_incremental(channels_dir, channel_list, prev_manifest, channel_days,
+                                                                               digest = incremental)
+
+  # Checkpoints of a full run record its settings and the day files completed by every process, so an interrupted run can be resumed
+  checkpoint_dir = os.path.join(output_dir, CHECKPOINTS_DIR)
+  checkpoint_manifest = {'config': config, 'shard': list(shard) if shard is not None else None, 'channels': channel_list}
+  prev_checkpoint = None
+  if resume:
+    if incremental:
+      raise ValueError('Incremental runs cannot be resumed, run the incremental update again instead')
+    prev_checkpoint = load_manifest(checkpoint_dir)
+    if prev_checkpoint is None or prev_checkpoint['config'] != config or prev_checkpoint['shard'] != checkpoint_manifest['shard']:
+      print('No checkpoints of an interrupted run with the same settings, all day files are processed')
+      prev_checkpoint = None
+  checkpointing = bool(checkpoint_every) and prev_manifest is None
+  # Journal entry of every day file completed by the interrupted run, per channel
+  completed = {channel_name: {} for channel_name in channel_list}
+
+  # Tokens and hashes are written to sorted runs and merged into the hash dictionary at the end, and the vocabulary of token codes
+  # (written from runs sorted by code) detects hash collisions
+  run_dir = os.path.join(output_dir, RUNS_DIR)
+  hash_runs = HashRunWriter(run_dir, hash_spill_size)
+  vocab = VocabularyWriter(os.path.join(output_dir, VOCAB_FN), os.path.join(output_dir, VOCAB_RUNS_DIR), hash_spill_size)
+  # Number of unprocessed messages per channel and day file
+  day_not_processed = {channel_name: {} for channel_name in channel_list}
+  # Unprocessed messages of previous runs, for channels whose file of unprocessed messages is rewritten
+  prev_msgs_not_processed = {}
+
+  if prev_manifest is None and prev_checkpoint is None:
+    # Removing directory if it already exists so we start fresh 
+    if os.path.exists(output_dir):
+      shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+  elif prev_manifest is None:
+    # Day files journaled by the interrupted run are kept unless they changed since, outputs of day files and channels that are no longer
+    # in the export are removed
+    journal_entries, journal_literals = load_journal(checkpoint_dir)
+    for (channel_name, day), entry in journal_entries.items():
+      if channel_name not in day_entries:
+        continue
+      if day in day_entries[channel_name] and same_day_file(day_entries[channel_name][day], entry):
+        completed[channel_name][day] = entry
+      elif day not in day_entries[channel_name] and os.path.exists(os.path.join(output_dir, channel_name, output_file_name(day, output_format))):
+        os.remove(os.path.join(output_dir, channel_name, output_file_name(day, output_format)))
+    for channel_name in prev_checkpoint['channels']:
+      if channel_name not in channel_list:
+        shutil.rmtree(os.path.join(output_dir, channel_name), ignore_errors = True)
+        if os.path.exists(msgs_not_processed_path(output_dir, channel_name, output_format)):
+          os.remove(msgs_not_processed_path(output_dir, channel_name, output_format))
+    print('Resumed run: {} of {} day files already processed'.format(sum(len(days) for days in completed.values()),
+                                                                       sum(len(days) for days in changed_days.values())))
+    # Tokens of the interrupted run are in its runs, or in the hash dictionary if it was interrupted once they were merged
+    vocab.add_literals(journal_literals)
+    if os.path.exists(os.path.join(output_dir, 'hash_dict.json')):
+      with open(os.path.join(output_dir, 'hash_dict.json'), 'r', encoding = 'utf-8') as f:
+        hash_runs.add(iter_json_object(f))
+  else:
+    print('Incremental run: {} new or changed day files'.format(sum(len(days) for days in changed_days.values())))
+    # Merging new tokens into the hash dictionary of previous runs (and dropping runs of an interrupted run)
+    shutil.rmtree(run_dir, ignore_errors = True)
+    with open(os.path.join(output_dir, 'hash_dict.json'), 'r', encoding = 'utf-8') as f:
+      hash_runs.add(iter_json_object(f))
+    if os.path.exists(os.path.join(output_dir, VOCAB_FN)):
+      vocab.add_file(os.path.join(output_dir, VOCAB_FN))
+
+    # Removing outputs of channels and day files that are no longer in the export
+    for channel_name in removed_channels:
+      shutil.rmtree(os.path.join(output_dir, channel_name), ignore_errors = True)
+      if os.path.exists(msgs_not_processed_path(output_dir, channel_name, output_format)):
+        os.remove(msgs_not_processed_path(output_dir, channel_name, output_format))
+      if os.path.exists(os.path.join(output_dir, THREADS_DIR, channel_name + '.json')):
+        os.remove(os.path.join(output_dir, THREADS_DIR, channel_name + '.json'))
+    for channel_name, days in removed_days.items():
+      for day in days:
+        os.remove(os.path.join(output_dir, channel_name, output_file_name(day, output_format)))
+
+    for channel_name in channel_list:
+      prev_days = prev_manifest['channels'].get(channel_name, {}).get('days', [])
+      day_not_processed[channel_name] = {entry['day']: entry['msgs_not_processed'] for entry in prev_days}
+      if prev_days and (changed_days[channel_name] or removed_days[channel_name]):
+        prev_msgs_not_processed[channel_name] = split_by_day(read_day_file(msgs_not_processed_path(output_dir, channel_name, output_format)),
+                                                             [(entry['day'], entry['msgs_not_processed']) for entry in prev_days])
+
+  if checkpointing:
+    os.makedirs(checkpoint_dir, exist_ok = True)
+    save_manifest(checkpoint_dir, checkpoint_manifest)
+
+  # Only channels with new or changed day files are processed (every channel when starting fresh)
+  channels_to_process = [channel_name for channel_name in channel_list if prev_manifest is None or changed_days[channel_name]]
+  # Day files left to process, without those completed by an interrupted run
+  todo_days = {channel_name: [day for day in days if day not in completed[channel_name]] for channel_name, days in changed_days.items()}
+  # Initialize statistics (token hash cache hits and misses, unprocessed messages) per channel
+  channel_stats = {}
   # Read LIWC dictionary
-  read_liwc_dictionary(path_liwc_dict)
+  read_liwc_dictionary(path_liwc_dict, liwc_prefix_match, liwc_index_path)
+  # Hashed IDs of workspace users (worker processes inherit the mapping)
+  read_user_ids(members_csv, output_dir, seed_val)
+
+  # Preload hashes of known vocabulary from previous runs (worker processes inherit the loaded cache)
+  hash_cache = get_hash_cache(seed_val, hash_cache_size)
+  if hash_cache_path:
+    print('Loaded {} cached token hashes'.format(hash_cache.load(hash_cache_path)))
 
+  usage = None
   if parallel:
-    pool = multiprocessing.Pool(processes = multiprocessing.cpu_count())
-    results = [pool.apply_async(process_channel, args = (path_liwc_dict, channels_dir, channel_name, output_dir, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, seed_val)) 
-              for channel_name in os.listdir(channels_dir) if (os.path.isdir(channel_name))]
-    pool.close()
-    pool.join()
-    # Combining all results
-    for r in results:
-      hash_dict.update(r.get())
+    if profile:
+      os.makedirs(os.path.join(output_dir, 'profiles'), exist_ok = True)
+    for channel_name in channels_to_process:
+      os.makedirs(os.path.join(output_dir, channel_name), exist_ok = True)
+      channel_stats[channel_name] = {'hits': 0, 'misses': 0, 'msgs_not_processed': 0, 'threads': {}}
+    # Unprocessed messages per channel and day file, written in day order once all units are done
+    msgs_not_processed = {channel_name: {} for channel_name in channels_to_process}
+    for channel_name in channels_to_process:
+      for day, entry in completed[channel_name].items():
+        msgs_not_processed[channel_name][day] = entry['msgs_not_processed']
+        channel_stats[channel_name]['threads'][output_file_name(day, output_format)] = entry['threads']
+
+    # Work is split into (channel, day file) units that are handed out largest first
+    units = [DayUnit(channels_dir = channels_dir, channel_name = channel_name, day = day, output_dir = output_dir,
+                     list_rem_gen = list_rem_gen, list_rem_thread = list_rem_thread, list_rem_blk = list_rem_blk, print_cond = print_cond,
+                     seed_val = seed_val, output_format = output_format, token_ids = token_ids, keep_epoch = keep_epoch,
+                     collect_metrics = collect_metrics, profile = profile, pipeline_depth = pipeline_depth, json_backend = json_backend,
+                     hash_spill_size = hash_spill_size,
+                     checkpoint = UnitCheckpoint(checkpoint_dir = checkpoint_dir, every = checkpoint_every,
+                                                 day_entry = day_entries[channel_name][day]) if checkpointing else None)
+             for channel_name, day, _ in plan_day_units(channels_dir, channels_to_process, todo_days)]
+    usage = WorkerUsage()
+    if profile:
+      # Worker processes are profiled by their own profiler, not by a copy of the parent's
+      profiler.disable()
+    # Worker processes attach to the LIWC tables in their initializer, whatever the start method
+    liwc_tables_path = os.path.join(output_dir, LIWC_TABLES_FN)
+    liwc_engine.save_tables(liwc_tables_path)
+    worker_args = (liwc_tables_path, os.path.join(output_dir, USER_IDS_FN) if members_csv else None, seed_val, hash_cache_size, hash_cache_path)
+    with multiprocessing.get_context(start_method).Pool(processes = num_workers or multiprocessing.cpu_count(), initializer = init_worker,
+                                                        initargs = worker_args) as pool:
+      if profile:
+        profiler.enable()
+      if pipeline_depth:
+        # Every chunk of day files is pipelined by the worker process it is sent to
+        chunks = [units[i:i + chunk_size] for i in range(0, len(units), chunk_size)]
+        unit_results = (result for chunk_results in pool.imap_unordered(process_day_units, chunks) for result in chunk_results)
+      else:
+        unit_results = pool.imap_unordered(process_day_unit, units, chunksize = chunk_size)
+      for (channel_name, day, new_literals, day_msgs_not_processed, thread_entries, unit_stats, (worker_id, busy_time),
+           unit_metrics) in unit_results:
+        vocab.add_literals(new_literals)
+        msgs_not_processed[channel_name][day] = day_msgs_not_processed
+        channel_stats[channel_name]['threads'][output_file_name(day, output_format)] = thread_entries
+        for key, val in unit_stats.items():
+          channel_stats[channel_name][key] += val
+        usage.add(worker_id, busy_time)
+        if unit_metrics is not None:
+          run_metrics.merge(unit_metrics)
+      # Worker processes write their last checkpoint and run of tokens and hashes when they exit
+      pool.close()
+      pool.join()
+    os.remove(liwc_tables_path)
+    usage.print_summary()
+
+    # Add list of unprocessed messages in each channel to the output directory
+    os.makedirs(os.path.join(output_dir, 'messages_not_processed'), exist_ok = True)
+    for channel_name, days in msgs_not_processed.items():
+      day_counts = [(day, len(days[day])) for day in changed_days[channel_name]]
+      write_day_file(msgs_not_processed_path(output_dir, channel_name, output_format),
+                     [msg_json for day in changed_days[channel_name] for msg_json in days[day]], 'json' if output_format == 'json' else 'jsonl')
+      channel_stats[channel_name]['msgs_not_processed'] = sum(count for _, count in day_counts)
+      channel_stats[channel_name]['days'] = day_counts
   
   else:
-    # Extracting all channels in the Slack workspace
-    channel_list = [channel_name for channel_name in os.listdir(channels_dir) if (os.path.isdir(channel_name))]
-    list_hash_dict = []
     # Process messages in each channel
-    for channel_name in channel_list:
-      curr_hash_dict = process_channel(path_liwc_dict, channels_dir, channel_name, output_dir, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, seed_val)
-      list_hash_dict.append(curr_hash_dict)
-    
-    # Combining hash dictionaries across all channels
-    for h in list_hash_dict:
-      hash_dict.update(h)
+    journal = Journal(checkpoint_dir, hash_runs, literal_tokens, checkpoint_every) if checkpointing else None
+    for channel_name in channels_to_process:
+      curr_hash_dict, channel_stats[channel_name] = process_channel(path_liwc_dict, channels_dir, channel_name, output_dir, list_rem_gen, list_rem_thread, list_rem_blk, print_cond, seed_val, output_format,
+                                                                    changed_days[channel_name], token_ids, keep_epoch, pipeline_depth, journal,
+                                                                    day_entries[channel_name],
+                                                                    completed[channel_name])
+      # Hash dictionaries of channels are combined by the merge of sorted runs
+      hash_runs.add(curr_hash_dict)
+    if journal is not None:
+      journal.checkpoint()
+    vocab.add_literals(literal_tokens)
+
+  for channel_name, stats in channel_stats.items():
+    day_not_processed[channel_name].update(stats['days'])
+
+  # Thread index of every channel with new, changed or removed day files (the index of previous runs is updated by day file)
+  for channel_name in channel_list:
+    if channel_name not in channel_stats and not removed_days[channel_name]:
+      continue
+    thread_index = ThreadIndex.from_file(output_dir, channel_name) if prev_manifest is not None else ThreadIndex(channel_name)
+    for day in removed_days[channel_name]:
+      thread_index.remove_day(output_file_name(day, output_format))
+    for day, entries in channel_stats.get(channel_name, {}).get('threads', {}).items():
+      thread_index.set_day(day, entries)
+    thread_index.save(output_dir)
+
+  # Merging unprocessed messages of unchanged day files back into the files of unprocessed messages
+  for channel_name in channel_list:
+    if prev_manifest is None or not (changed_days[channel_name] or removed_days[channel_name]):
+      continue
+    not_processed_path = msgs_not_processed_path(output_dir, channel_name, output_format)
+    new_msgs = split_by_day(read_day_file(not_processed_path), channel_stats[channel_name]['days']) if channel_name in channel_stats else {}
+    prev_msgs = prev_msgs_not_processed.get(channel_name, {})
+    days = list(day_entries[channel_name])
+    write_day_file(not_processed_path, [msg_json for day in days for msg_json in new_msgs.get(day, prev_msgs.get(day, []))],
+                   'json' if output_format == 'json' else 'jsonl')
       
   # Upload hash dictionary (across all channels) to the directory    
-  with open(os.path.join(output_dir, 'hash_dict.json'), 'w', encoding = 'utf-8') as f:
-    json.dump(hash_dict, f, ensure_ascii = False, indent = 4)
+  # Runs of the parent and worker processes are merged into one file sorted by token, the same whatever the number of processes. It is
+  # pretty-printed like the day files, or written compact for the other formats
+  hash_runs.spill()
+  # The cache is saved with the vocabulary of this run (including tokens hashed in worker processes) as it is merged
+  cache_writer = HashCacheWriter(hash_cache_path, seed_val, hash_cache.max_size) if hash_cache_path else None
+  with HashDictWriter(os.path.join(output_dir, 'hash_dict.json'), pretty = output_format == 'json') as hash_dict_writer:
+    for chunk in iter_merged_chunks(run_dir, hash_spill_size, remove = False):
+      hash_dict_writer.write(chunk)
+      vocab.add_hashes(chunk)
+      if cache_writer is not None:
+        cache_writer.write(chunk)
+  if cache_writer is not None:
+    cache_writer.close()
+  # Runs are only removed once the hash dictionary is in place, so a resumed run always finds the tokens in one or the other
+  shutil.rmtree(run_dir, ignore_errors = True)
+
+  # Vocabulary of token codes, and tokens of different text that share a hash
+  vocab.close()
+  vocab.print_collisions()
+
+  # Manifest of the input day files and settings, used by the next incremental run (and by merge_shards for the day files of a shard)
+  manifest = {'config': config,
+              'channels': {channel_name: {'days': [dict(entry, msgs_not_processed = day_not_processed[channel_name].get(day, 0))
+                                                   for day, entry in day_entries[channel_name].items()]}
+                           for channel_name in channel_list}}
+  if shard is not None:
+    manifest['shard'] = list(shard)
+  save_manifest(output_dir, manifest)
+  # The run is complete, it no longer needs its checkpoints
+  shutil.rmtree(checkpoint_dir, ignore_errors = True)
+
+  # Run summary
+  for channel_name, stats in channel_stats.items():
+    print("Channel {}: {} messages not processed".format(channel_name, stats['msgs_not_processed']))
+  print("Token hash cache hits: {}, misses: {}".format(sum(stats['hits'] for stats in channel_stats.values()),
+                                                       sum(stats['misses'] for stats in channel_stats.values())))
+
+  if run_metrics is not None:
+    run_metrics.print_summary()
+    run_metrics.save(output_dir, parallel = parallel,
+                     hash_cache = {key: sum(stats[key] for stats in channel_stats.values()) for key in ['hits', 'misses']},
+                     msgs_not_processed = {channel_name: stats['msgs_not_processed'] for channel_name, stats in channel_stats.items()},
+                     workers = usage.summary() if usage is not None else None,
+                     hash_collisions = len(vocab.collisions))
+    disable_run_metrics()
+  if profile:
+    profiler.disable()
+    os.makedirs(os.path.join(output_dir, 'profiles'), exist_ok = True)
+    profiler.dump_stats(os.path.join(output_dir, 'profiles', 'parent.pstats'))
+    profile_dir = os.path.join(output_dir, 'profiles')
+    merge_profiles([os.path.join(profile_dir, fn) for fn in sorted(os.listdir(profile_dir))], output_dir)
 
   end = datetime.now()
   print("Processing ended at: ", end.strftime("%Y-%m-%d %H:%M:%S"))
   print("Total processing time: ", end - start)
 
-def hash_ids(csv_path):
+def merge_shards(channels_dir, num_shards, hash_spill_size = DEFAULT_SPILL_SIZE):
+  """
+  merge_shards combines the outputs of the shards of a workspace (see process_workspace) into slack_output, as if the workspace had been
+  processed by one run: day files, unprocessed messages and thread index of every channel, hash dictionary, vocabulary and manifest
+
+  Day files are hard-linked from the shard directories when possible (copied otherwise), so the shard outputs are kept.
+
+  :param channels_dir: path to directory that contains the exported Slack workspace (gives the order of the day files of every channel)
+  :param num_shards: number of shards
+  :param hash_spill_size: number of tokens and hashes held before they are written to a sorted run
+  """
+  start = datetime.now()
+  print("Merging started at: ", start.strftime("%Y-%m-%d %H:%M:%S"))
+  output_dir = os.path.join(os.path.abspath(os.path.join(channels_dir, os.pardir)), 'slack_output')
+  shard_dirs = [shard_output_dir(channels_dir, shard_index, num_shards) for shard_index in range(num_shards)]
+
+  # Every shard has to be complete, with the settings of the other shards
+  manifests = []
+  for shard_index, shard_dir in enumerate(shard_dirs):
+    manifest = load_manifest(shard_dir)
+    if manifest is None or manifest.get('shard') != [shard_index, num_shards]:
+      raise ValueError('Shard {} of {} has no complete output in {}'.format(shard_index, num_shards, shard_dir))
+    if manifests and manifest['config'] != manifests[0]['config']:
+      raise ValueError('Shard {} of {} was processed with other settings than shard 0'.format(shard_index, num_shards))
+    manifests.append(manifest)
+  config = manifests[0]['config']
+  output_format = config['output_format']
+
+  # Shard and manifest entry of every day file, in the order of the export
+  owners = {}
+  for shard_index, manifest in enumerate(manifests):
+    for channel_name, channel in manifest['channels'].items():
+      for entry in channel['days']:
+        owners[(channel_name, entry['day'])] = (shard_index, entry)
+  channel_list = [channel_name for channel_name in os.listdir(channels_dir) if os.path.isdir(os.path.join(channels_dir, channel_name))]
+  channel_days = {channel_name: os.listdir(os.path.join(channels_dir, channel_name)) for channel_name in channel_list}
+  missing = [os.path.join(channel_name, day) for channel_name, days in channel_days.items() for day in days if (channel_name, day) not in owners]
+  if missing:
+    raise ValueError('{} day files are not in any shard (e.g. {}), the export changed since the shards were processed'.format(len(missing), missing[0]))
+
+  if os.path.exists(output_dir):
+    shutil.rmtree(output_dir)
+  os.makedirs(os.path.join(output_dir, 'messages_not_processed'))
+  for channel_name in channel_list:
+    os.mkdir(os.path.join(output_dir, channel_name))
+    # Day files
+    for day in channel_days[channel_name]:
+      fn = output_file_name(day, output_format)
+      src = os.path.join(shard_dirs[owners[(channel_name, day)][0]], channel_name, fn)
+      try:
+        os.link(src, os.path.join(output_dir, channel_name, fn))
+      except OSError:
+        shutil.copyfile(src, os.path.join(output_dir, channel_name, fn))
+
+    # Unprocessed messages, split by day file in every shard and written in day order
+    shard_msgs = {}
+    for shard_index, shard_dir in enumerate(shard_dirs):
+      if channel_name in manifests[shard_index]['channels']:
+        shard_msgs.update(split_by_day(read_day_file(msgs_not_processed_path(shard_dir, channel_name, output_format)),
+                                       [(entry['day'], entry['msgs_not_processed']) for entry in manifests[shard_index]['channels'][channel_name]['days']]))
+    write_day_file(msgs_not_processed_path(output_dir, channel_name, output_format),
+                   [msg_json for day in channel_days[channel_name] for msg_json in shard_msgs[day]], 'json' if output_format == 'json' else 'jsonl')
+
+    # Thread index
+    thread_index = ThreadIndex(channel_name)
+    for shard_dir in shard_dirs:
+      for day, entries in ThreadIndex.from_file(shard_dir, channel_name).days.items():
+        thread_index.set_day(day, entries)
+    thread_index.save(output_dir)
+
+  # Hash dictionaries of the shards (sorted by token) are merged like the runs of one run
+  run_dir = os.path.join(output_dir, RUNS_DIR)
+  hash_runs = HashRunWriter(run_dir, hash_spill_size)
+  for shard_dir in shard_dirs:
+    with open(os.path.join(shard_dir, 'hash_dict.json'), 'r', encoding = 'utf-8') as f:
+      hash_runs.add(iter_json_object(f))
+  hash_runs.spill()
+  with HashDictWriter(os.path.join(output_dir, 'hash_dict.json'), pretty = output_format == 'json') as hash_dict_writer:
+    for chunk in iter_merged_chunks(run_dir, hash_spill_size):
+      hash_dict_writer.write(chunk)
+
+  # Vocabulary of token codes, with the hash collisions between shards
+  vocab = VocabularyWriter(os.path.join(output_dir, VOCAB_FN), os.path.join(output_dir, VOCAB_RUNS_DIR), hash_spill_size)
+  for shard_dir in shard_dirs:
+    vocab.add_file(os.path.join(shard_dir, VOCAB_FN))
+  vocab.close()
+  vocab.print_collisions()
+
+  # Hashed IDs of workspace users are the same in every shard
+  if os.path.exists(os.path.join(shard_dirs[0], USER_IDS_FN)):
+    shutil.copyfile(os.path.join(shard_dirs[0], USER_IDS_FN), os.path.join(output_dir, USER_IDS_FN))
+
+  # Manifest of the whole workspace, so the merged output can be updated by incremental runs
+  save_manifest(output_dir, {'config': config,
+                             'channels': {channel_name: {'days': [owners[(channel_name, day)][1] for day in channel_days[channel_name]]}
+                                          for channel_name in channel_list}})
+
+  end = datetime.now()
+  print("Merged {} shards into {}".format(num_shards, output_dir))
+  print("Total merging time: ", end - start)
+
+
+
+def hash_ids(csv_path, output_dir, seed_val = None, chunk_size = CSV_CHUNK_SIZE):
   """
   hash_ids takes a .csv file with metadata of workspace users and returns a dict of user IDs and hashed email IDs
 
-  :param csv_path: path of the .csv file
+  The file is read in chunks of rows, and the mapping is written to hash_dict_ids.json in the output directory.
+
+  :param csv_path: path of the .csv file (columns "userid" and "email")
+  :param output_dir: directory of the output of data
+  :param seed_val: seed of the keyed hash of emails (None for the unseeded md5 hash)
+  :param chunk_size: number of rows read at a time
+  :return: dictionary of user IDs and hashed email IDs
   """
-  # Read user details export
-  df = pd.read_csv(csv_path)
-  # Initialize dictionary of hashes and tokens
+  # Initialize dictionary of user IDs and hashes
   hash_dict_ids = {}
-  # Extract info per user
-  for row in df.index:
-    email_id = df.iloc[row]['email']
-    hash_object = hashlib.md5(email_id.encode())
-    # Hexadecimal version of the md5hash
-    hash_dict_ids[df.iloc[row]['userid']] = str(hash_object.hexdigest())
+  num_skipped = 0
+  for chunk_ids, chunk_skipped in iter_user_id_chunks(csv_path, seed_val, chunk_size):
+    hash_dict_ids.update(chunk_ids)
+    num_skipped += chunk_skipped
+  if num_skipped:
+    print('{} users without user ID or email are not hashed'.format(num_skipped))
   
-  # Upload hash dictionary to the directory
-  with open('hash_dict_ids.json', 'w', encoding = 'utf-8') as f:
-    json.dump(hash_dict_ids, f, ensure_ascii = False, indent = 4)
+  # Upload hash dictionary to the output directory
+  with open(os.path.join(output_dir, USER_IDS_FN), 'wb') as f:
+    get_json_backend().dump(hash_dict_ids, f, pretty = True)
+  return hash_dict_ids
+
+
+
+def read_user_ids(members_csv, output_dir, seed_val):
+  """
+  read_user_ids hashes the user IDs of workspace members (see hash_ids) and sets the mapping applied while messages are processed
+
+  :param members_csv: path of the .csv file with metadata of workspace users (None keeps user IDs)
+  :param output_dir: directory of the output of data
+  :param seed_val: seed of the keyed hash of emails
+  """
+  global user_id_map
+  user_id_map = hash_ids(members_csv, output_dir, seed_val) if members_csv else None
     
     
 words2categories = {}
 prefixes2categories = {}
-
-def read_liwc_dictionary(liwc_fn):
-    with open(liwc_fn) as csvfile:
-        csvreader = csv.reader(csvfile)
-        header = next(csvreader)
-        for row in csvreader:
-            for cat, term in zip(header, row):
-                term = term.lower().strip()
-                if not term:
-                    continue
-                global prefixes2categories, word2categories
-                if ".*" in term:
-                    # This is a prefix
-                    prefix = term.replace('.*', '')
-                    prefix2 = stemmer.stem(prefix)
-                    prefixes2categories.setdefault(prefix2, []).append(cat)
-                else:
-                    # Full word
-                    words2categories.setdefault(term, []).append(cat)
+# .csv file that the legacy lookups of get_categories_from_word are built from on first use (None once they are built)
+legacy_liwc_fn = None
+# Engine used to score messages, built from the same dictionary
+liwc_engine = None
+
+def read_liwc_dictionary(liwc_fn, prefix_match = 'trie', index_path = None):
+    """
+    read_liwc_dictionary loads the LIWC dictionary and builds the engine used to score messages
+
+    :param liwc_fn: name of .csv file that contains the LIWC dictionary
+    :param prefix_match: "trie" to match wildcard terms by longest prefix, "stem" for the original Porter stem matching
+    :param index_path: path of the compiled index (a LIWC tables file), attached if it was built from the same .csv contents and prefix
+                       match (see index_key) and written otherwise (None to disable)
+    """
+    global liwc_engine, legacy_liwc_fn
+    # The legacy lookups (with the stem of every wildcard term) are only built if get_categories_from_word is called
+    words2categories.clear()
+    prefixes2categories.clear()
+    legacy_liwc_fn = liwc_fn
+
+    key = index_key(liwc_fn, prefix_match) if index_path else None
+    if index_path and os.path.exists(index_path):
+        try:
+            liwc_engine = LiwcEngine.attach(index_path, key)
+        except ValueError:
+            # Not a tables file (e.g. an index written by an older version)
+            liwc_engine = None
+        if liwc_engine is not None:
+            return
+    liwc_engine = LiwcEngine.from_csv(liwc_fn, prefix_match)
+    if index_path:
+        liwc_engine.save_tables(index_path, key)
+
+
+def build_legacy_liwc():
+    """
+    build_legacy_liwc fills words2categories and prefixes2categories (keyed by the stems of wildcard terms) from the dictionary read last
+    """
+    global legacy_liwc_fn
+    if legacy_liwc_fn is None:
+        return
+    _, liwc_words, liwc_prefixes = read_liwc_csv(legacy_liwc_fn)
+    for term, cats in liwc_words.items():
+        words2categories.setdefault(term, []).extend(cats)
+    for prefix, cats in liwc_prefixes.items():
+        # This is a prefix
+        prefixes2categories.setdefault(stemmer.stem(prefix), []).extend(cats)
+    legacy_liwc_fn = None
 
 
 def get_categories_from_word(w):
 
+    build_legacy_liwc()
     cats = []
     if w in words2categories:
         cats += words2categories[w]
@@ -533,8 +1072,3 @@ def liwc_cats_to_dict(cats):
     countdict = Counter(cats)
     return dict(sorted(countdict.items(), key=itemgetter(1), reverse=True))
 
-
-
-def body_to_liwc(cleaned_toks):
-  liwc_cat_counts = liwc_cats_to_dict(word_to_liwc_cats(cleaned_toks))
-  return liwc_cat_counts
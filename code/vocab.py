@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import base64
+import struct
+import shutil
+import hashlib
+from array import array
+import numpy as np
+from hashmerge import new_run_path, write_run, iter_merged, merge_runs, DEFAULT_SPILL_SIZE
+
+
+
+# Header of the vocabulary file, followed by the number of hashed tokens and of tokens kept as they are
+VOCAB_MAGIC = b'SLKVOC03'
+# Name of the vocabulary file in the output directory
+VOCAB_FN = 'vocab.bin'
+# Directory of the sorted runs of token codes in the output directory (removed once they are merged into the vocabulary file)
+VOCAB_RUNS_DIR = 'vocab_runs'
+_HEX_DIGITS = frozenset('0123456789abcdef')
+# Code written before the code of a token kept as it is, which is looked up in the table of literals instead of the table of hashes
+# (a hash with the value of the mark is written as two marks)
+LITERAL_MARK = 0xFFFFFFFF
+# Codes of tokens that are kept as they are (links, numbers, sentence ends, user IDs and emojis)
+_literal_codes = {}
+
+
+
+def literal_code(repl):
+  """
+  literal_code returns the 32-bit code of a token of "hashed content" that is kept as it is: its unseeded md5 hash, below LITERAL_MARK
+
+  :param repl: token that is not hashed (e.g. "SENT_END", "@U02MZ6P1EF9", "blush")
+  :return: integer code
+  """
+
+  code = _literal_codes.get(repl)
+  if code is None:
+    code = _literal_codes[repl] = int(hashlib.md5(repl.encode('utf-8')).hexdigest()[:8], 16) % LITERAL_MARK
+  return code
+
+
+
+def is_literal(repl):
+  return not (len(repl) == 8 and _HEX_DIGITS.issuperset(repl))
+
+
+
+def pack_hashed_content(hashed_content):
+  """
+  pack_hashed_content converts "hashed content" to a packed array of 32-bit token codes: the value of the hash of hashed tokens, and
+  LITERAL_MARK followed by the literal_code of tokens that are kept as they are
+
+  :param hashed_content: space separated hashes of a message
+  :return: array('I') of token codes
+  """
+
+  codes = array('I')
+  for repl in hashed_content.split():
+    if is_literal(repl):
+      codes.append(LITERAL_MARK)
+      codes.append(literal_code(repl))
+    else:
+      code = int(repl, 16)
+      if code == LITERAL_MARK:
+        codes.append(LITERAL_MARK)
+      codes.append(code)
+  return codes
+
+
+
+def split_codes(codes):
+  """
+  split_codes decodes packed token codes written by pack_hashed_content to one code per token
+
+  :param codes: array('I') or NumPy array of packed token codes
+  :return: NumPy array of codes, and NumPy boolean array that is True for the tokens kept as they are
+  """
+
+  codes = np.asarray(codes, dtype = np.uint32)
+  keep = np.ones(len(codes), dtype = bool)
+  literals = np.zeros(len(codes), dtype = bool)
+  # Marks are only found before tokens kept as they are (and hashes equal to the mark), the other codes are kept as they are
+  end = 0
+  for pos in np.flatnonzero(codes == LITERAL_MARK).tolist():
+    if pos < end:
+      continue
+    if pos + 1 == len(codes):
+      raise ValueError('Packed token codes end with a literal mark')
+    keep[pos] = False
+    literals[pos + 1] = codes[pos + 1] != LITERAL_MARK
+    end = pos + 2
+  return codes[keep], literals[keep]
+
+
+
+def codes_to_text(codes):
+  """
+  codes_to_text encodes a packed array of token codes as a base64 string (little-endian), the form stored in JSON output
+
+  :param codes: array('I') or NumPy array of token codes
+  :return: base64 string
+  """
+
+  return base64.b64encode(np.asarray(codes, dtype = '<u4').tobytes()).decode('ascii')
+
+
+
+def text_to_codes(text):
+  """
+  text_to_codes decodes a base64 string written by codes_to_text
+
+  :param text: base64 string
+  :return: NumPy array of token codes
+  """
+
+  return np.frombuffer(base64.b64decode(text), dtype = '<u4')
+
+
+
+class VocabularyWriter:
+  """
+  VocabularyWriter collects the tokens of a run by 32-bit code, hashed tokens and tokens kept as they are in two separate tables, and
+  writes them to a vocabulary file, reporting tokens of different text that share a code (hash prefix collisions, the first token in
+  utf-8 order keeps the code)
+
+  At most spill_size tokens are held in memory: they are written to runs sorted by table and code (one "table code<TAB>token" line per
+  token, the table as "h" or "l" and the code as 8 hexadecimal digits), which are merged into the vocabulary file record by record.
+
+  :param path: path of the vocabulary file
+  :param run_dir: directory of the run files (removed once the vocabulary file is written)
+  :param spill_size: number of tokens held before they are written to a run
+  """
+
+  def __init__(self, path, run_dir, spill_size = DEFAULT_SPILL_SIZE):
+    self.path = path
+    self.run_dir = run_dir
+    self.spill_size = spill_size
+    self.buffer = set()
+    self.paths = []
+    # List of (hash, token, other token with the same hash)
+    self.collisions = []
+    # Runs of an interrupted run are dropped, their tokens are added again
+    shutil.rmtree(run_dir, ignore_errors = True)
+
+  def _add(self, table, code, token):
+    self.buffer.add(('{}{:08x}'.format(table, code).encode('ascii'), token.encode('utf-8')))
+    if len(self.buffer) >= self.spill_size:
+      self.spill()
+
+  def add_hashes(self, hash_dict):
+    """
+    add_hashes adds the tokens of a hash dictionary (e.g. a chunk of the merged hash dictionary)
+
+    :param hash_dict: dictionary of tokens and hashes
+    """
+
+    for word, repl in hash_dict.items():
+      self._add('h', int(repl, 16), word)
+
+  def add_literals(self, literals):
+    """
+    add_literals adds tokens of "hashed content" that are kept as they are
+
+    :param literals: iterable of tokens
+    """
+
+    for repl in literals:
+      if is_literal(repl):
+        self._add('l', literal_code(repl), repl)
+
+  def add_file(self, path):
+    """
+    add_file adds the tokens of a vocabulary file (e.g. of the previous incremental run, or of a shard)
+
+    :param path: path of the vocabulary file
+    """
+
+    with VocabularyFile(path) as vocab_file:
+      for token_id, code in enumerate(vocab_file.codes.tolist()):
+        self._add('h', code, vocab_file.token(token_id))
+      for token_id, code in enumerate(vocab_file.literal_codes.tolist(), len(vocab_file.codes)):
+        self._add('l', code, vocab_file.token(token_id))
+
+  def spill(self):
+    """
+    spill writes the tokens held in memory to a new run sorted by table and code
+    """
+
+    if not self.buffer:
+      return
+    os.makedirs(self.run_dir, exist_ok = True)
+    path = new_run_path(self.run_dir, 'vocab', len(self.paths))
+    write_run(path, sorted(self.buffer))
+    self.buffer = set()
+    self.paths.append(path)
+
+  def close(self):
+    """
+    close merges the tokens by table and code and writes the vocabulary file
+
+    :return: number of tokens in the vocabulary
+    """
+
+    if self.paths:
+      self.spill()
+      items = iter_merged(merge_runs(self.paths, self.run_dir, unique = False), unique = False)
+    else:
+      items = iter(sorted(self.buffer))
+    num_entries = write_vocab_file(self.path, self._iter_entries(items))
+    self.buffer = set()
+    shutil.rmtree(self.run_dir, ignore_errors = True)
+    return num_entries
+
+  def _iter_entries(self, items):
+    prev_key = prev_token = None
+    for key, token in items:
+      if key == prev_key:
+        self.collisions.append((key[1:].decode('ascii'), prev_token.decode('utf-8'), token.decode('utf-8')))
+        continue
+      prev_key, prev_token = key, token
+      yield key[:1] == b'l', int(key[1:], 16), token
+
+  def print_collisions(self):
+    for repl, token, other_token in self.collisions:
+      print('Hash collision: {} and {} both hash to {}'.format(repr(token), repr(other_token), repl))
+
+
+
+class _TableParts:
+  """
+  _TableParts holds the codes, token offsets and tokens of one table of a vocabulary file in temporary files while it is written
+  """
+
+  def __init__(self, tmp_path):
+    self.paths = [tmp_path + suffix for suffix in ['.codes', '.offsets', '.tokens']]
+    self.files = [open(path, 'w+b') for path in self.paths]
+    self.files[1].write(struct.pack('<Q', 0))
+    self.count = 0
+    self.offset = 0
+
+  def add(self, code, token):
+    codes_f, offsets_f, tokens_f = self.files
+    codes_f.write(struct.pack('<I', code))
+    tokens_f.write(token)
+    self.offset += len(token)
+    offsets_f.write(struct.pack('<Q', self.offset))
+    self.count += 1
+
+  def copy_to(self, f):
+    # Codes and offsets start at multiples of 8 bytes
+    for part_f in self.files:
+      f.write(b'\0' * (-f.tell() % 8))
+      part_f.seek(0)
+      shutil.copyfileobj(part_f, f)
+
+  def close(self):
+    for part_f, path in zip(self.files, self.paths):
+      part_f.close()
+      os.remove(path)
+
+
+
+def write_vocab_file(path, entries):
+  """
+  write_vocab_file writes a memory-mappable vocabulary file record by record: a header, then the table of hashed tokens and the table of
+  tokens kept as they are, each made of the sorted 32-bit codes, the offsets of the tokens and the utf-8 tokens
+
+  Tables go to temporary files that are appended once every entry is written.
+
+  :param path: path of the vocabulary file
+  :param entries: iterable of (whether the token is kept as it is, code, utf-8 token), hashed tokens first, sorted by code, every code
+                  of a table once
+  :return: number of entries
+  """
+
+  tmp_path = path + '.tmp'
+  tables = [_TableParts(tmp_path + '.hashes'), _TableParts(tmp_path + '.literals')]
+  try:
+    for literal, code, token in entries:
+      tables[literal].add(code, token)
+    with open(tmp_path, 'wb') as f:
+      f.write(VOCAB_MAGIC)
+      f.write(struct.pack('<QQ', tables[0].count, tables[1].count))
+      for table in tables:
+        table.copy_to(f)
+  finally:
+    for table in tables:
+      table.close()
+  os.replace(tmp_path, path)
+  return tables[0].count + tables[1].count
+
+
+
+class VocabularyFile:
+  """
+  VocabularyFile memory-maps a vocabulary file written by VocabularyWriter, so only the parts that are looked up are read from disk
+
+  Dense ids are the positions of the codes in sorted order, hashed tokens first and then tokens kept as they are, so they do not depend
+  on the order tokens were processed in.
+
+  :param path: path of the vocabulary file
+  """
+
+  def __init__(self, path):
+    self._f = open(path, 'rb')
+    self._mm = mmap.mmap(self._f.fileno(), 0, access = mmap.ACCESS_READ)
+    if self._mm[:len(VOCAB_MAGIC)] != VOCAB_MAGIC:
+      raise ValueError(path + ' is not a vocabulary file')
+    num_hashes, num_literals = struct.unpack_from('<QQ', self._mm, len(VOCAB_MAGIC))
+    pos = len(VOCAB_MAGIC) + 16
+    self.codes, self.offsets, self._tokens_pos, pos = self._table(pos, num_hashes)
+    self.literal_codes, self.literal_offsets, self._literal_tokens_pos, _ = self._table(pos, num_literals)
+
+  def _table(self, pos, num_entries):
+    codes = np.frombuffer(self._mm, dtype = '<u4', count = num_entries, offset = pos)
+    pos += 4 * num_entries
+    pos += -pos % 8
+    offsets = np.frombuffer(self._mm, dtype = '<u8', count = num_entries + 1, offset = pos)
+    tokens_pos = pos + 8 * (num_entries + 1)
+    pos = tokens_pos + int(offsets[-1])
+    return codes, offsets, tokens_pos, pos + (-pos % 8)
+
+  def __len__(self):
+    return len(self.codes) + len(self.literal_codes)
+
+  def close(self):
+    self.codes = self.offsets = self.literal_codes = self.literal_offsets = None
+    self._mm.close()
+    self._f.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def ids(self, codes):
+    """
+    ids converts packed token codes to dense ids
+
+    :param codes: array of packed token codes (see pack_hashed_content)
+    :return: NumPy array of ids, one per token (-1 for tokens that are not in the vocabulary)
+    """
+
+    codes, literals = split_codes(codes)
+    ids = np.full(len(codes), -1, dtype = np.int64)
+    for table_codes, mask, first_id in [(self.codes, ~literals, 0), (self.literal_codes, literals, len(self.codes))]:
+      found = np.searchsorted(table_codes, codes[mask])
+      match = found < len(table_codes)
+      match[match] = table_codes[found[match]] == codes[mask][match]
+      ids[mask] = np.where(match, found + first_id, -1)
+    return ids
+
+  def token(self, token_id):
+    """
+    token returns the original token of a dense id (the token itself for tokens that are not hashed)
+
+    :param token_id: dense id
+    :return: token
+    """
+
+    if not 0 <= token_id < len(self):
+      raise IndexError('token id {} is not in the vocabulary of {} tokens'.format(token_id, len(self)))
+    if token_id < len(self.codes):
+      offsets, tokens_pos = self.offsets, self._tokens_pos
+    else:
+      token_id -= len(self.codes)
+      offsets, tokens_pos = self.literal_offsets, self._literal_tokens_pos
+    start = tokens_pos + int(offsets[token_id])
+    end = tokens_pos + int(offsets[token_id + 1])
+    return self._mm[start:end].decode('utf-8')
+
+  def render(self, ids):
+    """
+    render returns the "hashed content" string of dense ids, as written by process_batch
+
+    :param ids: array of dense ids
+    :return: space separated hashes
+    """
+
+    ids = np.asarray(ids, dtype = np.int64)
+    if len(ids) and (ids.min() < 0 or ids.max() >= len(self)):
+      raise IndexError('token ids must be between 0 and {}'.format(len(self) - 1))
+    num_hashes = len(self.codes)
+    return ' '.join('{:08x}'.format(self.codes[i]) if i < num_hashes else self.token(i) for i in ids.tolist())
+
+  def render_codes(self, codes):
+    """
+    render_codes returns the "hashed content" string of packed token codes (hashes are rendered without a lookup, so codes that are
+    not in the vocabulary still render unless they belong to tokens that are not hashed)
+
+    :param codes: array of packed token codes
+    :return: space separated hashes
+    """
+
+    ids = self.ids(codes).tolist()
+    codes, literals = split_codes(codes)
+    out = []
+    for token_id, code, literal in zip(ids, codes.tolist(), literals.tolist()):
+      if not literal:
+        out.append('{:08x}'.format(code))
+      elif token_id < 0:
+        raise KeyError('literal token code {:08x} is not in the vocabulary'.format(code))
+      else:
+        out.append(self.token(token_id))
+    return ' '.join(out)
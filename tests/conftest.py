@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import pytest
+
+# Modules of the pipeline are imported by name from the code directory, like run.py does
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'code')
+sys.path.insert(0, os.path.abspath(CODE_DIR))
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+
+@pytest.fixture
+def liwc_csv():
+  """
+  Path of a tiny LIWC dictionary in the liwc2007dictionary_poster.csv format
+  """
+
+  return os.path.join(DATA_DIR, 'liwc_fixture.csv')
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import os
+import pytest
+import hashing
+from checkpoint import Journal, load_journal, CHECKPOINTS_DIR
+from hashmerge import HashRunWriter
+
+utils = pytest.importorskip('utils')
+benchmark = pytest.importorskip('benchmark')
+
+
+
+def day_entry(channel_name, day):
+  return {'channel': channel_name, 'day': day, 'size': 10, 'mtime': 1.0, 'md5': None, 'msgs_not_processed': [], 'threads': []}
+
+
+
+def test_journal(tmp_path):
+  checkpoint_dir = str(tmp_path / 'checkpoints')
+  os.makedirs(checkpoint_dir)
+  hash_runs = HashRunWriter(str(tmp_path / 'runs'), spill_size = 1000)
+  literals = {'NUM'}
+  journal = Journal(checkpoint_dir, hash_runs, literals, every = 2)
+  # Output day files are flushed to disk by every checkpoint
+  for num in range(1, 4):
+    (tmp_path / 'out{}.json'.format(num)).write_text('[]')
+
+  hash_runs.add({'hello': '5d41402a'})
+  journal.add(day_entry('general', '2021-11-01.json'), str(tmp_path / 'out1.json'))
+  assert load_journal(checkpoint_dir) == ({}, set())
+  literals.add('SENT_END')
+  journal.add(day_entry('general', '2021-11-02.json'), str(tmp_path / 'out2.json'))
+  # Every checkpoint spills the tokens of its day files to a run
+  assert len(hash_runs.paths) == 1
+  completed, journaled_literals = load_journal(checkpoint_dir)
+  assert sorted(completed) == [('general', '2021-11-01.json'), ('general', '2021-11-02.json')]
+  assert journaled_literals == {'NUM', 'SENT_END'}
+
+  literals.add('LINK')
+  journal.add(day_entry('random', '2021-11-01.json'), str(tmp_path / 'out3.json'))
+  journal.checkpoint()
+  completed, journaled_literals = load_journal(checkpoint_dir)
+  assert len(completed) == 3 and journaled_literals == {'NUM', 'SENT_END', 'LINK'}
+  assert completed[('random', '2021-11-01.json')] == day_entry('random', '2021-11-01.json')
+
+  # A line cut short by an interruption ends the journal of its process
+  with open(journal.path, 'rb') as f:
+    lines = f.readlines()
+  with open(journal.path, 'wb') as f:
+    f.writelines(lines[:1] + [lines[1][:len(lines[1]) // 2]] + lines[2:])
+  assert sorted(load_journal(checkpoint_dir)[0]) == [('general', '2021-11-01.json')]
+
+
+
+def output_files(output_dir):
+  files = {}
+  for root, _, fns in os.walk(output_dir):
+    for fn in fns:
+      with open(os.path.join(root, fn), 'rb') as f:
+        files[os.path.relpath(os.path.join(root, fn), output_dir)] = f.read()
+  return files
+
+
+
+def run_workspace(export_dir, liwc_fn, **kwargs):
+  # Every run starts from the state of a new process
+  hashing._token_hash_cache = None
+  utils.literal_tokens.clear()
+  utils._reported_literals.clear()
+  utils.process_workspace(path_liwc_dict = liwc_fn, channels_dir = export_dir, list_rem_gen = benchmark.LIST_REM_GEN,
+                          list_rem_thread = benchmark.LIST_REM_THREAD, list_rem_blk = benchmark.LIST_REM_BLK, print_cond = False,
+                          seed_val = 'seed', parallel = False, checkpoint_every = 1, **kwargs)
+
+
+
+def test_resume_after_truncated_journal(tmp_path, monkeypatch, capsys):
+  export_dir = str(tmp_path / 'export')
+  output_dir = str(tmp_path / 'slack_output')
+  liwc_fn = benchmark.make_export(export_dir, num_channels = 2, num_days = 3, msgs_per_day = 20, words_per_msg = 10)
+  monkeypatch.chdir(export_dir)
+  run_workspace(export_dir, liwc_fn)
+  expected = output_files(output_dir)
+
+  # Interrupted while writing the fifth day file (the first four are journaled), then the last journal line is cut short
+  write_output_day = utils.write_output_day
+  num_written = []
+  def interrupted_write(*args, **kwargs):
+    if len(num_written) == 4:
+      raise KeyboardInterrupt
+    num_written.append(1)
+    return write_output_day(*args, **kwargs)
+  monkeypatch.setattr(utils, 'write_output_day', interrupted_write)
+  with pytest.raises(KeyboardInterrupt):
+    run_workspace(export_dir, liwc_fn)
+  monkeypatch.setattr(utils, 'write_output_day', write_output_day)
+  checkpoint_dir = os.path.join(output_dir, CHECKPOINTS_DIR)
+  journal_path, = [os.path.join(checkpoint_dir, fn) for fn in os.listdir(checkpoint_dir) if fn.endswith('.jsonl')]
+  with open(journal_path, 'rb') as f:
+    lines = f.readlines()
+  assert len(lines) == 4
+  with open(journal_path, 'wb') as f:
+    f.writelines(lines[:-1] + [lines[-1][:len(lines[-1]) // 2]])
+  assert len(load_journal(checkpoint_dir)[0]) == 3
+  assert not os.path.exists(os.path.join(output_dir, 'hash_dict.json'))
+
+  capsys.readouterr()
+  run_workspace(export_dir, liwc_fn, resume = True)
+  assert 'Resumed run: 3 of 6 day files already processed' in capsys.readouterr().out
+  assert not os.path.exists(checkpoint_dir)
+  assert output_files(output_dir) == expected
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import os
+from hashing import TokenHashCache, HashCacheWriter, hash_token
+
+
+
+def test_cache_file(tmp_path):
+  path = os.path.join(str(tmp_path), 'hash_cache.bin')
+  hashes = {word: hash_token(word, 'seed') for word in ['apple', 'mango', 'pear', 'zébra']}
+  with HashCacheWriter(path, 'seed', max_size = 3) as cache_writer:
+    cache_writer.write(dict(list(hashes.items())[:2]))
+    cache_writer.write(dict(list(hashes.items())[2:]))
+  # Tokens beyond max_size are dropped in the order they come, not by use
+  assert cache_writer.count == 3
+  assert cache_writer.dropped == 1
+
+  cache = TokenHashCache('seed')
+  assert cache.load(path) == 3
+  assert cache.get('pear') == hashes['pear']
+  assert cache.stats() == {'hits': 1, 'misses': 0}
+  # Hashes of another seed value are ignored
+  assert TokenHashCache('other').load(path) == 0
+
+  cache.get('zébra')
+  cache.save(path)
+  reloaded = TokenHashCache('seed')
+  assert reloaded.load(path) == 4
+  assert [reloaded.get(word) for word in hashes] == list(hashes.values())
+  assert reloaded.stats() == {'hits': 4, 'misses': 0}
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import json
+import pytest
+from jsonio import iter_json_array, iter_json_object, iter_day_file, read_day_file, write_day_file
+
+
+
+# Items cut at every position by small chunks: numbers that continue in the next chunk, strings with brackets, commas and escapes
+ITEMS = [{'ts': '1637696571.000200', 'text': 'quote " ] , } { [ backslash \\ done', 'blocks': [{'elements': [1, 2.5, -0.25e10]}]},
+         1.5, -12, 1e16, 'café 🎉', True, False, None, [], {}, [[[]]], {'a': {'b': [None]}}, 123456789]
+
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 1 << 16])
+@pytest.mark.parametrize('indent', [None, 4])
+def test_iter_json_array(chunk_size, indent):
+  text = json.dumps(ITEMS, ensure_ascii = False, indent = indent)
+  assert list(iter_json_array(io.StringIO(text), chunk_size)) == ITEMS
+  assert list(iter_json_array(io.StringIO(' \n' + text + '\n '), chunk_size)) == ITEMS
+  for empty in ['[]', ' [ \n ] ']:
+    assert list(iter_json_array(io.StringIO(empty), chunk_size)) == []
+
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1 << 16])
+def test_iter_json_object(chunk_size):
+  obj = {'hello': '5d41402a', 'key: with "colon"': [1, 2.5], 'café': {'nested': {'a': None}}, '': 10, 'last': 1.25}
+  for indent in [None, 4]:
+    text = json.dumps(obj, ensure_ascii = False, indent = indent)
+    assert list(iter_json_object(io.StringIO(text), chunk_size)) == list(obj.items())
+  assert list(iter_json_object(io.StringIO(' { } '), chunk_size)) == []
+
+
+
+@pytest.mark.parametrize('text', ['{"a": 1}', '[1 2]', '[1, 2', '[1, 2,', '[{"a": 1}', '[1.5e]', ''])
+def test_iter_json_array_errors(text):
+  with pytest.raises(ValueError):
+    list(iter_json_array(io.StringIO(text), 2))
+
+
+
+@pytest.mark.parametrize('text', ['[1]', '{"a" 1}', '{"a": 1 "b": 2}', '{1: 2}', '{"a": 1', '{"a": '])
+def test_iter_json_object_errors(text):
+  with pytest.raises(ValueError):
+    list(iter_json_object(io.StringIO(text), 2))
+
+
+
+@pytest.mark.parametrize('output_format', ['json', 'compact', 'jsonl'])
+def test_day_file_round_trip(tmp_path, output_format):
+  msgs = [item for item in ITEMS if isinstance(item, dict) and item]
+  path = os.path.join(str(tmp_path), '2021-11-01.' + ('jsonl' if output_format == 'jsonl' else 'json'))
+  write_day_file(path, iter(msgs), output_format)
+  assert list(iter_day_file(path)) == msgs
+  assert read_day_file(path) == msgs
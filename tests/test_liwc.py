@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import pytest
+from liwc import LiwcEngine, read_liwc_csv
+
+
+
+CATEGORIES = ['funct', 'pronoun', 'posemo', 'negemo', 'work', 'achieve']
+
+
+
+def counts(**cats):
+  return [cats.get(cat, 0) for cat in CATEGORIES]
+
+
+
+def test_read_liwc_csv(liwc_csv):
+  categories, words, prefixes = read_liwc_csv(liwc_csv)
+  assert categories == CATEGORIES
+  assert sorted(words['i']) == ['funct', 'pronoun']
+  assert prefixes == {'happ': ['posemo'], 'hurt': ['negemo'], 'anger': ['negemo'], 'work': ['work'], 'worke': ['achieve'],
+                      'succe': ['achieve']}
+
+
+
+@pytest.mark.parametrize('word, cats', [
+  ('i', ['funct', 'pronoun']),
+  ('love', ['posemo']),
+  # Wildcard prefixes, the prefix alone matches too
+  ('happy', ['posemo']),
+  ('happiness', ['posemo']),
+  ('hurting', ['negemo']),
+  ('work', ['work']),
+  ('working', ['work']),
+  # "worke.*" is longer than "work.*", only the longest prefix counts
+  ('worker', ['achieve']),
+  ('workers', ['achieve']),
+  ('success', ['achieve']),
+  # Out of vocabulary
+  ('wor', []),
+  ('xyz', []),
+  ('', []),
+])
+def test_word_categories(liwc_csv, word, cats):
+  engine = LiwcEngine.from_csv(liwc_csv)
+  assert [engine.categories[i] for i in engine.word_ids(word)] == cats
+
+
+
+def test_score_tokens(liwc_csv):
+  engine = LiwcEngine.from_csv(liwc_csv)
+  scores = engine.score_tokens(['i', 'love', 'working', 'worker', 'xyz', 'happy', 'i'])
+  assert scores.dtype == np.int32
+  assert scores.tolist() == counts(funct = 2, pronoun = 2, posemo = 2, work = 1, achieve = 1)
+  assert engine.score_tokens([]).tolist() == counts()
+  assert engine.score_tokens(['xyz', 'wor']).tolist() == counts()
+
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_score_batch(liwc_csv, sparse):
+  if sparse:
+    pytest.importorskip('scipy')
+  engine = LiwcEngine.from_csv(liwc_csv)
+  token_lists = [['i', 'love', 'working', 'worker', 'xyz', 'happy', 'i'], [], ['xyz'], ['hurting', 'hate', 'boss', 'workers']]
+  scores = engine.score_batch(token_lists, sparse = sparse)
+  scores = scores.toarray() if sparse else scores
+  assert scores.shape == (4, len(CATEGORIES))
+  assert scores.tolist() == [counts(funct = 2, pronoun = 2, posemo = 2, work = 1, achieve = 1), counts(), counts(),
+                             counts(negemo = 2, work = 1, achieve = 1)]
+  # Every row is scored like the tokens of the message alone
+  for row, tokens in enumerate(token_lists):
+    assert scores[row].tolist() == engine.score_tokens(tokens).tolist()
+
+
+
+def test_counts_to_dict(liwc_csv):
+  engine = LiwcEngine.from_csv(liwc_csv)
+  scores = engine.score_tokens(['work', 'hate', 'i', 'hurt', 'anger', 'job'])
+  # Sorted by count, equal counts in dictionary order
+  assert list(engine.counts_to_dict(scores).items()) == [('negemo', 3), ('work', 2), ('funct', 1), ('pronoun', 1)]
+  assert engine.counts_to_dict(engine.score_tokens(['xyz'])) == {}
+
+
+
+def test_stem_mode_matches_legacy(liwc_csv):
+  utils = pytest.importorskip('utils')
+  utils.read_liwc_dictionary(liwc_csv, prefix_match = 'stem')
+  engine = utils.liwc_engine
+  assert engine.prefix_match == 'stem'
+  words = ['i', 'we', 'love', 'happy', 'happ', 'happiness', 'hurt', 'hurting', 'hurts', 'angers', 'anger', 'work', 'working', 'worker',
+           'workers', 'success', 'succeed', 'boss', 'xyz', 'wor', '']
+  for word in words:
+    assert sorted(engine.categories[i] for i in engine.word_ids(word)) == sorted(utils.get_categories_from_word(word)), word
+  tokens = words + ['i', 'work', 'xyz']
+  assert engine.counts_to_dict(engine.score_tokens(tokens)) == utils.liwc_cats_to_dict(utils.word_to_liwc_cats(tokens))
+
+
+
+def test_index_keyed_on_contents_and_prefix_match(liwc_csv, tmp_path):
+  utils = pytest.importorskip('utils')
+  csv_path = tmp_path / 'liwc.csv'
+  csv_path.write_bytes(open(liwc_csv, 'rb').read())
+  index_path = str(tmp_path / 'liwc_index.bin')
+
+  utils.read_liwc_dictionary(str(csv_path), 'trie', index_path)
+  assert utils.liwc_engine.word_ids('worker') == (5,)
+  built = os.path.getmtime(index_path)
+  # Same contents and prefix match: the index is reused (attached as a tables file)
+  utils.read_liwc_dictionary(str(csv_path), 'trie', index_path)
+  assert os.path.getmtime(index_path) == built
+  assert utils.liwc_engine.tables.path == index_path
+  assert utils.liwc_engine.word_ids('worker') == (5,)
+  # The tables written for the workers of a run from the attached index give the same engine
+  tables_path = str(tmp_path / 'liwc_tables.bin')
+  utils.liwc_engine.save_tables(tables_path)
+  tokens = ['i', 'love', 'working', 'worker', 'boss', 'xyz']
+  assert LiwcEngine.attach(tables_path).score_tokens(tokens).tolist() == LiwcEngine.from_csv(str(csv_path)).score_tokens(tokens).tolist()
+
+  # Other prefix match: rebuilt (stem mode matches "worker" by its stem "worker", not by the prefix "worke")
+  utils.read_liwc_dictionary(str(csv_path), 'stem', index_path)
+  assert utils.liwc_engine.prefix_match == 'stem'
+  assert utils.liwc_engine.word_ids('worker') == ()
+
+  # Changed contents with an older modification time than the index (e.g. a checked out file): rebuilt
+  utils.read_liwc_dictionary(str(csv_path), 'trie', index_path)
+  csv_path.write_text(csv_path.read_text().replace('boss', 'manager'))
+  os.utime(str(csv_path), (built - 100, built - 100))
+  utils.read_liwc_dictionary(str(csv_path), 'trie', index_path)
+  assert utils.liwc_engine.word_ids('manager') == (4,)
+  assert utils.liwc_engine.word_ids('boss') == ()
+
+  # A file that is not a tables file (e.g. an index of an older version): rebuilt
+  with open(index_path, 'wb') as f:
+    f.write(b'not an index')
+  utils.read_liwc_dictionary(str(csv_path), 'trie', index_path)
+  assert utils.liwc_engine.word_ids('manager') == (4,)
+  assert LiwcEngine.attach(index_path).word_ids('manager') == (4,)
+
+
+
+def test_legacy_lookups_built_on_first_use(liwc_csv):
+  utils = pytest.importorskip('utils')
+  utils.read_liwc_dictionary(liwc_csv, 'trie')
+  assert not utils.words2categories and not utils.prefixes2categories
+  assert sorted(utils.get_categories_from_word('i')) == ['funct', 'pronoun']
+  assert utils.prefixes2categories['happ'] == ['posemo']
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from normalizer import normalize_text, combine_contents
+
+
+
+# Cleaned element contents and the content of the message, as combined by the original element-by-element collapse
+COMBINED = [
+  ([], ''),
+  ([''], ''),
+  (['hello  NUM NUM world', 'SENT_END   SENT_END', 'blushEMOJI'], 'hello NUM world SENT_END blushEMOJI'),
+  (['@U1USERID', 'NUM', 'NUM', 'LINK'], '@U1USERID NUM LINK'),
+  # Ordinal suffixes within an element and across elements
+  (['meet on the NUM th', 'at NUM SENT_END'], 'meet on the NUM at NUM SENT_END'),
+  (['the NUM', 'th floor'], 'the NUM floor'),
+  # Suffixes left by the collapse of an element are only dropped once the next element is appended
+  (['NUM th th', 'x'], 'NUM x'),
+  (['see you', 'NUM st', 'st time', 'NUM nd nd SENT_END'], 'see you NUM time NUM nd SENT_END'),
+]
+
+
+
+@pytest.mark.parametrize('contents, expected', COMBINED)
+def test_combine_contents(contents, expected):
+  assert combine_contents(contents) == expected
+
+
+
+def test_normalize_and_combine():
+  text = "We can't meet on the 21st... ok"
+  assert normalize_text(text) == 'we cannot meet on the NUM st SENT_END ok'
+  assert combine_contents([normalize_text(text), 'LINK']) == 'we cannot meet on the NUM SENT_END ok LINK'
+
+  text = "It's the 3rd time, e.g. at 10:30!! Café vs. thé?"
+  assert normalize_text(text) == 'it is the NUM rd time example SENT_END at NUM NUM SENT_END cafe versus SENT_END the SENT_END '
+  assert combine_contents([normalize_text(text)]) == 'it is the NUM rd time example SENT_END at NUM SENT_END cafe versus SENT_END the SENT_END'
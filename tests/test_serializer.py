@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import pytest
+from serializer import JsonBackend, available_backends
+
+
+
+# A processed message, with non-ASCII text, escapes and nested values
+MESSAGE = {
+  'client_msg_id': '3c1f2a9e-1b2c-4d5e-8f90-1234567890ab',
+  'user': 'U02MZ6P1EF9',
+  'ts': '2021-11-23 19:42:51',
+  'channel name': 'général',
+  'hashed content': '1a2b3c4d SENT_END',
+  'LIWC dict': {'funct': 2, 'posemo': 0},
+  'extra': ['http://example.com/a?b=c', 'quote " backslash \\ tab \t newline \n', 'emoji 🎉 ünïcödé', '\u0001'],
+  'replies': [{'user': 'U1', 'ts': '1637696571.000200'}],
+  'num': -42,
+  'score': 0.125,
+  'pinned': True,
+  'edited': False,
+  'parent': None,
+  'empty': {},
+  'none': [],
+}
+
+
+
+@pytest.mark.parametrize('name', available_backends())
+def test_round_trip(name):
+  backend = JsonBackend(name)
+  for pretty in [False, True]:
+    data = backend.dumps(MESSAGE, pretty)
+    assert isinstance(data, bytes)
+    assert backend.loads(data) == MESSAGE
+    assert backend.loads(data.decode('utf-8')) == MESSAGE
+
+  f = io.BytesIO()
+  backend.dump(MESSAGE, f)
+  f.seek(0)
+  assert backend.load(f) == MESSAGE
+
+
+
+@pytest.mark.parametrize('name', available_backends())
+def test_compact_output(name):
+  expected = json.dumps(MESSAGE, ensure_ascii = False, separators = (',', ':')).encode('utf-8')
+  assert JsonBackend(name).dumps(MESSAGE) == expected
+
+
+
+@pytest.mark.parametrize('name', available_backends())
+def test_pretty_output(name):
+  expected = json.dumps(MESSAGE, ensure_ascii = False, indent = 4).encode('utf-8')
+  assert JsonBackend(name).dumps(MESSAGE, pretty = True) == expected
+
+
+
+def test_unknown_backend():
+  with pytest.raises(ValueError):
+    JsonBackend('simplejson')
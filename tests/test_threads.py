@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+from threads import DayThreads, ThreadIndex, iter_threads, THREADS_DIR
+from batch import process_batch
+from liwc import LiwcEngine
+
+
+
+def message(ts, thread_ts = None, text = ''):
+  msg_json = {'ts': ts, 'text': text}
+  if thread_ts is not None:
+    msg_json['thread_ts'] = thread_ts
+  return msg_json
+
+
+
+def test_day_threads_positions():
+  day_threads = DayThreads()
+  day_threads.add([message('1.0'), message('2.0', '2.0'), message('3.0', '2.0')])
+  # Positions continue across batches
+  day_threads.add([message('4.0', '0.5'), message('5.0')])
+  assert day_threads.num_msgs == 5
+  assert day_threads.entries == [(1, '2.0', True), (2, '2.0', False), (3, '0.5', False)]
+
+
+
+def test_index_round_trip(tmp_path):
+  output_dir = str(tmp_path)
+  index = ThreadIndex('general')
+  index.set_day('2021-11-02.json', [(0, '2.0', False), (1, '5.0', True), (3, '5.0', False)])
+  index.set_day('2021-11-01.json', [(2, '2.0', True), (4, '2.0', False)])
+  # Thread whose parent is not in the export
+  index.set_day('2021-11-03.json', [(0, '0.5', False)])
+
+  days, threads = index.threads()
+  assert days == ['2021-11-01.json', '2021-11-02.json', '2021-11-03.json']
+  # Threads are ordered by their first message, replies are in day order
+  assert list(threads.items()) == [('2.0', [(0, 2), [(0, 4), (1, 0)]]), ('5.0', [(1, 1), [(1, 3)]]), ('0.5', [None, [(2, 0)]])]
+
+  path = index.save(output_dir)
+  assert path == os.path.join(output_dir, THREADS_DIR, 'general.json')
+  with open(path, 'r', encoding = 'utf-8') as f:
+    assert json.load(f)['threads']['0.5'] == {'parent': None, 'replies': [[2, 0]]}
+  loaded = ThreadIndex.from_file(output_dir, 'general')
+  assert loaded.days == {day: sorted(entries) for day, entries in index.days.items()}
+  assert loaded.threads() == (days, threads)
+
+  # Day files processed again replace their entries
+  loaded.set_day('2021-11-02.json', [])
+  loaded.remove_day('2021-11-03.json')
+  assert list(loaded.threads()[1].items()) == [('2.0', [(0, 2), [(0, 4)]])]
+  assert ThreadIndex.from_file(output_dir, 'other').days == {}
+
+
+
+def test_iter_threads(tmp_path):
+  output_dir = str(tmp_path)
+  days = {'2021-11-01.json': [message('1.0'), message('2.0', '2.0', 'parent'), message('3.0', '2.0', 'reply 1')],
+          '2021-11-02.json': [message('4.0', '2.0', 'reply 2'), message('5.0', '0.5', 'orphan')]}
+  os.makedirs(os.path.join(output_dir, 'general'))
+  index = ThreadIndex('general')
+  for day, msgs in days.items():
+    with open(os.path.join(output_dir, 'general', day), 'w', encoding = 'utf-8') as f:
+      json.dump(msgs, f)
+    day_threads = DayThreads()
+    day_threads.add(msgs)
+    index.set_day(day, day_threads.entries)
+  index.save(output_dir)
+
+  threads = list(iter_threads(output_dir, 'general', max_cached_days = 1))
+  assert [thread['thread_ts'] for thread in threads] == ['2.0', '0.5']
+  assert threads[0]['parent']['text'] == 'parent'
+  assert [reply['text'] for reply in threads[0]['replies']] == ['reply 1', 'reply 2']
+  assert threads[1]['parent'] is None
+  assert [reply['text'] for reply in threads[1]['replies']] == ['orphan']
+
+
+
+def test_process_batch_positions(liwc_csv):
+  # Positions are those of the output day file: messages without "client_msg_id" are not written to it
+  msgs = [dict(message('1637712000.000100', '1637712000.000100'), client_msg_id = 'a'), message('1637712001.000100', '1637712000.000100'),
+          dict(message('1637712002.000100', '1637712000.000100'), client_msg_id = 'b', reply_count = 0)]
+  day_threads = DayThreads()
+  msgs_selected, msgs_not_selected, _ = process_batch(msgs, 'general', ['text', 'thread_ts'], ['reply_count'], [], 'seed',
+                                                      LiwcEngine.from_csv(liwc_csv), threads = day_threads)
+  assert len(msgs_selected) == 2 and len(msgs_not_selected) == 1
+  assert all('thread_ts' not in msg_json for msg_json in msgs_selected)
+  assert day_threads.entries == [(0, '1637712000.000100', True), (1, '1637712000.000100', False)]
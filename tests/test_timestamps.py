@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from timestamps import TimestampFormatter
+
+
+
+@pytest.mark.parametrize('day', ['2021-01-05.json', '2021-1-5.json', 'channel/2021-01-5.json'])
+def test_day_fast_path(day):
+  formatter = TimestampFormatter()
+  formatter.set_day(day)
+  assert formatter.day_prefix == '2021-01-05 '
+  # Time stamps of the day and of other days give the same strings as the cached path
+  for ts in ['1609804800.000100', '1609891199.999900', '1609891200.000000', '1609718400.5']:
+    assert formatter.format(ts) == TimestampFormatter().format(ts)
+  assert formatter.format('1609847565.000200') == '2021-01-05 11:52:45'
+
+
+
+def test_day_not_a_date():
+  formatter = TimestampFormatter()
+  formatter.set_day('2021-02-30.json')
+  assert formatter.day_start is None and formatter.day_prefix is None
+  assert formatter.format('1609847565') == '2021-01-05 11:52:45'
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import os
+import pytest
+from hashing import hash_token
+from vocab import (VocabularyWriter, VocabularyFile, LITERAL_MARK, literal_code, pack_hashed_content, split_codes, codes_to_text,
+                   text_to_codes)
+
+
+
+HASHES = {'hello': hash_token('hello', 'seed'), 'world': hash_token('world', 'seed')}
+LITERALS = ['SENT_END', 'NUM', '@U02MZ6P1EF9', 'blush']
+
+
+
+def write_vocab(tmp_path, hashes, literals, spill_size = 1000):
+  path = os.path.join(str(tmp_path), 'vocab.bin')
+  vocab = VocabularyWriter(path, os.path.join(str(tmp_path), 'runs'), spill_size)
+  vocab.add_hashes(hashes)
+  vocab.add_literals(literals)
+  vocab.close()
+  return path, vocab
+
+
+
+def test_pack_hashed_content():
+  hello = int(HASHES['hello'], 16)
+  codes = pack_hashed_content(HASHES['hello'] + ' SENT_END ffffffff NUM')
+  assert codes.itemsize == 4
+  assert codes.tolist() == [hello, LITERAL_MARK, literal_code('SENT_END'), LITERAL_MARK, LITERAL_MARK, LITERAL_MARK, literal_code('NUM')]
+  split, literals = split_codes(codes)
+  assert split.tolist() == [hello, literal_code('SENT_END'), LITERAL_MARK, literal_code('NUM')]
+  assert literals.tolist() == [False, True, False, True]
+  for repl in LITERALS:
+    assert literal_code(repl) < LITERAL_MARK
+  with pytest.raises(ValueError):
+    split_codes(codes[:-1])
+
+
+
+def test_literal_never_shares_a_hash_code(tmp_path):
+  # Tokens kept as they are have their own table, so a hash with the same value as the code of "SENT_END" is not ambiguous
+  repl = '{:08x}'.format(literal_code('SENT_END'))
+  path, vocab = write_vocab(tmp_path, {'other': repl}, ['SENT_END'])
+  assert vocab.collisions == []
+  with VocabularyFile(path) as vocab_file:
+    codes = pack_hashed_content(repl + ' SENT_END')
+    assert vocab_file.render_codes(codes) == repl + ' SENT_END'
+    ids = vocab_file.ids(codes).tolist()
+    assert ids == [0, 1]
+    assert [vocab_file.token(token_id) for token_id in ids] == ['other', 'SENT_END']
+
+
+
+@pytest.mark.parametrize('spill_size', [1000, 2])
+def test_round_trip(tmp_path, spill_size):
+  hashed_content = ' '.join([HASHES['hello'], 'NUM', HASHES['world'], '@U02MZ6P1EF9', 'blush', 'SENT_END', HASHES['hello']])
+  path, _ = write_vocab(tmp_path, HASHES, hashed_content.split() + ['NUM', 'SENT_END'], spill_size)
+  assert not os.path.exists(os.path.join(str(tmp_path), 'runs'))
+
+  codes = text_to_codes(codes_to_text(pack_hashed_content(hashed_content)))
+  assert codes.tolist() == pack_hashed_content(hashed_content).tolist()
+  # 4 bytes per hashed token (8 per token kept as it is) instead of 9 characters
+  sentence = ' '.join([HASHES['hello'], HASHES['world']] * 4 + ['SENT_END'])
+  assert len(codes_to_text(pack_hashed_content(sentence))) < 0.75 * len(sentence)
+  with VocabularyFile(path) as vocab_file:
+    assert len(vocab_file) == 6
+    assert len(vocab_file.codes) == 2
+    assert (vocab_file.literal_codes[1:] > vocab_file.literal_codes[:-1]).all()
+    assert vocab_file.render_codes(codes) == hashed_content
+    ids = vocab_file.ids(codes)
+    assert (ids >= 0).all()
+    assert vocab_file.render(ids) == hashed_content
+
+  # A vocabulary file read back gives the same file
+  copy_path = os.path.join(str(tmp_path), 'copy.bin')
+  copy = VocabularyWriter(copy_path, os.path.join(str(tmp_path), 'runs'), spill_size)
+  copy.add_file(path)
+  copy.close()
+  with open(path, 'rb') as f, open(copy_path, 'rb') as copy_f:
+    assert f.read() == copy_f.read()
+
+
+
+def test_unknown_ids(tmp_path):
+  path, _ = write_vocab(tmp_path, HASHES, ['SENT_END'])
+  with VocabularyFile(path) as vocab_file:
+    for ids in [[0, -1], [3], [0, 1, 2, 3]]:
+      with pytest.raises(IndexError):
+        vocab_file.render(ids)
+    with pytest.raises(IndexError):
+      vocab_file.token(-1)
+    codes = pack_hashed_content('0000abcd NUM')
+    assert vocab_file.ids(codes).tolist() == [-1, -1]
+    # Hashes render without a lookup, tokens kept as they are need one
+    assert vocab_file.render_codes(pack_hashed_content('0000abcd SENT_END')) == '0000abcd SENT_END'
+    with pytest.raises(KeyError):
+      vocab_file.render_codes(codes)
+
+
+
+@pytest.mark.parametrize('spill_size', [1000, 1])
+def test_collisions(tmp_path, spill_size):
+  path = os.path.join(str(tmp_path), 'vocab.bin')
+  vocab = VocabularyWriter(path, os.path.join(str(tmp_path), 'runs'), spill_size)
+  vocab.add_hashes({'zebra': '0000abcd', 'apple': '0000abcd', 'pear': '00001234'})
+  vocab.add_hashes({'mango': '0000abcd', 'pear': '00001234'})
+  assert vocab.close() == 2
+  # The first token in utf-8 order keeps the code
+  assert vocab.collisions == [('0000abcd', 'apple', 'mango'), ('0000abcd', 'apple', 'zebra')]
+  with VocabularyFile(path) as vocab_file:
+    assert vocab_file.codes.tolist() == [0x1234, 0xabcd]
+    assert [vocab_file.token(i) for i in range(2)] == ['pear', 'apple']
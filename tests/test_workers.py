@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import os
+import multiprocessing
+import pytest
+from liwc import LiwcEngine
+
+utils = pytest.importorskip('utils')
+
+
+
+TOKEN_LISTS = [['i', 'love', 'working', 'worker', 'xyz', 'happy', 'i'], [], ['xyz'], ['hurting', 'hate', 'boss', 'workers'],
+               ['we', 'win', 'success', 'job', 'nice', 'angers']]
+
+
+
+def score_in_worker(token_lists):
+  """
+  Scores messages with the LIWC engine of the worker process, set up by init_worker
+  """
+
+  engine = utils.liwc_engine
+  return {'pid': os.getpid(), 'path': engine.tables.path, 'table_sizes': table_sizes(engine),
+          'scores': engine.score_batch(token_lists).tolist(), 'dicts': [engine.counts_to_dict(engine.score_tokens(tokens)) for tokens in token_lists]}
+
+
+
+def table_sizes(engine):
+  return [len(engine.words2ids), len(engine.trie) if engine.trie is not None else len(engine.stems2ids)]
+
+
+
+@pytest.mark.parametrize('prefix_match', ['trie', 'stem'])
+@pytest.mark.parametrize('start_method', ['fork', 'spawn'])
+def test_workers_attach_tables(liwc_csv, tmp_path, start_method, prefix_match):
+  if start_method not in multiprocessing.get_all_start_methods():
+    pytest.skip(start_method + ' is not available on this platform')
+  engine = LiwcEngine.from_csv(liwc_csv, prefix_match)
+  tables_path = os.path.join(str(tmp_path), 'liwc_tables.bin')
+  engine.save_tables(tables_path)
+
+  with multiprocessing.get_context(start_method).Pool(processes = 2, initializer = utils.init_worker, initargs = (tables_path,)) as pool:
+    results = pool.map(score_in_worker, [TOKEN_LISTS[:2], TOKEN_LISTS[2:]])
+
+  expected = engine.score_batch(TOKEN_LISTS).tolist()
+  assert [row for result in results for row in result['scores']] == expected
+  assert [d for result in results for d in result['dicts']] == [engine.counts_to_dict(engine.score_tokens(tokens)) for tokens in TOKEN_LISTS]
+  for result in results:
+    # Workers read the memory-mapped tables written by the parent, not a copy of its engine
+    assert result['pid'] != os.getpid()
+    assert result['path'] == tables_path
+    assert result['table_sizes'] == table_sizes(engine)
+    assert all(size > 1 for size in result['table_sizes'])